@@ -0,0 +1,123 @@
+import copy
+from datetime import datetime, timedelta
+
+from catalog import catalog, muscle_groups
+from workout_log import is_reward
+
+# --- Aggregates Configuration ---
+# How many of the user's most recently logged exercise ids to remember, so the workout
+# generator can avoid repeating them.
+RECENT_EXERCISE_LIMIT = 15
+# Weeks of per-week XP kept for the history summary.
+WEEKLY_HISTORY_LIMIT = 26
+# Bump when fields are added; stored aggregates from an older version are rebuilt from the log.
+AGGREGATES_VERSION = 2
+
+# --- Per-User Workout Aggregates ---
+# Materialized counters stored on each user record under 'aggregates' and updated
+# incrementally on every completion, so reward checks and stats never need to read the
+# user's workout history. `rebuild` recomputes them from the log.
+
+def day_window(now):
+    return now.date().isoformat()
+
+def week_window(now):
+    """Monday (UTC) of the week containing `now`, as an ISO date."""
+    today = now.date()
+    return (today - timedelta(days=today.weekday())).isoformat()
+
+def entry_week(date):
+    return week_window(datetime.fromisoformat(date[:10]))
+
+
+def empty(now):
+    return {"version": AGGREGATES_VERSION, "total_workouts": 0, "muscle_groups": {}, "equipment": {}, "workouts_by_hour": [0] * 24,
+            "week_start": week_window(now), "workouts_this_week": 0, "xp_this_week": 0, "week_day_masks": {},
+            "day": day_window(now), "workouts_today": 0, "recent_exercises": [], "weekly_xp": {}}
+
+def roll_over(agg, now):
+    """Resets the daily and weekly counters once their window has passed. Only ever moves
+    forward, so applying a back-dated completion never wipes the current week."""
+    if agg['week_start'] < week_window(now):
+        agg.update(week_start=week_window(now), workouts_this_week=0, xp_this_week=0, week_day_masks={})
+    if agg['day'] < day_window(now):
+        agg.update(day=day_window(now), workouts_today=0)
+    return agg
+
+def workout_equipment(entry):
+    """The single piece of equipment a workout used, or None if it mixed equipment."""
+    kinds = {(catalog.get(ex_id) or {}).get('equipment') for ex_id in entry.get('exercise_ids', ())}
+    return kinds.pop() if len(kinds) == 1 else None
+
+def entry_hour(entry):
+    date = entry['date']
+    return int(date[11:13]) if len(date) >= 13 else None
+
+def record_workout(agg, entry, now):
+    """Adds one compact log entry (including its xp_gained) to the aggregates."""
+    roll_over(agg, now)
+    agg['total_workouts'] += 1
+    mask = entry.get('muscle_mask', 0)
+    for group in muscle_groups(mask):
+        agg['muscle_groups'][group] = agg['muscle_groups'].get(group, 0) + 1
+    equipment = workout_equipment(entry)
+    if equipment: agg['equipment'][equipment] = agg['equipment'].get(equipment, 0) + 1
+    hour = entry_hour(entry)
+    if hour is not None: agg['workouts_by_hour'][hour] += 1
+    date = entry['date']
+    if date >= agg['week_start']:
+        agg['workouts_this_week'] += 1
+        agg['xp_this_week'] += entry.get('xp_gained', 0)
+        agg['week_day_masks'][date[:10]] = agg['week_day_masks'].get(date[:10], 0) | mask
+    if date.startswith(agg['day']): agg['workouts_today'] += 1
+    recent = agg['recent_exercises'] + list(entry.get('exercise_ids', ()))
+    agg['recent_exercises'] = recent[-RECENT_EXERCISE_LIMIT:]
+    _add_weekly_xp(agg, entry_week(date), entry.get('xp_gained', 0))
+    return agg
+
+def record_logged_workout(agg, entry, now):
+    """`record_workout` for an entry that may already be in the log. Completions are logged
+    before their events are handled, so aggregates rebuilt from the log in the meantime
+    already count every workout up to `rebuilt_through`; those are not added again."""
+    if entry['date'] <= agg.get('rebuilt_through', ''): return agg
+    return record_workout(agg, entry, now)
+
+def record_reward(agg, entry, now):
+    """Adds the bonus XP of a reward log entry (see workout_log.REWARD_KIND)."""
+    roll_over(agg, now)
+    if entry['date'] >= agg['week_start']: agg['xp_this_week'] += entry['xp_gained']
+    _add_weekly_xp(agg, entry_week(entry['date']), entry['xp_gained'])
+    return agg
+
+def add_xp(agg, xp, now):
+    roll_over(agg, now)
+    if week_window(now) == agg['week_start']: agg['xp_this_week'] += xp  # `now` may be in an earlier week
+    _add_weekly_xp(agg, week_window(now), xp)
+
+def _add_weekly_xp(agg, week, xp):
+    weekly = agg['weekly_xp']
+    weekly[week] = weekly.get(week, 0) + xp
+    if len(weekly) > WEEKLY_HISTORY_LIMIT: del weekly[min(weekly)]
+
+def rebuild(history, now):
+    """Recomputes aggregates from a user's full compact workout history, reward entries included."""
+    agg = empty(now)
+    for entry in history: (record_reward if is_reward(entry) else record_workout)(agg, entry, now)
+    agg['rebuilt_through'] = max((e['date'] for e in history if not is_reward(e)), default='')
+    return agg
+
+def is_current(user):
+    return (user.get('aggregates') or {}).get('version') == AGGREGATES_VERSION
+
+def for_user(user, now, history_loader):
+    """Returns the user's aggregates, rolled over to `now`. Users created before
+    aggregates existed (or with an older AGGREGATES_VERSION) get them rebuilt once from
+    `history_loader()`."""
+    if not is_current(user): user['aggregates'] = rebuild(history_loader(), now)
+    return roll_over(user['aggregates'], now)
+
+def snapshot(user, now, history_loader):
+    """Like `for_user`, but returns a rolled-over copy and leaves the user record untouched,
+    for read-only endpoints."""
+    if not is_current(user): return rebuild(history_loader(), now)
+    return roll_over(copy.deepcopy(user['aggregates']), now)
@@ -1,85 +1,193 @@
-from flask import Flask, jsonify, request, send_from_directory
-from flask_cors import CORS
-from werkzeug.security import generate_password_hash, check_password_hash
+import copy
+import functools
 import json
-import random
 import os
-from datetime import datetime, timedelta
+from flask import Flask, Response, g, jsonify, request, send_from_directory, stream_with_context
+from flask_cors import CORS
+from datetime import date, datetime, timedelta, timezone
+from store import DATA_DIR, MULTI_WORKER, store
+from assets import assets
+from storage import storage
+from catalog import catalog, muscle_mask, MUSCLE_GROUP_BITS
+from passwords import hasher, HasherBusy
+from sessions import sessions
+from streams import StreamHub
+import http_cache
+import metrics
+from http_cache import versioned
+import aggregates
+from events import events
+from rewards import rewards, WorkoutContext
+from leaderboard import leaderboard, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from workout_generator import balanced_workout, random_workout, DEFAULT_WORKOUT_SIZE, MAX_WORKOUT_SIZE
+from workout_log import REWARD_KIND
 
 # --- App Initialization ---
 app = Flask(__name__, static_folder='../frontend', static_url_path='')
 CORS(app)
+metrics.init_app(app, os.path.join(DATA_DIR, 'metrics'), os.path.join(DATA_DIR, 'profiles'))  # first: times the other hooks too
+http_cache.init_app(app)
 
 # --- Gamification Configuration ---
 LEVEL_XP_MAP = {1: 100, 2: 150, 3: 200, 4: 250, 5: 300, 6: 400, 7: 500, 8: 600, 9: 750, 10: 1000}
 BASE_WORKOUT_XP = 50
 
+# --- Batch Sync Configuration ---
+MAX_BATCH_COMPLETIONS = 500
+BATCH_CLOCK_SKEW = timedelta(minutes=5)  # tolerated for client clocks running ahead
+
+# --- History Configuration ---
+HISTORY_PAGE_SIZE = 20
+MAX_HISTORY_PAGE_SIZE = 100
+HISTORY_STREAM_BATCH = 200  # entries read per storage call while streaming NDJSON
+SUMMARY_WEEKS = 12
+
+# --- Notification Configuration ---
+NOTIFICATION_LIMIT = 20  # newest notifications kept on each user record
+
+# --- Metrics ---
+REWARD_SECONDS = metrics.registry.histogram('fitness_reward_evaluation_seconds', 'Time to evaluate quests and badges for one workout.')
+
 # --- Helper Functions ---
+# Both helpers go through the process-wide in-memory store (see store.py): reads are served
+# from memory and writes are flushed to disk in batches by a background writer.
+# `load_data` returns the live collection, so mutate it only inside `store.transaction()`.
+# Users, friendships and workout history go through `storage` (see storage.py) instead.
+# Transactions are not rolled back when they raise, so endpoints check every input before
+# they change a record, and turn bad input into a 400 rather than an exception.
 def load_data(filename):
-    filepath = os.path.join(os.path.dirname(__file__), 'data', filename)
-    try:
-        with open(filepath, 'r') as f: return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError): return []
+    return store.get(filename)
 
 def save_data(filename, data):
-    filepath = os.path.join(os.path.dirname(__file__), 'data', filename)
-    with open(filepath, 'w') as f: json.dump(data, f, indent=4)
+    store.put(filename, data)
+
+def login_required(view=None, token_param=None):
+    """Resolves the `Authorization: Bearer <token>` session into `g.user` (see sessions.py).
+    Routes with a <user_id> are restricted to the signed-in user's own id. `token_param`
+    also accepts the token as a query parameter, for clients that cannot set headers
+    (EventSource)."""
+    if view is None: return functools.partial(login_required, token_param=token_param)
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        header = request.headers.get('Authorization', '')
+        token = header[7:] if header.startswith('Bearer ') else None
+        if token is None and token_param: token = request.args.get(token_param)
+        user = sessions.resolve(token) if token else None
+        if user is None: return jsonify({"message": "Please log in."}), 401
+        if kwargs.get('user_id', user['id']) != user['id']: return jsonify({"message": "Not allowed."}), 403
+        g.user = user
+        return view(*args, **kwargs)
+    return wrapper
+
+def _data_version():
+    # Everything the cached read endpoints depend on. The UTC day is included because
+    # quest windows and weekly counters roll over with it; the asset manifest names the badge images.
+    return (storage.version(), store.version('exercises.json', 'badges.json', 'quests.json'), assets.version(),
+            datetime.utcnow().date())
+
+def _user_data_version():
+    """_data_version() for endpoints built from the signed-in user's record. The record is
+    read fresh into `g.fresh_user` (the session's copy can lag behind other workers) and is
+    part of the version itself, so a body built from a lagging read is never cached under
+    a newer ETag."""
+    g.fresh_user = storage.get_user(g.user['id']) or g.user
+    return _data_version(), json.dumps(g.fresh_user, sort_keys=True, default=str)
+
+def _history_filters():
+    """Parses ?from=&to= (inclusive YYYY-MM-DD dates) and ?muscle=Chest,Legs into
+    workout_page() arguments. Raises ValueError on bad input."""
+    since, until, muscles = request.args.get('from'), request.args.get('to'), request.args.get('muscle')
+    filters = {"since": date.fromisoformat(since).isoformat() if since else None,
+               "until": (date.fromisoformat(until) + timedelta(days=1)).isoformat() if until else None,
+               "muscle_mask": 0}
+    if muscles:
+        groups = [name.strip() for name in muscles.split(',')]
+        unknown = [name for name in groups if name not in MUSCLE_GROUP_BITS]
+        if unknown: raise ValueError(f"Unknown muscle group: {', '.join(unknown)}")
+        filters['muscle_mask'] = muscle_mask(groups)
+    return filters
+
+def _friends_payload(user_id):
+    return {"friends": storage.friends_of(user_id), "pending_requests": storage.pending_requests_for(user_id)}
+
+def _friends_leaderboard_payload(user_id):
+    friend_ids = storage.friend_ids(user_id) | {user_id}
+    return {"entries": leaderboard.among(friend_ids), "me": leaderboard.rank(user_id)}
+
+def _busy():
+    return jsonify({"message": "Server is busy, please try again."}), 503, {"Retry-After": "1"}
+
+def _compact_history(user_id):
+    return [catalog.shrink_entry(p) for p in storage.workout_history(user_id, include_rewards=True)]
+
+def _reward_entry(user_id, date_iso, bonus_xp, event_id=None):
+    """The log entry for bonus XP from quests and badges, kept apart from the workout entry."""
+    entry = {"userId": user_id, "date": date_iso, "kind": REWARD_KIND, "xp_gained": bonus_xp}
+    if event_id: entry['event_id'] = event_id
+    return entry
+
+def _rewards_outcome(user, entry, bonus_xp, quests, badges):
+    """What a completion earned once its rewards were applied: sent as a notification for
+    live completions and inline with each batch result."""
+    return {"date": entry['date'], "xp_gained": entry['xp_gained'] + bonus_xp, "bonus_xp": bonus_xp,
+            "level": user['level'], "xp": user['xp'], "newly_completed_quests": quests, "newly_earned_badges": badges}
+
+def _notify(user, notification):
+    """Adds a notification to the user's feed (see get_notifications). Modifies the user
+    object directly; save it afterwards."""
+    user['notification_seq'] = user.get('notification_seq', 0) + 1
+    feed = user.get('notifications', []) + [dict(notification, seq=user['notification_seq'])]
+    user['notifications'] = feed[-NOTIFICATION_LIMIT:]
 
 
 # --- NEW: Master Rewards Logic ---
-def _check_and_award_rewards(user, workout_log):
-    """Checks for and awards quests and badges. Modifies the user object directly."""
-    newly_completed_quests = []
-    newly_earned_badges = []
-    total_bonus_xp = 0
-
-    # --- 1. Quest Completion Check ---
-    all_quests = load_data('quests.json')
-    user_completed_quests = user.get('completed_quests', [])
-    
-    for quest in all_quests:
-        if quest['id'] not in user_completed_quests: # Check only uncompleted quests
-            # This is a simplified check. A real system would check daily/weekly resets.
-            is_complete = False
-            criteria = quest['criteria']
-            if criteria['type'] == 'first_workout_of_day':
-                is_complete = True # The event of completing a workout is enough for this
-            elif criteria['type'] == 'muscle_group_in_workout':
-                if any(ex['muscle_group'] in criteria['value'] for ex in workout_log[-1]['workout']):
-                    is_complete = True
-            
-            if is_complete:
-                user['xp'] += quest['reward_xp']
-                total_bonus_xp += quest['reward_xp']
-                user_completed_quests.append(quest['id'])
-                newly_completed_quests.append(quest)
-
-    user['completed_quests'] = user_completed_quests
-
-    # --- 2. Badge Unlocking Check ---
-    all_badges = load_data('badges.json')
-    user_unlocked_badges = user.get('unlocked_badges', [])
-
-    for badge in all_badges:
-        if badge['id'] not in user_unlocked_badges:
-            is_earned = False
-            criteria = badge['criteria']
-            if criteria['type'] == 'total_workouts' and len(workout_log) >= criteria['value']:
-                is_earned = True
-            elif criteria['type'] == 'level_reached' and user['level'] >= criteria['value']:
-                is_earned = True
-            elif criteria['type'] == 'streak' and user['streak_count'] >= criteria['value']:
-                is_earned = True
-            elif criteria['type'] == 'quests_completed' and len(user['completed_quests']) >= criteria['value']:
-                is_earned = True
-            
-            if is_earned:
-                user_unlocked_badges.append(badge['id'])
-                newly_earned_badges.append(badge)
-    
-    user['unlocked_badges'] = user_unlocked_badges
-
-    return total_bonus_xp, newly_completed_quests, newly_earned_badges
+def _check_and_award_rewards(user, entry, now, leveled_up=False, streak_changed=False):
+    """Checks for and awards quests and badges. Modifies the user object directly.
+    Rules are compiled once by the reward engine (see rewards.py) and read only the user's
+    aggregates, which must already include `entry`; only rules whose counters this
+    workout changed are evaluated."""
+    with REWARD_SECONDS.time():
+        ctx = WorkoutContext.from_aggregates(user, entry, now, leveled_up, streak_changed)
+        return rewards.evaluate(user, ctx)
+
+
+# --- Background Jobs ---
+def _process_completion(event):
+    """Handles 'workout_completed' on an event worker (see events.py): records the workout
+    in the user's aggregates, awards quests and badges, logs their bonus XP as a reward
+    entry (which the leaderboard picks up from the log) and leaves a notification with the
+    outcome. Evaluated at the workout's own timestamp, so a delay does not change the
+    result.
+
+    Safe to retry or replay: rewards are evaluated on a copy of the user, which is saved
+    together with the notification (carrying the event id) only after the reward entry is
+    logged. A write that fails leaves the stored user untouched; an event whose
+    notification is already there is skipped, and a reward entry already logged for it
+    is not logged again."""
+    payload = event['payload']
+    entry = payload['entry']
+    now = datetime.fromisoformat(entry['date'])
+    with storage.transaction(entry['userId']):
+        stored = storage.get_user(entry['userId'])
+        if not stored or any(n.get('event_id') == event['id'] for n in stored.get('notifications', ())): return
+        user = copy.deepcopy(stored)  # transactions don't roll back, so the stored record is only replaced by save_user
+        bonus_xp, quests, badges = _apply_rewards(user, entry, now, payload['leveled_up'], payload['streak_changed'],
+                                                  lambda: _compact_history(user['id']))
+        if bonus_xp and not storage.has_reward_for(user['id'], event['id'], entry['date']):
+            storage.append_workout(_reward_entry(user['id'], entry['date'], bonus_xp, event['id']))
+        _notify(user, {"type": "workout_rewards", "event_id": event['id'],
+                       **_rewards_outcome(user, entry, bonus_xp, quests, badges)})
+        storage.save_user(user)
+    sessions.update_user(user)
+    streams.touch(storage.friend_ids(user['id']) | {user['id']})  # their weekly XP moved in friends' rankings
+
+events.subscribe('workout_completed', _process_completion)
+
+# Live friend activity for /api/user/<id>/stream: the same payloads as the friends and
+# friends-leaderboard endpoints, pushed whenever they change (see streams.py).
+streams = StreamHub(lambda user_id: {"friends": _friends_payload(user_id),
+                                     "leaderboard": _friends_leaderboard_payload(user_id)},
+                    version=storage.version if MULTI_WORKER else None)
 
 
 # --- Frontend Serving Routes ---
@@ -102,46 +210,99 @@ def serve_friends(): return send_from_directory(app.static_folder, 'friends.html
 @app.route('/api/register', methods=['POST'])
 def register_user():
     data = request.json
-    users = load_data('users.json')
-    if any(u['username'].lower() == data.get('username', '').lower() for u in users):
+    if storage.find_user_by_username(data.get('username', '')):  # skip hashing for the common conflict
         return jsonify({"message": "Username already exists."}), 409
-    new_user = {"id": max([u['id'] for u in users] + [0]) + 1, "username": data.get('username'),
-                "password_hash": generate_password_hash(data.get('password')), "goals": data.get('goals'),
-                "available_equipment": data.get('equipment'), "level": 1, "xp": 0, "streak_count": 0,
-                "last_workout_date": None, "unlocked_badges": [], "completed_quests": []}
-    users.append(new_user)
-    save_data('users.json', users)
+    try: password_hash = hasher.hash(data.get('password'))
+    except HasherBusy: return _busy()
+    with storage.transaction():  # no user ids: creating a user locks everything, including the username index
+        if storage.find_user_by_username(data.get('username', '')):
+            return jsonify({"message": "Username already exists."}), 409
+        new_user = storage.create_user({"username": data.get('username'),
+                                        "password_hash": password_hash, "goals": data.get('goals'),
+                                        "available_equipment": data.get('equipment'), "level": 1, "xp": 0, "streak_count": 0,
+                                        "last_workout_date": None, "unlocked_badges": [], "completed_quests": [],
+                                        "aggregates": aggregates.empty(datetime.utcnow())})
+    leaderboard.add_user(new_user)
     return jsonify({"message": "User registered successfully!"}), 201
 
 @app.route('/api/login', methods=['POST'])
 def login_user():
     data = request.json
-    user = next((u for u in load_data('users.json') if u['username'].lower() == data.get('username', '').lower()), None)
-    if user and check_password_hash(user.get('password_hash', ''), data.get('password')):
+    user = storage.find_user_by_username(data.get('username', ''))
+    try: valid = user is not None and hasher.verify(user.get('password_hash'), data.get('password'))
+    except HasherBusy: return _busy()
+    if valid and hasher.needs_rehash(user.get('password_hash')):
+        # Hashing parameters changed since this hash was made: upgrade it while we have the password.
+        try: new_hash = hasher.hash(data.get('password'))
+        except HasherBusy: new_hash = None  # try again on a later login
+        if new_hash:
+            with storage.transaction(user['id']):
+                user = storage.get_user(user['id'])
+                user['password_hash'] = new_hash
+                storage.save_user(user)
+    if valid:
         return jsonify({"id": user['id'], "username": user['username'], "goals": user['goals'],
-                        "available_equipment": user['available_equipment']}), 200
+                        "available_equipment": user['available_equipment'], "token": sessions.issue(user)}), 200
     return jsonify({"message": "Invalid username or password."}), 401
 
-@app.route('/api/workout', methods=['POST'])
-def generate_workout():
+@app.route('/api/logout', methods=['POST'])
+@login_required
+def logout_user():
+    # Signs the user out on every device: all of their tokens stop working.
+    with storage.transaction(g.user['id']):
+        user = storage.get_user(g.user['id'])
+        sessions.revoke_user(user)
+        storage.save_user(user)
+    return jsonify({"message": "Logged out."}), 200
+
+@app.route('/api/password', methods=['POST'])
+@login_required
+def change_password():
     data = request.json
-    exercises = load_data('exercises.json')
-    equipment = data.get('available_equipment', ['None'])
-    available = [ex for ex in exercises if ex['equipment'] in equipment]
-    if not available: return jsonify({"error": "No exercises found."}), 400
-    return jsonify(random.sample(available, min(len(available), 5)))
+    try:
+        if not hasher.verify(g.user.get('password_hash'), data.get('current_password')):
+            return jsonify({"message": "Current password is incorrect."}), 403
+        password_hash = hasher.hash(data.get('new_password'))
+    except HasherBusy: return _busy()
+    with storage.transaction(g.user['id']):
+        user = storage.get_user(g.user['id'])
+        user['password_hash'] = password_hash
+        sessions.revoke_user(user)
+        storage.save_user(user)
+    return jsonify({"message": "Password changed.", "token": sessions.issue(user)}), 200
 
-@app.route('/api/workout/complete', methods=['POST'])
-def complete_workout():
+@app.route('/api/workout', methods=['POST'])
+@login_required
+def generate_workout():
+    # mode=balanced spreads the workout across muscle groups at the user's difficulty and
+    # skips their recent exercises; the default picks any exercises the equipment allows.
     data = request.json
-    user_id = data.get('userId')
-    
-    users = load_data('users.json')
-    user, user_index = next(((u, i) for i, u in enumerate(users) if u['id'] == user_id), (None, -1))
-    if not user: return jsonify({"message": "User not found"}), 404
-
-    # --- 1. Grant Base XP & Handle Leveling ---
-    xp_gained = BASE_WORKOUT_XP + (len(data.get('workout', [])) * 5)
+    if not isinstance(data, dict): return jsonify({"message": "Expected a JSON object."}), 400
+    equipment = data.get('available_equipment') or ['None']
+    count = data.get('count') or DEFAULT_WORKOUT_SIZE
+    if isinstance(count, str) and count.strip().isdigit(): count = int(count)
+    if not isinstance(count, int) or isinstance(count, bool):
+        return jsonify({"message": "'count' must be a whole number."}), 400
+    count = min(max(count, 1), MAX_WORKOUT_SIZE)
+    if data.get('mode') == 'balanced':
+        recent = (g.user.get('aggregates') or {}).get('recent_exercises', [])
+        workout = balanced_workout(equipment, g.user['level'], recent, count)
+    else:
+        workout = random_workout(equipment, count)
+    if not workout: return jsonify({"error": "No exercises found."}), 400
+    return jsonify(workout)
+
+def _apply_completion(user, workout, now):
+    """Applies the core of one completed workout, done at `now`, to `user`: XP, level-ups
+    and streak. Modifies the user object directly and returns (log entry, leveled_up,
+    streak_changed); the caller appends the entry and saves the user. A malformed workout
+    raises ValueError before anything is changed."""
+    # --- 1. Build the Log Entry (validates the workout) ---
+    xp_gained = BASE_WORKOUT_XP + (len(catalog.exercise_ids(workout)) * 5)
+    entry = catalog.shrink_entry({"userId": user['id'], "date": now.isoformat(),
+                                  "workout": workout, "xp_gained": xp_gained})
+
+    # --- 2. Grant Base XP & Handle Leveling ---
     user['xp'] += xp_gained
     leveled_up = False
     xp_needed = LEVEL_XP_MAP.get(user['level'], 1000)
@@ -151,8 +312,9 @@ def complete_workout():
         xp_needed = LEVEL_XP_MAP.get(user['level'], 1000)
         leveled_up = True
 
-    # --- 2. Update Streak & Log Workout ---
-    today = datetime.utcnow().date()
+    # --- 3. Update Streak ---
+    today = now.date()
+    streak_before = user['streak_count']
     if user.get('last_workout_date'):
         last_workout = datetime.strptime(user['last_workout_date'], '%Y-%m-%d').date()
         if today == last_workout + timedelta(days=1): user['streak_count'] += 1
@@ -160,121 +322,275 @@ def complete_workout():
     else:
         user['streak_count'] = 1
     user['last_workout_date'] = today.strftime('%Y-%m-%d')
-    
-    progress = load_data('user_progress.json')
-    user_progress = [p for p in progress if p['userId'] == user_id]
-    user_progress.append({"userId": user_id, "date": datetime.utcnow().isoformat(), "workout": data.get('workout'), "xp_gained": xp_gained})
-    # Save only this user's progress back to the main log
-    other_progress = [p for p in progress if p['userId'] != user_id]
-    save_data('user_progress.json', other_progress + user_progress)
-
-    # --- 3. Check for Quests & Badges ---
-    bonus_xp, quests, badges = _check_and_award_rewards(user, user_progress)
-    xp_gained += bonus_xp
-    
-    # --- 4. Save User and Return ---
-    users[user_index] = user
-    save_data('users.json', users)
-    
-    return jsonify({"message": "Workout complete!", "xp_gained": xp_gained, "level": user['level'],
-                    "xp": user['xp'], "leveled_up": leveled_up,
-                    "newly_completed_quests": quests, "newly_earned_badges": badges}), 200
+    return entry, leveled_up, user['streak_count'] != streak_before
+
+def _apply_rewards(user, entry, now, leveled_up, streak_changed, history_loader):
+    """Records a logged workout in the user's aggregates, then awards quests, badges and
+    their bonus XP. Modifies the user object directly; returns (bonus_xp, quests, badges).
+    `history_loader` returns the user's logged history, for users whose aggregates need
+    rebuilding; `entry` is skipped if that history already contained it."""
+    user_aggregates = aggregates.for_user(user, now, history_loader)
+    aggregates.record_logged_workout(user_aggregates, entry, now)
+    bonus_xp, quests, badges = _check_and_award_rewards(user, entry, now, leveled_up, streak_changed)
+    aggregates.add_xp(user_aggregates, bonus_xp, now)
+    return bonus_xp, quests, badges
+
+def _parse_completion_time(value):
+    """Parses an ISO 8601 timestamp into a naive UTC datetime, like the ones in the log."""
+    when = datetime.fromisoformat(value)
+    return when.astimezone(timezone.utc).replace(tzinfo=None) if when.tzinfo else when
+
+@app.route('/api/workout/complete', methods=['POST'])
+@login_required
+def complete_workout():
+    # Only XP, streak and the log entry are written here. Aggregates, quests and badges are
+    # handled off the request by _process_completion; the client picks up the outcome from
+    # /api/user/<id>/notifications using the returned event_id.
+    data = request.json
+    if not isinstance(data, dict): return jsonify({"message": "Expected a JSON object."}), 400
+    with storage.transaction(g.user['id']):
+        user = storage.get_user(g.user['id'])  # re-read under the lock: another worker may have updated it
+        if not user: return jsonify({"message": "User not found"}), 404
+        try: entry, leveled_up, streak_changed = _apply_completion(user, data.get('workout'), datetime.utcnow())
+        except ValueError as e: return jsonify({"message": str(e)}), 400
+        storage.append_workout(entry)
+        storage.save_user(user)
+        result = {"message": "Workout complete!", "xp_gained": entry['xp_gained'], "level": user['level'],
+                  "xp": user['xp'], "leveled_up": leveled_up}  # before rewards, even if they are handled inline
+    sessions.update_user(user)
+    result['event_id'] = events.publish('workout_completed', {"entry": entry, "leveled_up": leveled_up,
+                                                              "streak_changed": streak_changed}, key=user['id'])
+    return jsonify(result), 200
+
+@app.route('/api/workout/complete/batch', methods=['POST'])
+@login_required
+def complete_workout_batch():
+    """Replays completions recorded offline: {"completions": [{"date": ISO timestamp, "workout": [...]}, ...]}.
+
+    Items are applied oldest first, each at its own timestamp (streaks, quest windows and
+    weekly counters follow the item's date, not the upload time), so every item gets the
+    XP, quests and badges a live completion would have earned at that moment, logged the
+    same way (bonus XP as a separate reward entry). Each result has the single endpoint's
+    fields with the same meaning; instead of a notification, rewards are evaluated inline
+    and returned as its `rewards`, shaped like that notification. Everything is applied in
+    one transaction with one log write and one user save. Results come back
+    in request order; items that are malformed, dated before the user's latest logged
+    workout or in the future are rejected individually with a 400 status. All of them are
+    checked before the user record is touched. Live completions of the user still waiting
+    for their rewards (see _process_completion) are handled first, so they are evaluated
+    before these newer items, not after; 503 if they take too long.
+    """
+    body = request.json
+    completions = body.get('completions') if isinstance(body, dict) else None
+    if not isinstance(completions, list) or not completions:
+        return jsonify({"message": "Expected a non-empty 'completions' list."}), 400
+    if len(completions) > MAX_BATCH_COMPLETIONS:
+        return jsonify({"message": f"At most {MAX_BATCH_COMPLETIONS} completions per batch."}), 413
+
+    results, accepted = [None] * len(completions), []
+    for i, item in enumerate(completions):
+        try: when = _parse_completion_time(item['date'])
+        except (KeyError, TypeError, ValueError, AttributeError):
+            results[i] = {"status": 400, "message": "Each completion needs an ISO 8601 'date'."}
+            continue
+        try: catalog.exercise_ids(item.get('workout'))  # _apply_completion must not fail half-way through the batch
+        except ValueError as e:
+            results[i] = {"status": 400, "message": str(e)}
+            continue
+        accepted.append((when, i, item.get('workout')))
+    accepted.sort(key=lambda a: (a[0], a[1]))
+
+    if not events.wait_for(g.user['id']): return _busy()
+    with storage.transaction(g.user['id']):
+        user = storage.get_user(g.user['id'])
+        if not user: return jsonify({"message": "User not found"}), 404
+        latest, _ = storage.workout_page(user['id'], limit=1)
+        not_before = datetime.fromisoformat(latest[0]['date']) if latest else datetime.min
+        not_after = datetime.utcnow() + BATCH_CLOCK_SKEW
+        entries = []
+        for when, i, workout in accepted:
+            if not not_before <= when <= not_after:
+                results[i] = {"status": 400, "message": "Completion is older than the latest logged workout or in the future."}
+                continue
+            entry, leveled_up, streak_changed = _apply_completion(user, workout, when)
+            results[i] = {"status": 200, "message": "Workout complete!", "xp_gained": entry['xp_gained'],
+                          "level": user['level'], "xp": user['xp'], "leveled_up": leveled_up}
+            bonus_xp, quests, badges = _apply_rewards(user, entry, when, leveled_up, streak_changed,
+                                                      lambda: _compact_history(user['id']))
+            entries.append(entry)
+            if bonus_xp: entries.append(_reward_entry(user['id'], entry['date'], bonus_xp))
+            results[i]['rewards'] = _rewards_outcome(user, entry, bonus_xp, quests, badges)
+            not_before = when
+        if entries:
+            storage.append_workouts(entries)
+            storage.save_user(user)
+    sessions.update_user(user)
+    return jsonify({"results": results, "level": user['level'], "xp": user['xp']}), 200
 
 
 # --- Profile, Quests, Friends & Leaderboard API (FULLY FUNCTIONAL) ---
 @app.route('/api/user/<int:user_id>/stats', methods=['GET'])
+@login_required
+@versioned(_user_data_version)
 def get_user_stats(user_id):
-    user = next((u for u in load_data('users.json') if u['id'] == user_id), None)
-    if not user: return jsonify({"message": "User not found"}), 404
-    badges = [b for b in load_data('badges.json') if b['id'] in user.get('unlocked_badges', [])]
+    user = g.fresh_user
+    badges = [assets.badge(b) for b in load_data('badges.json') if b['id'] in user.get('unlocked_badges', [])]
+    stats = aggregates.snapshot(user, datetime.utcnow(), lambda: _compact_history(user_id))
     return jsonify({"username": user['username'], "level": user['level'], "xp": user['xp'],
                     "xp_needed_for_next_level": LEVEL_XP_MAP.get(user['level'], 1000),
-                    "streak_count": user['streak_count'], "unlocked_badges": badges})
+                    "streak_count": user['streak_count'], "unlocked_badges": badges,
+                    "total_workouts": stats['total_workouts'], "xp_this_week": stats['xp_this_week'],
+                    "workouts_this_week": stats['workouts_this_week'], "muscle_group_counts": stats['muscle_groups'],
+                    "workouts_by_hour": stats['workouts_by_hour']})
 
 @app.route('/api/user/<int:user_id>/history', methods=['GET'])
+@login_required
+@versioned(_data_version)
 def get_workout_history(user_id):
-    return jsonify([log for log in load_data('user_progress.json') if log['userId'] == user_id])
+    # Newest first, one page at a time: pass `next_before` back as ?before= for the next page.
+    # ?format=ndjson streams every matching entry instead, one JSON object per line.
+    try: filters = _history_filters()
+    except ValueError as e: return jsonify({"message": str(e)}), 400
+    before = request.args.get('before', type=int)
+
+    if request.args.get('format') == 'ndjson':
+        def stream(before):
+            while True:  # reads a batch at a time, so memory stays flat however long the history is
+                entries, before = storage.workout_page(user_id, before, HISTORY_STREAM_BATCH, **filters)
+                for entry in entries: yield json.dumps(catalog.expand_entry(entry)) + '\n'
+                if before is None: return
+        return Response(stream_with_context(stream(before)), mimetype='application/x-ndjson')
+
+    limit = min(max(request.args.get('limit', HISTORY_PAGE_SIZE, type=int), 1), MAX_HISTORY_PAGE_SIZE)
+    entries, next_before = storage.workout_page(user_id, before, limit, **filters)
+    return jsonify({"entries": [catalog.expand_entry(entry) for entry in entries], "next_before": next_before})
+
+@app.route('/api/user/<int:user_id>/history/summary', methods=['GET'])
+@login_required
+@versioned(_user_data_version)
+def get_history_summary(user_id):
+    # Served from the user's aggregates; never reads the workout log.
+    now = datetime.utcnow()
+    stats = aggregates.snapshot(g.fresh_user, now, lambda: _compact_history(user_id))
+    weeks = min(max(request.args.get('weeks', SUMMARY_WEEKS, type=int), 1), aggregates.WEEKLY_HISTORY_LIMIT)
+    this_week = date.fromisoformat(aggregates.week_window(now))
+    week_starts = [(this_week - timedelta(weeks=i)).isoformat() for i in range(weeks)]
+    return jsonify({"total_workouts": stats['total_workouts'], "workouts_this_week": stats['workouts_this_week'],
+                    "weekly_xp": [{"week_start": w, "xp": stats['weekly_xp'].get(w, 0)} for w in week_starts],
+                    "muscle_groups": stats['muscle_groups'], "workouts_by_hour": stats['workouts_by_hour']})
+
+@app.route('/api/user/<int:user_id>/notifications', methods=['GET'])
+@login_required
+@versioned(_user_data_version)
+def get_notifications(user_id):
+    # Reward outcomes of recent workouts, oldest first. Pass the last `seq` seen as ?after=
+    # to get only newer ones.
+    after = request.args.get('after', 0, type=int)
+    user = g.fresh_user
+    return jsonify({"notifications": [n for n in user.get('notifications', []) if n['seq'] > after],
+                    "last_seq": user.get('notification_seq', 0)})
 
 @app.route('/api/user/<int:user_id>/quests', methods=['GET'])
+@login_required
+@versioned(_user_data_version)
 def get_user_quests(user_id):
-    user = next((u for u in load_data('users.json') if u['id'] == user_id), None)
-    if not user: return jsonify({"message": "User not found"}), 404
-    
-    quests = load_data('quests.json')
-    user_completed = user.get('completed_quests', [])
-    for q in quests:
-        q['completed'] = q['id'] in user_completed
-    
+    user_completed = rewards.completed_quests(g.fresh_user)
+    quests = [dict(q, completed=q['id'] in user_completed) for q in load_data('quests.json')]
+
     return jsonify({"daily": [q for q in quests if q['type'] == 'daily'],
                     "weekly": [q for q in quests if q['type'] == 'weekly']})
 
 @app.route('/api/user/<int:user_id>/friends', methods=['GET'])
+@login_required
+@versioned(_data_version)
 def get_friends(user_id):
-    friends_data = load_data('friends_data.json')
-    users = load_data('users.json')
-    
-    friends = []
-    pending_requests = []
-    
-    for rel in friends_data:
-        if rel['status'] == 'accepted' and user_id in [rel['requester_id'], rel['receiver_id']]:
-            friend_id = rel['receiver_id'] if rel['requester_id'] == user_id else rel['requester_id']
-            friend = next((u for u in users if u['id'] == friend_id), None)
-            if friend: friends.append({"id": friend['id'], "username": friend['username'], "level": friend['level']})
-        elif rel['status'] == 'pending' and rel['receiver_id'] == user_id:
-            requester = next((u for u in users if u['id'] == rel['requester_id']), None)
-            if requester: pending_requests.append({"id": requester['id'], "username": requester['username']})
-
-    return jsonify({"friends": friends, "pending_requests": pending_requests})
+    return jsonify(_friends_payload(user_id))
+
+@app.route('/api/user/<int:user_id>/stream', methods=['GET'])
+@login_required(token_param='token')
+def stream_friend_activity(user_id):
+    # Server-sent events: 'friends' (friend list and pending requests) and 'leaderboard'
+    # (the friends leaderboard) are sent on connect and again whenever they change.
+    subscription = streams.subscribe(user_id)
+    if subscription is None: return jsonify({"message": "Too many open streams."}), 429
+    return Response(streams.stream(subscription), mimetype='text/event-stream',
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route('/api/user/<int:user_id>/friends/suggestions', methods=['GET'])
+@login_required
+def get_friend_suggestions(user_id):
+    # Friends of friends, ranked by how many mutual friends they share with the user.
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 50)
+    return jsonify(storage.suggest_friends(user_id, limit))
 
 @app.route('/api/user/<int:user_id>/friends/request', methods=['POST'])
+@login_required
 def send_friend_request(user_id):
     data = request.json
-    username_to_add = data.get('username_to_add', '').lower()
-    
-    users = load_data('users.json')
-    friend_to_add = next((u for u in users if u['username'].lower() == username_to_add), None)
+    friend_to_add = storage.find_user_by_username(data.get('username_to_add', ''))
     
     if not friend_to_add: return jsonify({"message": "User not found."}), 404
     if friend_to_add['id'] == user_id: return jsonify({"message": "You cannot add yourself."}), 400
     
-    friends_data = load_data('friends_data.json')
-    if any(user_id in [r['requester_id'], r['receiver_id']] and friend_to_add['id'] in [r['requester_id'], r['receiver_id']] for r in friends_data):
-        return jsonify({"message": "Request already sent or you are already friends."}), 409
-        
-    friends_data.append({"requester_id": user_id, "receiver_id": friend_to_add['id'], "status": "pending"})
-    save_data('friends_data.json', friends_data)
+    with storage.transaction(user_id, friend_to_add['id']):
+        if storage.find_relationship(user_id, friend_to_add['id']):
+            return jsonify({"message": "Request already sent or you are already friends."}), 409
+
+        storage.add_relationship({"requester_id": user_id, "receiver_id": friend_to_add['id'], "status": "pending"})
+    streams.touch([friend_to_add['id']])
     return jsonify({"message": "Friend request sent!"}), 200
 
 @app.route('/api/user/<int:user_id>/friends/respond', methods=['POST'])
+@login_required
 def respond_friend_request(user_id):
     data = request.json
     requester_id = data.get('requester_id')
     action = data.get('action') # 'accept' or 'decline'
-    
-    friends_data = load_data('friends_data.json')
-    request_index = next((i for i, r in enumerate(friends_data) if r['requester_id'] == requester_id and r['receiver_id'] == user_id and r['status'] == 'pending'), -1)
-    
-    if request_index == -1: return jsonify({"message": "Request not found."}), 404
-    
-    if action == 'accept':
-        friends_data[request_index]['status'] = 'accepted'
-        friends_data[request_index]['since'] = datetime.utcnow().isoformat()
-    else: # decline
-        friends_data.pop(request_index)
-        
-    save_data('friends_data.json', friends_data)
+    if not isinstance(requester_id, int): return jsonify({"message": "Request not found."}), 404
+
+    with storage.transaction(user_id, requester_id):
+        rel = storage.find_relationship(user_id, requester_id)
+        if not rel or rel['requester_id'] != requester_id or rel['status'] != 'pending':
+            return jsonify({"message": "Request not found."}), 404
+
+        if action == 'accept':
+            rel['status'] = 'accepted'
+            rel['since'] = datetime.utcnow().isoformat()
+            storage.save_relationship(rel)
+        else: # decline
+            storage.delete_relationship(rel)
+    streams.touch([user_id, requester_id])
     return jsonify({"message": f"Request {action}ed."}), 200
 
 @app.route('/api/leaderboard', methods=['GET'])
+@versioned(_data_version, private=False)
 def get_leaderboard():
-    # This is still a global leaderboard for simplicity. A friend-only one is more complex.
-    users = load_data('users.json')
-    leaderboard = sorted([{"id": u['id'], "username": u['username'], "weekly_xp": u.get('xp', 0)} for u in users],
-                         key=lambda x: x['weekly_xp'], reverse=True)
-    return jsonify(leaderboard)
+    # Global weekly leaderboard, paginated. Pass ?user_id= to also get that user's own rank.
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = min(max(request.args.get('limit', DEFAULT_PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+    total, entries = leaderboard.page(offset, limit)
+    result = {"total": total, "offset": offset, "limit": limit, "entries": entries}
+    user_id = request.args.get('user_id', type=int)
+    if user_id is not None: result['me'] = leaderboard.rank(user_id)
+    return jsonify(result)
+
+@app.route('/api/user/<int:user_id>/leaderboard', methods=['GET'])
+@login_required
+@versioned(_data_version)
+def get_friends_leaderboard(user_id):
+    # Weekly leaderboard of the user and their accepted friends.
+    return jsonify(_friends_leaderboard_payload(user_id))
+
+
+# --- Metrics API ---
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    # Prometheus text format, summed over every worker process sharing the data directory.
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
 
 
 # --- Main Execution ---
+events.start()  # also replays completions a crashed process left unprocessed
+
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
@@ -0,0 +1,63 @@
+import os
+import threading
+import time
+
+from store import REVALIDATE_INTERVAL, fingerprint, read_json
+
+# --- Asset Manifest Configuration ---
+ASSETS_URL_PREFIX = 'assets/'
+MANIFEST_PATH = os.path.join(os.path.dirname(__file__), '..', 'frontend', 'assets', 'manifest.json')
+
+
+# --- Asset Manifest ---
+class AssetManifest:
+    """The manifest written by create_assets.py: for each image, its content-hashed PNG and
+    WebP copies, plus the badge sprite sheet. Hashed files are served as immutable (see
+    http_cache.py), so API responses point clients at them instead of the plain names.
+
+    The file is re-read when it changes on disk, checked at most every REVALIDATE_INTERVAL
+    seconds. Without a manifest every URL is left as it is.
+    """
+
+    def __init__(self, path=MANIFEST_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._files, self._sprites = {}, {}
+        self._fingerprint = None
+        self._checked_at = None
+
+    def _refresh(self):
+        if self._checked_at is not None and time.monotonic() - self._checked_at < REVALIDATE_INTERVAL: return
+        with self._lock:
+            current = fingerprint(self.path)
+            if self._checked_at is None or current != self._fingerprint:
+                manifest = read_json(self.path, {})
+                self._files, self._sprites = manifest.get('files', {}), manifest.get('sprites', {})
+                self._fingerprint = current
+            self._checked_at = time.monotonic()
+
+    def version(self):
+        self._refresh()
+        return self._fingerprint
+
+    def url(self, url):
+        """The hashed PNG for an `assets/...` URL, or `url` itself if it has none."""
+        self._refresh()
+        entry = self._files.get(url[len(ASSETS_URL_PREFIX):]) if url.startswith(ASSETS_URL_PREFIX) else None
+        return ASSETS_URL_PREFIX + entry['png'] if entry else url
+
+    def badge(self, badge):
+        """A copy of `badge` with a hashed `image_url` and, if the badge is on the sprite
+        sheet, a `sprite` with the sheet's URLs, grid size and the badge's cell index."""
+        self._refresh()
+        image_url = badge.get('image_url', '')
+        result = dict(badge, image_url=self.url(image_url))
+        sheet = self._sprites.get('badges')
+        index = sheet['items'].get(image_url[len(ASSETS_URL_PREFIX):]) if sheet else None
+        if index is not None:
+            result['sprite'] = {"png": ASSETS_URL_PREFIX + sheet['png'], "webp": ASSETS_URL_PREFIX + sheet['webp'],
+                                "columns": sheet['columns'], "rows": sheet['rows'], "index": index}
+        return result
+
+
+assets = AssetManifest()
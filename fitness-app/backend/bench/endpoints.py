@@ -0,0 +1,275 @@
+"""Endpoint benchmark: throughput and p50/p99 latency of every API endpoint.
+
+Builds a synthetic dataset with generate_data.py (or copies one given with --data-dir),
+then drives each endpoint from several threads, either in-process through the Flask test
+client or over HTTP against a local multi-worker gunicorn server:
+
+    python3 bench/endpoints.py
+    python3 bench/endpoints.py --mode server --workers 4 --threads 8
+    python3 bench/endpoints.py --users 100000 --friendships 1000000 --workouts 10000000
+    python3 bench/endpoints.py --data-dir /tmp/big-dataset --only stats history
+
+Every run is appended to bench/results.jsonl with the git commit it ran on, and compared
+with the previous run of the same configuration. Pass --check to exit non-zero when an
+endpoint's p99 latency or throughput got worse by more than --tolerance.
+"""
+import argparse
+import atexit
+import datetime
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_PATH = os.path.join(BACKEND_DIR, 'bench', 'results.jsonl')
+LOGINS = 50  # distinct users signed in; the other endpoints pick one of them per request
+WORKOUT = [{"id": 1, "muscle_group": "Chest"}, {"id": 2, "muscle_group": "Legs"}, {"id": 4, "muscle_group": "Core"}]
+
+# name -> (method, path, JSON body); {id} is the signed-in user's id. Run in this order,
+# so the endpoints that write come after the reads.
+ENDPOINTS = {
+    'stats': ('GET', '/api/user/{id}/stats', None),
+    'history': ('GET', '/api/user/{id}/history', None),
+    'history_summary': ('GET', '/api/user/{id}/history/summary', None),
+    'quests': ('GET', '/api/user/{id}/quests', None),
+    'friends': ('GET', '/api/user/{id}/friends', None),
+    'friend_suggestions': ('GET', '/api/user/{id}/friends/suggestions', None),
+    'friends_leaderboard': ('GET', '/api/user/{id}/leaderboard', None),
+    'leaderboard': ('GET', '/api/leaderboard', None),
+    'notifications': ('GET', '/api/user/{id}/notifications', None),
+    'generate_workout': ('POST', '/api/workout', {"available_equipment": ["None", "Dumbbells"]}),
+    'complete_workout': ('POST', '/api/workout/complete', {"workout": WORKOUT}),
+}
+
+
+def _environment(data_dir, args):
+    return dict(os.environ, FITNESS_DATA_DIR=data_dir, FITNESS_STORAGE=args.storage, FITNESS_PASSWORD_HASH=args.hash,
+                FITNESS_SQLITE_PATH=os.path.join(data_dir, 'fitness.db'), FITNESS_MULTI_WORKER='1' if args.mode == 'server' else '0')
+
+
+def _prepare(data_dir, args):
+    """Fills the scratch directory and returns the dataset manifest."""
+    env = _environment(data_dir, args)
+    if args.data_dir:
+        shutil.copytree(args.data_dir, data_dir, dirs_exist_ok=True)
+    else:
+        subprocess.run([sys.executable, 'generate_data.py', '--users', str(args.users), '--friendships', str(args.friendships),
+                        '--workouts', str(args.workouts), '--seed', str(args.seed), '--data-dir', data_dir],
+                       cwd=BACKEND_DIR, env=env, check=True, stdout=subprocess.DEVNULL)
+    if args.storage != 'json':
+        command = 'import-sqlite' if args.storage == 'sqlite' else 'shard-users'
+        subprocess.run([sys.executable, 'manage.py', command], cwd=BACKEND_DIR, env=env, check=True, stdout=subprocess.DEVNULL)
+    with open(os.path.join(data_dir, 'dataset.json')) as f: return json.load(f)
+
+
+# --- Transports ---
+class TestClientTransport:
+    """Requests through the Flask test client, in this process."""
+
+    def __init__(self):
+        from app import app
+        self.client = app.test_client()
+
+    def request(self, method, path, body, headers):
+        response = self.client.open(path, method=method, json=body, headers=headers)
+        return response.status_code, response.get_data()
+
+
+class HttpTransport:
+    """Requests over keep-alive HTTP connections, one per thread."""
+
+    def __init__(self, port):
+        self.port = port
+        self.local = threading.local()
+
+    def request(self, method, path, body, headers):
+        for attempt in (1, 2):  # a worker may close an idle connection; reconnect once
+            connection = getattr(self.local, 'connection', None)
+            if connection is None: connection = self.local.connection = http.client.HTTPConnection('127.0.0.1', self.port)
+            try:
+                payload = json.dumps(body) if body is not None else None
+                connection.request(method, path, payload, dict(headers, **({"Content-Type": "application/json"} if payload else {})))
+                response = connection.getresponse()
+                return response.status, response.read()
+            except (http.client.HTTPException, OSError):
+                connection.close()
+                self.local.connection = None
+                if attempt == 2: raise
+
+
+# --- Measurement ---
+def _percentile(sorted_values, fraction):
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+def _measure(transport, count, threads, make_request):
+    """Sends `count` requests from `threads` threads; `make_request(i)` returns
+    (method, path, body, headers). Returns req/s, p50/p99 in ms and the non-2xx count."""
+    def timed(i):
+        method, path, body, headers = make_request(i)
+        started = time.perf_counter()
+        status, _ = transport.request(method, path, body, headers)
+        return time.perf_counter() - started, status
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool: outcomes = list(pool.map(timed, range(count)))
+    elapsed = time.perf_counter() - started
+    latencies = sorted(latency for latency, _ in outcomes)
+    return {"rps": round(count / elapsed, 1), "p50_ms": round(_percentile(latencies, 0.50) * 1000, 3),
+            "p99_ms": round(_percentile(latencies, 0.99) * 1000, 3), "errors": sum(not 200 <= s < 300 for _, s in outcomes)}
+
+
+def run_endpoints(transport, manifest, args):
+    rng = random.Random(args.seed)
+    user_ids = rng.sample(range(1, manifest['users'] + 1), min(LOGINS, manifest['users']))
+    password = manifest['password']
+    login = lambda i: ('POST', '/api/login', {"username": f"user{user_ids[i % len(user_ids)]:07d}", "password": password}, {})
+
+    tokens = {}
+    for i in range(len(user_ids)):
+        status, body = transport.request(*login(i))
+        if status != 200: raise SystemExit(f"Could not sign in user {user_ids[i]}: HTTP {status}")
+        tokens[user_ids[i]] = json.loads(body)['token']
+    results = {'login': _measure(transport, args.requests, args.threads, login)}
+
+    def endpoint_request(method, path, body):
+        def make_request(i):
+            user_id = user_ids[i % len(user_ids)]
+            return method, path.format(id=user_id), body, {"Authorization": f"Bearer {tokens[user_id]}"}
+        return make_request
+
+    for name, (method, path, body) in ENDPOINTS.items():
+        if args.only and name not in args.only: continue
+        make_request = endpoint_request(method, path, body)
+        _measure(transport, args.warmup, args.threads, make_request)
+        results[name] = _measure(transport, args.requests, args.threads, make_request)
+    return results
+
+
+def _run_client(data_dir, args, manifest, results):
+    os.environ.update(_environment(data_dir, args))
+    sys.path.insert(0, BACKEND_DIR)
+    os.chdir(BACKEND_DIR)
+    from events import events
+    results.put(run_endpoints(TestClientTransport(), manifest, args))
+    events.wait_idle()
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def _run_server(data_dir, args, manifest):
+    port = _free_port()
+    command = [sys.executable, '-m', 'gunicorn', '-w', str(args.workers), '--threads', str(args.threads),
+               '-b', f'127.0.0.1:{port}', '--log-level', 'warning', 'app:app']
+    server = subprocess.Popen(command, cwd=BACKEND_DIR, env=_environment(data_dir, args))
+    try:
+        transport = HttpTransport(port)
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                transport.request('GET', '/api/leaderboard', None, {})
+                break
+            except OSError:
+                if server.poll() is not None or time.monotonic() > deadline: raise SystemExit("gunicorn did not start.")
+                time.sleep(0.2)
+        return run_endpoints(transport, manifest, args)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+# --- Results ---
+def _git(*command):
+    try:
+        return subprocess.run(['git', *command], cwd=BACKEND_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _previous_run(path, config):
+    previous = None
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                record = json.loads(line)
+                if record['config'] == config: previous = record
+    return previous
+
+def _report(results, previous, tolerance):
+    """Prints the results next to the previous run's; returns the endpoints that regressed."""
+    regressed = []
+    print(f"{'endpoint':<20} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'errors':>6}   vs previous")
+    for name, r in results.items():
+        before = (previous or {}).get('results', {}).get(name)
+        change = ''
+        if before:
+            p99, rps = r['p99_ms'] / max(before['p99_ms'], 1e-9) - 1, r['rps'] / max(before['rps'], 1e-9) - 1
+            change = f"p99 {p99:+.0%}  req/s {rps:+.0%}"
+            if p99 > tolerance or rps < -tolerance / (1 + tolerance):
+                regressed.append(name)
+                change += '  REGRESSED'
+        print(f"{name:<20} {r['rps']:>9.1f} {r['p50_ms']:>9.2f} {r['p99_ms']:>9.2f} {r['errors']:>6}   {change}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mode', choices=['client', 'server'], default='client',
+                        help="Flask test client in-process, or HTTP against gunicorn.")
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--friendships', type=int, default=10000)
+    parser.add_argument('--workouts', type=int, default=50000)
+    parser.add_argument('--seed', type=int, default=1, help="Dataset seed; also picks the signed-in users.")
+    parser.add_argument('--data-dir', help="Benchmark a copy of this dataset (made by generate_data.py) instead.")
+    parser.add_argument('--storage', choices=['json', 'sharded', 'sqlite'], default='json')
+    parser.add_argument('--hash', default='pbkdf2:sha256:1000', help="Password hash method, cheap so login measures the lookup path.")
+    parser.add_argument('--requests', type=int, default=500, help="Timed requests per endpoint.")
+    parser.add_argument('--warmup', type=int, default=20, help="Untimed requests per endpoint first.")
+    parser.add_argument('--threads', type=int, default=4, help="Concurrent requests (and gunicorn threads per worker).")
+    parser.add_argument('--workers', type=int, default=4, help="gunicorn worker processes (server mode).")
+    parser.add_argument('--only', nargs='+', choices=list(ENDPOINTS), help="Endpoints to run besides login.")
+    parser.add_argument('--results', default=RESULTS_PATH, help="JSON Lines file the run is appended to.")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed slowdown against the previous run.")
+    parser.add_argument('--check', action='store_true', help="Exit non-zero if any endpoint regressed.")
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix='fitness-endpoints-')
+    atexit.register(shutil.rmtree, data_dir, True)
+    manifest = _prepare(data_dir, args)
+    if args.mode == 'server':
+        results = _run_server(data_dir, args, manifest)
+    else:
+        queue = multiprocessing.get_context('spawn').Queue()  # fresh interpreter: the app's stores are process-wide
+        process = multiprocessing.get_context('spawn').Process(target=_run_client, args=(data_dir, args, manifest, queue))
+        process.start()
+        results = queue.get()
+        process.join()
+
+    config = {"mode": args.mode, "storage": args.storage, "hash": args.hash, "requests": args.requests, "threads": args.threads,
+              "workers": args.workers if args.mode == 'server' else None, "only": args.only,
+              "dataset": {k: manifest[k] for k in ('users', 'friendships', 'workouts', 'seed', 'days')}}
+    previous = _previous_run(args.results, config)
+    print(f"{args.mode} mode, {args.storage} storage, {manifest['users']} users, {manifest['friendships']} friendships, "
+          f"{manifest['workouts']} workouts" + (f"; previous run at {previous['commit'][:10]}" if previous and previous['commit'] else ''))
+    regressed = _report(results, previous, args.tolerance)
+
+    record = {"date": datetime.datetime.utcnow().replace(microsecond=0).isoformat(), "commit": _git('rev-parse', 'HEAD'),
+              "dirty": bool(_git('status', '--porcelain', '--untracked-files=no')), "config": config, "results": results}
+    os.makedirs(os.path.dirname(os.path.abspath(args.results)), exist_ok=True)
+    with open(args.results, 'a') as f: f.write(json.dumps(record) + '\n')
+    if args.check and regressed: sys.exit(f"Regressed: {', '.join(regressed)}")
+
+
+if __name__ == '__main__':
+    main()
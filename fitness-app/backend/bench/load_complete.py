@@ -0,0 +1,118 @@
+"""Concurrency load test for POST /api/workout/complete.
+
+Fires N workout completions for the same user from several worker processes at once,
+each with several threads, against a scratch copy of the data directory, then checks
+that every completion's XP, log entry and background reward processing made it to disk:
+
+    python3 bench/load_complete.py --workers 4 --threads 4 --requests 200
+    python3 bench/load_complete.py --storage sqlite
+    python3 bench/load_complete.py --storage sharded
+
+Exits non-zero if any update was lost.
+"""
+import argparse
+import atexit
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKOUT = [{"id": 1, "muscle_group": "Chest"}, {"id": 2, "muscle_group": "Legs"}, {"id": 4, "muscle_group": "Core"}]
+
+
+def _configure(data_dir, storage_backend):
+    os.environ.update({"FITNESS_DATA_DIR": data_dir, "FITNESS_STORAGE": storage_backend,
+                       "FITNESS_SQLITE_PATH": os.path.join(data_dir, 'fitness.db'), "FITNESS_MULTI_WORKER": "1"})
+    sys.path.insert(0, BACKEND_DIR)
+
+
+def _worker(data_dir, storage_backend, user_id, threads, count, results):
+    _configure(data_dir, storage_backend)
+    from app import app
+    from events import events
+    from sessions import sessions
+    from storage import storage
+    client = app.test_client()
+    headers = {"Authorization": "Bearer " + sessions.issue(storage.get_user(user_id))}
+
+    def complete(_):
+        response = client.post('/api/workout/complete', json={"workout": WORKOUT}, headers=headers)
+        return response.status_code, (response.get_json() or {}).get('xp_gained', 0)
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results.extend(list(pool.map(complete, range(count))))
+    events.wait_idle()  # rewards and aggregates are applied by the event workers
+
+
+def total_xp(user, level_xp_map):
+    """XP earned since level 1, independent of how it was split across level-ups."""
+    return sum(level_xp_map.get(level, 1000) for level in range(1, user['level'])) + user['xp']
+
+
+def bonus_xp(history):
+    """Quest XP awarded in the background, logged as reward entries."""
+    return sum(e['xp_gained'] for e in history if e.get('kind') == 'reward')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4, help="Worker processes (like gunicorn -w).")
+    parser.add_argument('--threads', type=int, default=4, help="Concurrent requests per worker.")
+    parser.add_argument('--requests', type=int, default=200, help="Total completions to send.")
+    parser.add_argument('--storage', choices=['json', 'sharded', 'sqlite'], default='json')
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix='fitness-load-')
+    atexit.register(shutil.rmtree, data_dir, True)  # registered first, so it runs after the app's own exit hooks
+    shutil.copytree(os.path.join(BACKEND_DIR, 'data'), data_dir, dirs_exist_ok=True)
+    _configure(data_dir, args.storage)
+    from app import LEVEL_XP_MAP
+    from storage import create_storage, import_json_into_sqlite, shard_json_users, JsonStorage
+    if args.storage == 'sqlite': import_json_into_sqlite(JsonStorage(), create_storage('sqlite'))
+    if args.storage == 'sharded': shard_json_users(JsonStorage(), data_dir)
+
+    storage = create_storage(args.storage)
+    user = storage.get_user(2)
+    xp_before, logs_before = total_xp(user, LEVEL_XP_MAP), len(storage.workout_history(2))
+    bonus_before = bonus_xp(storage.workout_history(2, include_rewards=True))
+
+    per_worker = [args.requests // args.workers + (i < args.requests % args.workers) for i in range(args.workers)]
+    context = multiprocessing.get_context('spawn')  # fresh interpreters, like separate gunicorn workers
+    with context.Manager() as manager:
+        results = manager.list()
+        started = time.perf_counter()
+        processes = [context.Process(target=_worker, args=(data_dir, args.storage, 2, args.threads, n, results))
+                     for n in per_worker]
+        for p in processes: p.start()
+        for p in processes: p.join()
+        elapsed = time.perf_counter() - started
+        results = list(results)
+
+    storage = create_storage(args.storage)  # fresh instance: read what actually reached disk
+    if args.storage == 'json': storage.store.reload()
+    user = storage.get_user(2)
+    failures = [status for status, _ in results if status != 200]
+    bonus = bonus_xp(storage.workout_history(2, include_rewards=True)) - bonus_before
+    xp_expected = xp_before + sum(xp for status, xp in results if status == 200) + bonus
+    logs_expected = logs_before + len(results) - len(failures)
+    xp_after, logs_after = total_xp(user, LEVEL_XP_MAP), len(storage.workout_history(2))
+    counted = user['aggregates']['total_workouts']
+
+    print(f"{len(results)} completions in {elapsed:.2f}s ({len(results) / elapsed:.0f}/s), "
+          f"{args.workers} workers x {args.threads} threads, storage={args.storage}")
+    print(f"  XP:          expected {xp_expected} (incl. {bonus} bonus), found {xp_after}")
+    print(f"  Log entries: expected {logs_expected}, found {logs_after} (aggregates count {counted})")
+    unprocessed = [name for name in os.listdir(data_dir) if name.startswith('events-')]
+    print(f"  Event journals left behind: {len(unprocessed)}")
+    ok = (not failures and len(results) == args.requests and xp_after == xp_expected and
+          logs_after == logs_expected == counted and not unprocessed)
+    print("  OK: no lost updates." if ok else f"  FAILED ({len(failures)} non-200 responses).")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
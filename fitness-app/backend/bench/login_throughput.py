@@ -0,0 +1,94 @@
+"""Login throughput benchmark: POST /api/login against growing numbers of users.
+
+For each user count, builds a scratch data directory with that many accounts, then
+measures username lookups (indexed vs. the old full scan) and end-to-end logins from
+several threads through the bounded hashing pool:
+
+    python3 bench/login_throughput.py --users 1000 10000 100000
+    python3 bench/login_throughput.py --storage sqlite --hash scrypt --threads 8
+
+The default hash method is deliberately cheap so the numbers show the lookup path;
+pass --hash scrypt to see the production hashing cost instead.
+"""
+import argparse
+import atexit
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PASSWORD = 'correct horse battery staple'
+
+
+def _prepare(data_dir, user_count, method):
+    from werkzeug.security import generate_password_hash
+    shutil.copytree(os.path.join(BACKEND_DIR, 'data'), data_dir, dirs_exist_ok=True)
+    password_hash = generate_password_hash(PASSWORD, method)
+    users = [{"id": i, "username": f"User{i:07d}", "password_hash": password_hash, "goals": "", "available_equipment": ["None"],
+              "level": 1, "xp": 0, "streak_count": 0, "last_workout_date": None, "unlocked_badges": [], "completed_quests": []}
+             for i in range(1, user_count + 1)]
+    with open(os.path.join(data_dir, 'users.json'), 'w') as f: json.dump(users, f)
+    with open(os.path.join(data_dir, 'friends_data.json'), 'w') as f: json.dump([], f)
+
+
+def _run(data_dir, storage_backend, user_count, method, threads, logins, results):
+    os.environ.update({"FITNESS_DATA_DIR": data_dir, "FITNESS_STORAGE": storage_backend, "FITNESS_PASSWORD_HASH": method,
+                       "FITNESS_SQLITE_PATH": os.path.join(data_dir, 'fitness.db'), "FITNESS_HASH_QUEUE": str(logins)})
+    sys.path.insert(0, BACKEND_DIR)
+    from app import app
+    from storage import JsonStorage, import_json_into_sqlite, storage
+    if storage_backend == 'sqlite': import_json_into_sqlite(JsonStorage(), storage)
+
+    names = [f"user{random.randint(1, user_count):07d}" for _ in range(logins)]  # lookups are case-insensitive
+    storage.find_user_by_username(names[0])  # build the index outside the timings
+    started = time.perf_counter()
+    for name in names: storage.find_user_by_username(name)
+    indexed = (time.perf_counter() - started) / logins
+
+    users, scans = storage.list_users(), names[:20]
+    started = time.perf_counter()
+    for name in scans: next((u for u in users if u['username'].lower() == name.lower()), None)
+    scanned = (time.perf_counter() - started) / len(scans)
+
+    client = app.test_client()
+    def login(name):
+        return client.post('/api/login', json={"username": name, "password": PASSWORD}).status_code
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool: statuses = list(pool.map(login, names))
+    elapsed = time.perf_counter() - started
+    results.put((user_count, indexed, scanned, logins / elapsed, sum(s != 200 for s in statuses)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, nargs='+', default=[100, 1000, 10000, 100000], help="User counts to test.")
+    parser.add_argument('--logins', type=int, default=200, help="Logins per user count.")
+    parser.add_argument('--threads', type=int, default=4, help="Concurrent login requests.")
+    parser.add_argument('--hash', default='pbkdf2:sha256:1000', help="Werkzeug hash method for the test accounts.")
+    parser.add_argument('--storage', choices=['json', 'sqlite'], default='json')
+    args = parser.parse_args()
+
+    print(f"storage={args.storage} hash={args.hash} threads={args.threads} logins={args.logins}")
+    print(f"{'users':>8}  {'indexed lookup':>15}  {'full scan':>12}  {'logins/s':>9}  failed")
+    context = multiprocessing.get_context('spawn')  # fresh interpreter per size: the app's stores are process-wide
+    for user_count in args.users:
+        data_dir = tempfile.mkdtemp(prefix='fitness-login-')
+        atexit.register(shutil.rmtree, data_dir, True)
+        _prepare(data_dir, user_count, args.hash)
+        results = context.Queue()
+        process = context.Process(target=_run, args=(data_dir, args.storage, user_count, args.hash,
+                                                     args.threads, args.logins, results))
+        process.start()
+        user_count, indexed, scanned, rate, failed = results.get()
+        process.join()
+        print(f"{user_count:>8}  {indexed * 1e6:>12.1f} us  {scanned * 1e3:>9.2f} ms  {rate:>9.0f}  {failed}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+import threading
+from collections import defaultdict
+
+from store import store
+
+# --- Catalog Configuration ---
+# Bit positions are persisted in the workout log, so only ever append to this list.
+MUSCLE_GROUPS = ['Chest', 'Legs', 'Back', 'Core', 'Arms', 'Shoulders', 'Cardio']
+MUSCLE_GROUP_BITS = {group: 1 << i for i, group in enumerate(MUSCLE_GROUPS)}
+# Easiest first; exercises with an unknown difficulty are treated as the easiest.
+DIFFICULTIES = ['Beginner', 'Intermediate', 'Advanced']
+
+
+def muscle_mask(groups):
+    """Returns the bitmask for a muscle group name or a list of names."""
+    if isinstance(groups, str): groups = [groups]
+    mask = 0
+    for group in groups: mask |= MUSCLE_GROUP_BITS.get(group, 0)
+    return mask
+
+def muscle_groups(mask):
+    return [group for group, bit in MUSCLE_GROUP_BITS.items() if mask & bit]
+
+
+def difficulty_rank(exercise):
+    difficulty = exercise.get('difficulty')
+    return DIFFICULTIES.index(difficulty) if difficulty in DIFFICULTIES else 0
+
+
+class CandidatePool:
+    """The exercises available for one equipment set (and difficulty cap), flat and
+    bucketed by muscle group."""
+
+    def __init__(self, exercises):
+        self.exercises = exercises
+        self.by_muscle_group = defaultdict(list)
+        for ex in exercises: self.by_muscle_group[ex.get('muscle_group')].append(ex)
+        self.by_muscle_group = dict(self.by_muscle_group)
+
+
+# --- In-Memory Exercise Catalog ---
+class ExerciseCatalog:
+    """Indexed view of exercises.json, rebuilt only when the store hands back a new list.
+
+    Besides the id index, exercises are bucketed by equipment. Each distinct set of
+    equipment a user has maps to a bitmask, and the candidate pool for that mask (and
+    difficulty cap) is built from the buckets once and then cached until the catalog changes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._source = None
+        self.by_id = {}
+        self.by_equipment = {}
+        self.equipment_bits = {}
+        self._pools = {}
+
+    def _refresh(self):
+        exercises = store.get('exercises.json')
+        if exercises is not self._source:
+            with self._lock:
+                if exercises is not self._source:
+                    by_equipment = defaultdict(list)
+                    for ex in exercises: by_equipment[ex.get('equipment')].append(ex)
+                    self.by_equipment = dict(by_equipment)
+                    self.equipment_bits = {name: 1 << i for i, name in enumerate(sorted(by_equipment, key=str))}
+                    self._pools = {}
+                    self.by_id = {ex['id']: ex for ex in exercises}
+                    self._source = exercises
+        return self.by_id
+
+    def get(self, exercise_id):
+        return self._refresh().get(exercise_id)
+
+    def all(self):
+        return list(self._refresh().values())
+
+    # --- Candidate Pools ---
+    def equipment_mask(self, equipment):
+        self._refresh()
+        return self._equipment_mask(equipment)
+
+    def _equipment_mask(self, equipment):
+        mask = 0
+        for name in equipment: mask |= self.equipment_bits.get(name, 0)
+        return mask
+
+    def candidates(self, equipment, max_difficulty=None):
+        """Returns the cached CandidatePool of exercises needing only the given equipment,
+        optionally capped at a difficulty from DIFFICULTIES."""
+        self._refresh()
+        with self._lock:  # a rebuild swaps the buckets and the pool cache together
+            key = (self._equipment_mask(equipment), max_difficulty)
+            pool = self._pools.get(key)
+            if pool is None:
+                cap = DIFFICULTIES.index(max_difficulty) if max_difficulty in DIFFICULTIES else len(DIFFICULTIES)
+                exercises = [ex for name, bit in self.equipment_bits.items() if key[0] & bit
+                             for ex in self.by_equipment[name] if difficulty_rank(ex) <= cap]
+                pool = self._pools[key] = CandidatePool(exercises)
+            return pool
+
+    # --- Workout Log Entries ---
+    @staticmethod
+    def exercise_ids(workout):
+        """Returns the exercise ids of a submitted workout: a list of exercise objects or
+        bare ids. Raises ValueError if it is not one."""
+        if workout is None: return []
+        if not isinstance(workout, list): raise ValueError("'workout' must be a list of exercises.")
+        ids = [ex.get('id') if isinstance(ex, dict) else ex for ex in workout]
+        if not all(isinstance(ex_id, (int, str)) and not isinstance(ex_id, bool) for ex_id in ids):
+            raise ValueError("Each exercise needs an 'id'.")
+        return ids
+
+    def shrink_entry(self, entry):
+        """Converts a log entry to its compact form: exercise ids plus a muscle-group bitmask
+        instead of full exercise objects. Already-compact entries pass through unchanged.
+        Raises ValueError if the workout is malformed (see exercise_ids)."""
+        if 'workout' not in entry: return entry
+        workout = entry.get('workout') or []
+        ids = self.exercise_ids(workout)
+        by_id = self._refresh()
+        groups = [(by_id.get(ex_id) or (ex if isinstance(ex, dict) else {})).get('muscle_group') for ex_id, ex in zip(ids, workout)]
+        return {"userId": entry['userId'], "date": entry['date'], "exercise_ids": ids,
+                "muscle_mask": muscle_mask([g for g in groups if g]), "xp_gained": entry['xp_gained']}
+
+    def expand_entry(self, entry):
+        """Rehydrates a compact log entry into the `workout` shape the API has always returned."""
+        if 'workout' in entry: return entry
+        by_id = self._refresh()
+        workout = [by_id.get(ex_id) or {"id": ex_id, "name": "Removed exercise"} for ex_id in entry['exercise_ids']]
+        return {"userId": entry['userId'], "date": entry['date'], "workout": workout, "xp_gained": entry['xp_gained']}
+
+
+catalog = ExerciseCatalog()
@@ -0,0 +1,208 @@
+import atexit
+import json
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+
+from metrics import registry
+from store import DATA_DIR
+
+# --- Event Bus Configuration ---
+# Worker threads handling published events. 0 runs handlers inline, inside `publish`.
+EVENT_WORKERS = int(os.environ.get('FITNESS_EVENT_WORKERS', '2'))
+HANDLER_ATTEMPTS = 3  # tries per handler before an event is set aside for the next start
+RETRY_DELAY = 0.5     # seconds, doubled after each failed try
+JOURNAL_COMPACT_SIZE = 1024 * 1024  # bytes; a journal with nothing pending is emptied beyond this
+DRAIN_TIMEOUT = 5.0   # seconds to finish queued events on shutdown; the rest are replayed on the next start
+JOURNAL_PATTERN = re.compile(r'^events-(\d+)(\.\w+)?\.jsonl$')
+
+HANDLER_SECONDS = registry.histogram('fitness_event_handler_seconds', 'Time spent handling a published event.', ('type',))
+HANDLER_FAILURES = registry.counter('fitness_event_failures_total', 'Events set aside after HANDLER_ATTEMPTS tries.', ('type',))
+
+
+def _process_alive(pid):
+    if pid == os.getpid(): return False  # our pid, left behind by an earlier process that had it
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+# --- In-Process Event Bus ---
+class EventBus:
+    """Publish/subscribe with a pool of worker threads and a write-ahead journal.
+
+    `publish` appends the event to this process's journal (events-<pid>.jsonl in the data
+    directory) and queues it; a worker runs every handler subscribed to its type and then
+    appends an ack. Events with the same `key` always go to the same worker, so they are
+    handled in the order they were published.
+
+    If a process dies with events still queued, the next process to start takes over its
+    journal and replays whatever was never acked. An event can therefore be handled twice
+    (the process died after the handler ran but before the ack), so handlers must be
+    idempotent.
+
+    An event whose handler still fails after HANDLER_ATTEMPTS tries is not dropped: it is
+    moved, unacked, to events-<pid>.failed.jsonl, which the next process to start replays
+    like any other orphaned journal.
+    """
+
+    def __init__(self, data_dir=DATA_DIR, workers=EVENT_WORKERS):
+        self.data_dir = data_dir
+        self.workers = workers
+        self.path = self.failed_path = None
+        self._handlers = defaultdict(list)
+        self._queues = [queue.Queue() for _ in range(workers)]
+        self._threads = []
+        self._journal_lock = threading.Lock()
+        self._pending = 0
+        self._in_flight = Counter()  # key -> events queued or being handled
+        self._handled = threading.Condition()
+
+    def subscribe(self, event_type, handler):
+        """Registers `handler(event)` for events of `event_type`. An event is a dict with
+        'id', 'type', 'key' and 'payload'."""
+        self._handlers[event_type].append(handler)
+
+    def publish(self, event_type, payload, key=None):
+        """Records and queues an event; returns its id. With no workers the handlers run
+        before this returns."""
+        event = {"id": uuid.uuid4().hex, "type": event_type, "key": key, "payload": payload}
+        self._enqueue(event)
+        return event['id']
+
+    def start(self):
+        """Starts the workers and replays events left unacked by processes that are gone."""
+        if self.path is not None: return
+        self.path = os.path.join(self.data_dir, f'events-{os.getpid()}.jsonl')
+        self.failed_path = os.path.join(self.data_dir, f'events-{os.getpid()}.failed.jsonl')
+        recovered, claimed = self._claim_orphaned_journals()
+        for i, q in enumerate(self._queues):
+            thread = threading.Thread(target=self._work, args=(q,), name=f'event-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        for event in recovered: self._enqueue(event)  # re-journaled here before the old files go
+        for path in claimed: os.remove(path)
+
+    def wait_idle(self):
+        """Blocks until every queued event has been handled."""
+        for q in self._queues: q.join()
+
+    def wait_for(self, key, timeout=DRAIN_TIMEOUT):
+        """Blocks until every event queued so far with `key` has been handled, for up to
+        `timeout` seconds; returns False if some are still waiting. Only sees this
+        process's queues."""
+        with self._handled:
+            return self._handled.wait_for(lambda: not self._in_flight[key], timeout)
+
+    def close(self, timeout=DRAIN_TIMEOUT):
+        """Lets the workers finish what is queued (for up to `timeout` seconds) and stops them."""
+        for q in self._queues: q.put(None)
+        deadline = time.monotonic() + timeout
+        for thread in self._threads: thread.join(max(deadline - time.monotonic(), 0))
+        with self._journal_lock:
+            if self.path and not self._pending and os.path.exists(self.path): os.remove(self.path)
+
+    # --- Dispatch ---
+    def _enqueue(self, event):
+        if self.path is None: self.start()
+        if not self._queues:
+            if not self._dispatch(event): self._set_aside(event)
+            return
+        self._journal({"event": event}, pending=1)
+        with self._handled: self._in_flight[event['key']] += 1
+        self._queues[hash(event['key']) % len(self._queues)].put(event)
+
+    def _work(self, q):
+        while True:
+            event = q.get()
+            try:
+                if event is None: return
+                if not self._dispatch(event): self._set_aside(event)
+                self._journal({"ack": event['id']}, pending=-1)
+            finally:
+                if event is not None: self._handled_one(event['key'])
+                q.task_done()
+
+    def _handled_one(self, key):
+        with self._handled:
+            self._in_flight[key] -= 1
+            if not self._in_flight[key]: del self._in_flight[key]
+            self._handled.notify_all()
+
+    def _dispatch(self, event):
+        """Runs every handler for `event`, retrying each; returns False if one kept failing."""
+        ok = True
+        for handler in self._handlers.get(event['type'], ()):
+            delay = RETRY_DELAY
+            for attempt in range(1, HANDLER_ATTEMPTS + 1):
+                try:
+                    with HANDLER_SECONDS.time(type=event['type']): handler(event)
+                    break
+                except Exception as e:
+                    if attempt == HANDLER_ATTEMPTS:
+                        HANDLER_FAILURES.inc(type=event['type'])
+                        print(f"  [ERROR] Event {event['type']} {event['id']} failed in {handler.__name__}: {e!r}")
+                        ok = False
+                    else:
+                        time.sleep(delay)
+                        delay *= 2
+        return ok
+
+    def _set_aside(self, event):
+        """Keeps a failed event unacked in this process's failed-events journal, so it is
+        replayed (every handler again) once this process is gone. Written before the event
+        is acked in the main journal."""
+        with self._journal_lock:
+            with open(self.failed_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({"event": event}, separators=(',', ':')) + '\n')
+
+    # --- Journal ---
+    def _journal(self, record, pending):
+        """Appends one record to this process's journal in a single O_APPEND write. Once
+        nothing is pending and the file has grown past JOURNAL_COMPACT_SIZE it is emptied."""
+        line = (json.dumps(record, separators=(',', ':')) + '\n').encode('utf-8')
+        with self._journal_lock:
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line)
+                self._pending += pending
+                if not self._pending and os.fstat(fd).st_size > JOURNAL_COMPACT_SIZE: os.ftruncate(fd, 0)
+            finally:
+                os.close(fd)
+
+    def _claim_orphaned_journals(self):
+        """Takes over the journals of dead processes. Returns their unacked events, in
+        publish order, and the claimed files to delete once those are queued. A journal is
+        claimed by renaming it, so when several processes start at once each orphaned
+        journal is replayed by exactly one of them."""
+        events, claimed_paths = [], []
+        for name in sorted(os.listdir(self.data_dir)):
+            match = JOURNAL_PATTERN.match(name)
+            if not match or _process_alive(int(match.group(1))): continue
+            claimed = os.path.join(self.data_dir, f'events-{os.getpid()}.{uuid.uuid4().hex[:8]}.jsonl')
+            try:
+                os.rename(os.path.join(self.data_dir, name), claimed)
+            except FileNotFoundError:
+                continue  # another process claimed it first
+            pending = {}
+            with open(claimed, 'rb') as f:
+                for line in f:
+                    if not line.endswith(b'\n'): break  # cut off mid-write
+                    record = json.loads(line)
+                    if 'event' in record: pending[record['event']['id']] = record['event']
+                    else: pending.pop(record['ack'], None)
+            events.extend(pending.values())
+            claimed_paths.append(claimed)
+        return events, claimed_paths
+
+
+events = EventBus()
+atexit.register(events.close)
@@ -0,0 +1,84 @@
+from collections import Counter, defaultdict
+
+
+def username_key(username):
+    """Usernames are unique and matched case-insensitively (Unicode case folding)."""
+    return (username or '').casefold()
+
+
+# --- Friendship Graph Index ---
+class FriendGraph:
+    """Adjacency-list index over users.json and friends_data.json for the JSON backend.
+
+    Keeps id -> user and case-folded username -> user maps plus per-user sets of accepted friends and incoming/outgoing
+    pending requests, so friend lookups cost O(degree) instead of scanning every
+    relationship and then every user. JsonStorage applies each mutation here as it makes
+    it, and rebuilds the whole index when the underlying collections are replaced (e.g.
+    reloaded after another worker process changed them).
+    """
+
+    def __init__(self, users, relationships):
+        self.users_source = users
+        self.relationships_source = relationships
+        self.users = {}
+        self.by_username = {}
+        self.accepted = defaultdict(set)
+        self.incoming = defaultdict(set)   # receiver -> requesters with pending requests
+        self.outgoing = defaultdict(set)   # requester -> receivers with pending requests
+        self.edges = {}                    # (requester_id, receiver_id) -> relationship
+        for user in users: self.add_user(user)
+        for rel in relationships: self.add(rel)
+
+    def is_current(self, users, relationships):
+        return users is self.users_source and relationships is self.relationships_source
+
+    # --- Mutations ---
+    def add_user(self, user):
+        previous = self.users.get(user['id'])
+        if previous is not None: self.by_username.pop(username_key(previous['username']), None)
+        self.users[user['id']] = user
+        self.by_username[username_key(user['username'])] = user
+
+    def add(self, rel):
+        requester, receiver = rel['requester_id'], rel['receiver_id']
+        self.edges[(requester, receiver)] = rel
+        if rel['status'] == 'accepted':
+            self.accepted[requester].add(receiver)
+            self.accepted[receiver].add(requester)
+        else:
+            self.outgoing[requester].add(receiver)
+            self.incoming[receiver].add(requester)
+
+    def remove(self, rel):
+        requester, receiver = rel['requester_id'], rel['receiver_id']
+        self.edges.pop((requester, receiver), None)
+        self.accepted[requester].discard(receiver)
+        self.accepted[receiver].discard(requester)
+        self.outgoing[requester].discard(receiver)
+        self.incoming[receiver].discard(requester)
+
+    def update(self, rel):
+        """Re-indexes a relationship whose status changed (e.g. pending -> accepted)."""
+        self.remove(rel)
+        self.add(rel)
+
+    # --- Queries ---
+    def relationship(self, user_a, user_b):
+        return self.edges.get((user_a, user_b)) or self.edges.get((user_b, user_a))
+
+    def relationships_for(self, user_id):
+        return ([self.relationship(user_id, other) for other in self.accepted.get(user_id, ())] +
+                [self.edges[(user_id, other)] for other in self.outgoing.get(user_id, ())] +
+                [self.edges[(other, user_id)] for other in self.incoming.get(user_id, ())])
+
+    def friend_ids(self, user_id):
+        return set(self.accepted.get(user_id, ()))
+
+    def suggestions(self, user_id, limit):
+        """Friends-of-friends ranked by number of mutual friends, excluding anyone the user
+        is already friends with or has a pending request to/from."""
+        friends = self.accepted.get(user_id, set())
+        excluded = friends | self.incoming.get(user_id, set()) | self.outgoing.get(user_id, set()) | {user_id}
+        mutual = Counter(fof for friend in friends for fof in self.accepted.get(friend, ()) if fof not in excluded)
+        ranked = sorted(mutual.items(), key=lambda item: (-item[1], item[0]))
+        return [(self.users[uid], count) for uid, count in ranked if uid in self.users][:limit]
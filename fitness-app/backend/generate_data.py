@@ -1,5 +1,18 @@
+import argparse
 import json
 import os
+import random
+import shutil
+from datetime import datetime, timedelta
+
+# --- Synthetic Data Configuration ---
+HISTORY_DAYS = 365          # synthetic workouts are spread over this many days before now
+ACCEPTED_SHARE = 0.85       # share of synthetic friendships that are accepted (the rest are pending)
+SYNTHETIC_PASSWORD = 'password'  # every synthetic user's password
+MANIFEST_FILENAME = 'dataset.json'
+REFERENCE_FILES = ('badges.json', 'quests.json')  # copied from data/ so the app has rules to evaluate
+SOURCE_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+SYNTHETIC_DATA_DIR = 'data-synthetic'  # default output; never the app's own data/
 
 def create_exercise_data():
     """Creates and saves a list of sample exercises to a JSON file."""
@@ -91,18 +104,18 @@ def create_exercise_data():
     print("-> Successfully created data/exercises.json")
 
 def create_user_data():
-    """Creates a sample user for testing purposes."""
-    
-    # In a real application, passwords should always be hashed for security.
-    # This is just a placeholder for the prototype.
+    """Creates a sample user (password: password123) for testing purposes."""
+    from werkzeug.security import generate_password_hash
+
     users = [
         {
             "id": 1, 
             "username": "testuser", 
-            "password": "password123", # WARNING: Not secure! For demo only.
+            "password_hash": generate_password_hash("password123"),
             "goals": "Build Strength", 
             "available_equipment": ["None", "Dumbbells"], 
-            "preferred_style": "Strength Training"
+            "level": 1, "xp": 0, "streak_count": 0, "last_workout_date": None,
+            "unlocked_badges": [], "completed_quests": []
         }
     ]
     
@@ -123,11 +136,125 @@ def initialize_progress_data():
     print("-> Successfully created data/user_progress.json")
 
 
+# --- Synthetic Data at Scale ---
+def _write_json_array(path, items):
+    """Writes an iterable as a JSON array one item at a time, so it never sits in memory as one string."""
+    with open(path, 'w') as f:
+        f.write('[')
+        for i, item in enumerate(items):
+            if i: f.write(',')
+            f.write(json.dumps(item, separators=(',', ':')))
+        f.write(']')
+
+def _streak(dates):
+    """Consecutive days, ending at the last one, among sorted workout dates."""
+    days = sorted({d[:10] for d in dates}, reverse=True)
+    streak = 1
+    for newer, older in zip(days, days[1:]):
+        if datetime.fromisoformat(newer) - datetime.fromisoformat(older) != timedelta(days=1): break
+        streak += 1
+    return streak
+
+def _workout_counts(rng, users, workouts):
+    """Splits `workouts` over `users` with a long tail: a few very active users, many light ones."""
+    weights = [rng.paretovariate(1.2) for _ in range(users)]
+    scale = workouts / sum(weights)
+    counts = [int(w * scale) for w in weights]
+    for _ in range(workouts - sum(counts)): counts[rng.randrange(users)] += 1
+    return counts
+
+def generate_synthetic(data_dir, users, friendships, workouts, seed, days=HISTORY_DAYS):
+    """Writes a complete data directory in the current schema: users (with aggregates),
+    friendships and the append-only workout log with its index. History ends at the start of
+    the current UTC day, so the same arguments on the same day produce the same data (apart
+    from the password hash's salt). Usernames are user0000001, user0000002, ...; every password is
+    SYNTHETIC_PASSWORD. Raises ValueError for the app's own data directory, which it would
+    otherwise overwrite."""
+    if os.path.realpath(data_dir) == os.path.realpath(SOURCE_DATA_DIR):
+        raise ValueError(f"{data_dir} is the app's own data directory; choose another --data-dir.")
+    os.makedirs(data_dir, exist_ok=True)
+    for name in ('exercises.json',) + REFERENCE_FILES:
+        shutil.copy(os.path.join(SOURCE_DATA_DIR, name), os.path.join(data_dir, name))
+    for name in ('user_progress.json', 'user_progress.jsonl', 'user_progress.idx.json', 'fitness.db'):
+        if os.path.exists(os.path.join(data_dir, name)): os.remove(os.path.join(data_dir, name))
+    os.environ['FITNESS_DATA_DIR'] = data_dir  # before the app modules below read it
+    import aggregates
+    from catalog import catalog
+    from passwords import hasher
+    from workout_log import WorkoutLog
+
+    rng = random.Random(seed)
+    now = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    exercises = catalog.all()
+    password_hash = hasher.hash(SYNTHETIC_PASSWORD)
+    counts = _workout_counts(rng, users, workouts)
+    log = WorkoutLog(data_dir)
+
+    def user_records():
+        for user_id, count in enumerate(counts, start=1):
+            dates = sorted(now - timedelta(seconds=rng.randrange(days * 86400)) for _ in range(count))
+            history = []
+            for when in dates:
+                picked = rng.sample(exercises, rng.randint(3, min(6, len(exercises))))
+                history.append(catalog.shrink_entry({"userId": user_id, "date": when.isoformat(),
+                                                     "workout": [ex['id'] for ex in picked], "xp_gained": 50 + 5 * len(picked)}))
+            if history: log.append_many(history)
+            yield {"id": user_id, "username": f"user{user_id:07d}", "password_hash": password_hash,
+                   "goals": rng.choice(["Build Strength", "Lose Weight", "Improve Endurance"]),
+                   "available_equipment": ["None"] + rng.sample(["Dumbbells", "Barbell", "Pull-up Bar"], rng.randint(0, 3)),
+                   "level": min(1 + count // 8, 10), "xp": rng.randrange(100),  # approximate: not replayed from the log
+                   "streak_count": _streak([e['date'] for e in history]) if history else 0,
+                   "last_workout_date": history[-1]['date'][:10] if history else None,
+                   "unlocked_badges": [], "completed_quests": [], "aggregates": aggregates.rebuild(history, now)}
+
+    _write_json_array(os.path.join(data_dir, 'users.json'), user_records())
+    log.save_index()
+
+    friendships = min(friendships, users * (users - 1) // 2)
+    pairs = set()
+    while len(pairs) < friendships:
+        a, b = rng.randrange(1, users + 1), rng.randrange(1, users + 1)
+        if a != b: pairs.add((min(a, b), max(a, b)))
+
+    def relationships():
+        for a, b in sorted(pairs):
+            requester, receiver = (a, b) if rng.random() < 0.5 else (b, a)
+            if rng.random() < ACCEPTED_SHARE:
+                since = now - timedelta(seconds=rng.randrange(days * 86400))
+                yield {"requester_id": requester, "receiver_id": receiver, "status": "accepted", "since": since.isoformat()}
+            else:
+                yield {"requester_id": requester, "receiver_id": receiver, "status": "pending"}
+
+    _write_json_array(os.path.join(data_dir, 'friends_data.json'), relationships())
+    manifest = {"users": users, "friendships": friendships, "workouts": workouts, "seed": seed, "days": days,
+                "password": SYNTHETIC_PASSWORD, "generated_at": now.isoformat()}
+    with open(os.path.join(data_dir, MANIFEST_FILENAME), 'w') as f: json.dump(manifest, f, indent=4)
+    return manifest
+
+
 # This standard Python construct ensures that the functions are called
 # only when the script is executed directly.
 if __name__ == '__main__':
-    print("Generating initial data for the fitness application...")
-    create_exercise_data()
-    create_user_data()
-    initialize_progress_data()
-    print("✅ All data files have been created.")
+    parser = argparse.ArgumentParser(description="Creates the fitness app's data files. With --users, generates a "
+                                                 "synthetic dataset of that size instead of the sample data.")
+    parser.add_argument('--users', type=int, help="Synthetic users to create, e.g. 100000.")
+    parser.add_argument('--friendships', type=int, default=0, help="Synthetic friendships (pairs of users), e.g. 1000000.")
+    parser.add_argument('--workouts', type=int, default=0, help="Synthetic logged workouts, e.g. 10000000.")
+    parser.add_argument('--seed', type=int, default=1, help="Random seed; the same seed and sizes give the same data.")
+    parser.add_argument('--days', type=int, default=HISTORY_DAYS, help="Days of history to spread workouts over.")
+    parser.add_argument('--data-dir', default=SYNTHETIC_DATA_DIR,
+                        help=f"Directory to write (synthetic mode only; default {SYNTHETIC_DATA_DIR}, never data/).")
+    args = parser.parse_args()
+
+    if args.users:
+        print(f"Generating {args.users} users, {args.friendships} friendships and {args.workouts} workouts "
+              f"(seed {args.seed}) in {args.data_dir}...")
+        try: generate_synthetic(os.path.abspath(args.data_dir), args.users, args.friendships, args.workouts, args.seed, args.days)
+        except ValueError as e: parser.error(str(e))
+        print(f"✅ Done. Every user's password is '{SYNTHETIC_PASSWORD}'.")
+    else:
+        print("Generating initial data for the fitness application...")
+        create_exercise_data()
+        create_user_data()
+        initialize_progress_data()
+        print("✅ All data files have been created.")
@@ -0,0 +1,89 @@
+import functools
+import gzip
+import hashlib
+import re
+
+from flask import make_response, request
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+# --- HTTP Caching Configuration ---
+COMPRESS_MIN_SIZE = 512  # bytes; smaller bodies are not worth the CPU
+COMPRESS_MIMETYPES = {'application/json'}
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+ASSET_MAX_AGE = 24 * 3600  # un-hashed images and videos under assets/
+# Static files whose name carries a content hash, e.g. app.3f2a9c1e.js: safe to cache forever.
+HASHED_FILENAME = re.compile(r'\.[0-9a-f]{8,}\.\w+$')
+
+
+def etag_for(version):
+    return hashlib.blake2b(repr(version).encode('utf-8'), digest_size=12).hexdigest()
+
+
+# --- Versioned API Responses ---
+def versioned(version_fn, private=True):
+    """Decorator for read endpoints whose output is fully determined by `version_fn()`.
+
+    The ETag is derived from that version alone, before the view runs, so a client that
+    already has the current version gets a 304 without the response being rebuilt. ETags
+    are weak, so the same one is valid for every content encoding of the body.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            etag = etag_for(version_fn())
+            if request.if_none_match.contains_weak(etag):
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200: return response
+            response.set_etag(etag, weak=True)
+            response.headers['Cache-Control'] = ('private' if private else 'public') + ', no-cache'
+            if private: response.vary.add('Authorization')
+            return response
+        return wrapper
+    return decorator
+
+
+# --- Compression ---
+def _compress(response):
+    if (response.status_code != 200 or response.direct_passthrough or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESS_MIMETYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_SIZE: return response
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        response.set_data(brotli.compress(body, quality=BROTLI_QUALITY))
+        response.headers['Content-Encoding'] = 'br'
+    elif accepted['gzip']:
+        response.set_data(gzip.compress(body, compresslevel=GZIP_LEVEL))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+# --- Static Files ---
+def _static_max_age(filename):
+    if filename and HASHED_FILENAME.search(filename): return IMMUTABLE_MAX_AGE
+    if filename and filename.startswith('assets/'): return ASSET_MAX_AGE
+    return 0  # pages, scripts and styles: always revalidate (cheap 304 via ETag/Last-Modified)
+
+def _mark_immutable(response):
+    if response.status_code in (200, 206, 304) and HASHED_FILENAME.search(request.path):
+        response.cache_control.immutable = True
+    return response
+
+
+def init_app(app):
+    """Adds JSON compression and static-file cache headers to `app`. Static files already
+    get ETag/Last-Modified validation and Range requests (used by the exercise videos)
+    from Flask's send_file."""
+    app.get_send_file_max_age = _static_max_age
+    app.after_request(_mark_immutable)
+    app.after_request(_compress)
@@ -0,0 +1,101 @@
+import threading
+from datetime import datetime, timedelta
+
+from sortedcontainers import SortedList
+
+from storage import storage
+
+# --- Leaderboard Configuration ---
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+
+
+def current_week_start(now=None):
+    """Monday 00:00 UTC of the current week, as the ISO date prefix used by log entries."""
+    today = (now or datetime.utcnow()).date()
+    return (today - timedelta(days=today.weekday())).isoformat()
+
+
+# --- Incremental Weekly Leaderboard ---
+class Leaderboard:
+    """Weekly XP ranking kept in a sorted list of (-weekly_xp, user_id) keys.
+
+    Rather than re-sorting every user on each request, it tails the workout log (see
+    `storage.workouts_after`) and moves only the users whose XP changed, so page
+    reads and rank lookups cost O(log n). Because it follows the log, completions from
+    other worker processes are picked up too. The ranking resets every Monday (UTC).
+    """
+
+    def __init__(self, storage=storage):
+        self.storage = storage
+        self._lock = threading.Lock()
+        self._ranking = SortedList()
+        self._weekly_xp = {}
+        self._usernames = {}
+        self._cursor = None
+        self._week_start = None
+
+    # --- Maintenance ---
+    def _refresh(self):
+        """Brings the ranking up to date with the log. Caller holds `_lock`."""
+        week_start = current_week_start()
+        if self._week_start is None:
+            for user in self.storage.list_users(): self._track(user['id'], user['username'])
+        elif week_start != self._week_start:
+            self._weekly_xp = dict.fromkeys(self._weekly_xp, 0)
+            self._ranking = SortedList((0, user_id) for user_id in self._weekly_xp)
+        self._week_start = week_start
+
+        entries, self._cursor = self.storage.workouts_after(self._cursor)
+        for entry in entries:
+            if entry['date'] >= week_start: self._add_xp(entry['userId'], entry.get('xp_gained', 0))
+
+    def _track(self, user_id, username=None):
+        if username: self._usernames[user_id] = username
+        if user_id not in self._weekly_xp:
+            self._weekly_xp[user_id] = 0
+            self._ranking.add((0, user_id))
+
+    def _add_xp(self, user_id, xp):
+        self._track(user_id)
+        old = self._weekly_xp[user_id]
+        self._ranking.remove((-old, user_id))
+        self._weekly_xp[user_id] = old + xp
+        self._ranking.add((-(old + xp), user_id))
+
+    def _entry(self, rank, user_id):
+        username = self._usernames.get(user_id)
+        if username is None:  # registered in another worker process since the last refresh
+            user = self.storage.get_user(user_id)
+            username = self._usernames[user_id] = user['username'] if user else 'Unknown'
+        return {"rank": rank, "id": user_id, "username": username, "weekly_xp": self._weekly_xp[user_id]}
+
+    def add_user(self, user):
+        with self._lock:
+            if self._week_start is not None: self._track(user['id'], user['username'])
+
+    # --- Queries ---
+    def page(self, offset=0, limit=DEFAULT_PAGE_SIZE):
+        """Returns (total, entries) for one page of the global ranking."""
+        with self._lock:
+            self._refresh()
+            keys = self._ranking.islice(offset, offset + limit)
+            return len(self._ranking), [self._entry(offset + i + 1, user_id) for i, (_, user_id) in enumerate(keys)]
+
+    def rank(self, user_id):
+        """Returns the user's 1-based global rank and weekly XP, or None if unknown."""
+        with self._lock:
+            self._refresh()
+            if user_id not in self._weekly_xp: return None
+            xp = self._weekly_xp[user_id]
+            return {"rank": self._ranking.index((-xp, user_id)) + 1, "weekly_xp": xp}
+
+    def among(self, user_ids):
+        """Ranks only the given users (e.g. someone and their friends)."""
+        with self._lock:
+            self._refresh()
+            keys = sorted((-self._weekly_xp[uid], uid) for uid in set(user_ids) if uid in self._weekly_xp)
+            return [self._entry(i + 1, user_id) for i, (_, user_id) in enumerate(keys)]
+
+
+leaderboard = Leaderboard()
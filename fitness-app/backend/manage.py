@@ -0,0 +1,75 @@
+import argparse
+import os
+from datetime import datetime
+
+import aggregates
+from catalog import catalog
+from shard_store import SHARD_DIRNAME, USER_SHARDS, ShardStore
+from store import DATA_DIR
+from storage import (SQLITE_PATH, JsonStorage, ShardedStorage, SqliteStorage, import_json_into_sqlite, merge_user_shards,
+                     shard_json_users, storage)
+from workout_log import compact, workout_log
+
+# --- Maintenance Commands ---
+# Run from the `backend` directory, e.g. `python3 manage.py compact-progress`.
+
+def compact_progress(args):
+    """Converts user_progress.json into the append-only log (or re-compacts an existing log),
+    shrinking entries that still embed full exercise objects down to exercise ids."""
+    count = compact(workout_log, transform=catalog.shrink_entry)
+    print(f"-> Compacted {count} workout entries into {workout_log.path}")
+
+def import_sqlite(args):
+    """Copies users, friendships and workout history from data/*.json into the SQLite database."""
+    target = SqliteStorage(args.path)
+    counts = import_json_into_sqlite(JsonStorage(), target)
+    print(f"-> Imported {counts['users']} users, {counts['friendships']} friendships and "
+          f"{counts['workouts']} workouts into {target.path}")
+    print("   Start the server with FITNESS_STORAGE=sqlite to use it.")
+
+def shard_users(args):
+    """Splits data/users.json and data/friends_data.json into the sharded layout under data/users/."""
+    counts = shard_json_users(JsonStorage(), shard_count=args.shards)
+    print(f"-> Wrote {counts['users']} users and {counts['friendships']} friendships into {args.shards} shards in {os.path.join(DATA_DIR, SHARD_DIRNAME)}")
+    print("   Start the server with FITNESS_STORAGE=sharded to use them.")
+
+def unshard_users(args):
+    """Writes the sharded layout under data/users/ back into data/users.json and data/friends_data.json."""
+    counts = merge_user_shards(ShardedStorage(ShardStore()), JsonStorage())
+    print(f"-> Wrote {counts['users']} users and {counts['friendships']} friendships into users.json and friends_data.json")
+    print("   Start the server without FITNESS_STORAGE (or with FITNESS_STORAGE=json) to use them.")
+
+def rebuild_aggregates(args):
+    """Recomputes every user's workout aggregates (totals, muscle groups, weekly XP,
+    workouts by hour) from the workout log, using the configured storage backend."""
+    now = datetime.utcnow()
+    with storage.transaction():
+        users = storage.list_users()
+        for user in users:
+            user['aggregates'] = aggregates.rebuild(
+                [catalog.shrink_entry(p) for p in storage.workout_history(user['id'], include_rewards=True)], now)
+            storage.save_user(user)
+    print(f"-> Rebuilt workout aggregates for {len(users)} users")
+
+
+COMMANDS = {
+    'compact-progress': (compact_progress, "Migrate/compact the workout log and rebuild its per-user index."),
+    'import-sqlite': (import_sqlite, "Import the JSON data files into the SQLite storage backend (replaces its contents)."),
+    'rebuild-aggregates': (rebuild_aggregates, "Recompute per-user workout aggregates from the workout log."),
+    'shard-users': (shard_users, "Split users and friendships into per-user shard files (replaces existing shards)."),
+    'unshard-users': (unshard_users, "Merge the per-user shard files back into users.json and friends_data.json."),
+}
+ARGUMENTS = {
+    'import-sqlite': [(('--path',), {"default": SQLITE_PATH, "help": "SQLite database file to write."})],
+    'shard-users': [(('--shards',), {"type": int, "default": USER_SHARDS, "help": "Number of shard files."})],
+}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Maintenance commands for the fitness app data files.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for name, (handler, help_text) in COMMANDS.items():
+        subparser = subparsers.add_parser(name, help=help_text)
+        for flags, options in ARGUMENTS.get(name, []): subparser.add_argument(*flags, **options)
+        subparser.set_defaults(handler=handler)
+    args = parser.parse_args()
+    args.handler(args)
@@ -0,0 +1,344 @@
+import atexit
+import bisect
+import collections
+import contextlib
+import hmac
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+
+from flask import g, request
+
+# --- Metrics Configuration ---
+# Default histogram buckets, in seconds.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FLUSH_INTERVAL = 5.0  # seconds between writes of this process's values for /metrics in other workers
+# Requests sending `X-Profile: <token>` get a sampling profile; unset disables profiling.
+PROFILE_TOKEN = os.environ.get('FITNESS_PROFILE_TOKEN')
+PROFILE_INTERVAL = float(os.environ.get('FITNESS_PROFILE_INTERVAL', '0.005'))  # seconds between stack samples
+# Per-process value files: <pid>-<start time in ms>.json (older versions wrote <pid>.json).
+PROCESS_FILE_PATTERN = re.compile(r'^(\d+)(?:-\d+)?\.json$')
+COMPACTED_FILENAME = 'compacted.json'  # totals of exited processes, folded in by render()
+COMPACT_LOCK_FILENAME = '.compact.lock'
+
+try:
+    import fcntl
+except ImportError:  # Windows: exited processes' files are kept and read on every scrape
+    fcntl = None
+
+
+def _label_key(label_names, labels):
+    return tuple(str(labels[name]) for name in label_names)
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def _format_labels(pairs):
+    if not pairs: return ''
+    escape = lambda v: str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{k}="{escape(v)}"' for k, v in pairs) + '}'
+
+
+# --- Metric Types ---
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, registry, name, help_text, label_names=()):
+        self.registry, self.name, self.help, self.label_names = registry, name, help_text, tuple(label_names)
+        self._values = {}
+
+    def inc(self, value=1, **labels):
+        key = _label_key(self.label_names, labels)
+        with self.registry.lock: self._values[key] = self._values.get(key, 0) + value
+
+    def _snapshot(self):
+        return [[list(key), value] for key, value in self._values.items()]
+
+    def _merge(self, merged, samples):
+        for key, value in samples:
+            merged[tuple(key)] = merged.get(tuple(key), 0) + value
+
+    def _render(self, merged):
+        for key, value in sorted(merged.items()):
+            yield f'{self.name}{_format_labels(list(zip(self.label_names, key)))} {value}'
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, registry, name, help_text, label_names=(), buckets=LATENCY_BUCKETS):
+        self.registry, self.name, self.help, self.label_names = registry, name, help_text, tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._values = {}  # label key -> [count per bucket (+Inf last)..., sum]
+
+    def observe(self, value, **labels):
+        key = _label_key(self.label_names, labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.registry.lock:
+            slots = self._values.get(key)
+            if slots is None: slots = self._values[key] = [0] * (len(self.buckets) + 2)
+            slots[index] += 1
+            slots[-1] += value
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try: yield
+        finally: self.observe(time.perf_counter() - started, **labels)
+
+    def _snapshot(self):
+        return [[list(key), list(slots)] for key, slots in self._values.items()]
+
+    def _merge(self, merged, samples):
+        for key, slots in samples:
+            if len(slots) != len(self.buckets) + 2: continue  # written with other buckets
+            total = merged.setdefault(tuple(key), [0] * len(slots))
+            for i, value in enumerate(slots): total[i] += value
+
+    def _render(self, merged):
+        for key, slots in sorted(merged.items()):
+            pairs = list(zip(self.label_names, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), slots):
+                cumulative += count
+                yield f'{self.name}_bucket{_format_labels(pairs + [("le", bound)])} {cumulative}'
+            yield f'{self.name}_sum{_format_labels(pairs)} {slots[-1]}'
+            yield f'{self.name}_count{_format_labels(pairs)} {cumulative}'
+
+
+# --- Registry ---
+class Registry:
+    """Process-local counters and histograms, rendered in the Prometheus text format.
+
+    Recording a value is a dict update under a lock, so instrumentation can stay on in
+    production. For /metrics to cover every worker process, each process writes its
+    values to `<directory>/<pid>-<start>.json` every FLUSH_INTERVAL seconds (and on exit),
+    and `render()` adds up every file in the directory. The start time in the name keeps
+    a process that reuses an old pid from overwriting that process's totals. Files of
+    processes that have exited are folded into one `compacted.json` by whichever scrape
+    gets there first, so counters never go backwards when a worker is replaced and a
+    scrape reads one file per live process plus one.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.directory = None
+        self._pid = self._filename = None
+        self._metrics = {}
+        self._writer = None
+
+    @property
+    def filename(self):
+        """This process's value file, named when first needed so forked workers get their own."""
+        pid = os.getpid()
+        if pid != self._pid: self._pid, self._filename = pid, f'{pid}-{time.time_ns() // 1_000_000}.json'
+        return self._filename
+
+    def counter(self, name, help_text, label_names=()):
+        return self._register(Counter(self, name, help_text, label_names))
+
+    def histogram(self, name, help_text, label_names=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(self, name, help_text, label_names, buckets))
+
+    def _register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def share(self, directory):
+        """Starts writing this process's values to `directory`, where `render()` looks for other workers'."""
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._run_writer, name='metrics-writer', daemon=True)
+            self._writer.start()
+
+    def snapshot(self):
+        with self.lock:
+            return {name: metric._snapshot() for name, metric in self._metrics.items()}
+
+    def flush(self):
+        if self.directory is None: return
+        self._write(self.filename, self.snapshot())
+
+    def _write(self, name, content):
+        fd, tmp_path = tempfile.mkstemp(prefix='.metrics.', dir=self.directory)
+        with os.fdopen(fd, 'w') as f: json.dump(content, f, separators=(',', ':'))
+        os.replace(tmp_path, os.path.join(self.directory, name))
+
+    def _read(self, name):
+        try:
+            with open(os.path.join(self.directory, name)) as f: return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None  # being replaced right now; picked up on the next scrape
+
+    def _run_writer(self):
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"  [ERROR] Could not write metrics: {e}")
+
+    # --- Compaction ---
+    def _merge_snapshots(self, snapshots):
+        """Adds snapshots up into one. Metrics this process does not know are concatenated
+        as they are, to be merged when a process that knows them renders."""
+        merged = {}
+        for name in {name for snapshot in snapshots for name in snapshot}:
+            metric = self._metrics.get(name)
+            if metric is None:
+                merged[name] = [sample for snapshot in snapshots for sample in snapshot.get(name, ())]
+                continue
+            totals = {}
+            for snapshot in snapshots: metric._merge(totals, snapshot.get(name, ()))
+            merged[name] = [[list(key), value] for key, value in totals.items()]
+        return merged
+
+    def compact(self):
+        """Folds the files of exited processes into COMPACTED_FILENAME and deletes them.
+        Runs under a non-blocking file lock, so concurrent scrapes never fold a file twice;
+        the compacted file lists what it has folded, so a crash between writing it and
+        deleting the folded files doesn't count them twice either."""
+        if self.directory is None or fcntl is None: return
+        with open(os.path.join(self.directory, COMPACT_LOCK_FILENAME), 'a') as lock_file:
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return  # another process is compacting
+            names = os.listdir(self.directory)
+            exited = [name for name in names if name != self.filename and (match := PROCESS_FILE_PATTERN.match(name))
+                      and not _process_alive(int(match.group(1)))]
+            if not exited: return
+            compacted = self._read(COMPACTED_FILENAME) or {"folded": [], "values": {}}
+            folded = set(compacted['folded'])
+            new = [name for name in exited if name not in folded]
+            snapshots = [s for s in (self._read(name) for name in new) if s is not None]
+            if snapshots:
+                existing = set(names)
+                self._write(COMPACTED_FILENAME, {"folded": sorted((folded & existing) | set(new)),
+                                                 "values": self._merge_snapshots([compacted['values']] + snapshots)})
+            for name in exited: os.remove(os.path.join(self.directory, name))
+
+    def render(self):
+        """Every metric, summed over all worker processes, in Prometheus text format."""
+        try:
+            self.compact()
+        except OSError as e:
+            print(f"  [ERROR] Could not compact metrics: {e}")
+        others = {}
+        for name in os.listdir(self.directory) if self.directory else ():
+            if name != self.filename and PROCESS_FILE_PATTERN.match(name): others[name] = self._read(name)
+        # Read after the process files: a file folded in the meantime is then listed here and skipped.
+        compacted = (self._read(COMPACTED_FILENAME) if self.directory else None) or {"folded": [], "values": {}}
+        for name in compacted['folded']: others.pop(name, None)
+        snapshots = [self.snapshot(), compacted['values']] + [s for s in others.values() if s is not None]
+        lines = []
+        for name, metric in self._metrics.items():
+            merged = {}
+            for snapshot in snapshots: metric._merge(merged, snapshot.get(name, ()))
+            lines.append(f'# HELP {name} {metric.help}')
+            lines.append(f'# TYPE {name} {metric.kind}')
+            lines.extend(metric._render(merged))
+        return '\n'.join(lines) + '\n'
+
+
+# --- Sampling Profiler ---
+class SamplingProfiler:
+    """Samples one thread's Python stack every `interval` seconds from a helper thread,
+    counting identical stacks. `folded()` returns them in the collapsed format read by
+    flamegraph.pl and speedscope. Needs real threads: under gevent every greenlet shares one."""
+
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if stack: self.samples[';'.join(reversed(stack))] += 1
+
+    def folded(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.samples.most_common())
+
+
+def profiling_requested(header_value):
+    return bool(PROFILE_TOKEN and header_value and hmac.compare_digest(header_value, PROFILE_TOKEN))
+
+
+registry = Registry()
+atexit.register(registry.flush)
+
+REQUEST_SECONDS = registry.histogram('fitness_http_request_duration_seconds',
+                                     'Time to handle an HTTP request (to the first chunk for streamed responses).',
+                                     ('route', 'method', 'status'))
+
+
+# --- Flask Integration ---
+def _start_request():
+    g.request_started = time.perf_counter()
+    if PROFILE_TOKEN and profiling_requested(request.headers.get('X-Profile')):
+        g.profiler = SamplingProfiler(threading.get_ident()).start()
+
+def _route():
+    return request.url_rule.rule if request.url_rule else 'unmatched'  # the pattern, so ids don't explode the label set
+
+def _finish_request(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        REQUEST_SECONDS.observe(time.perf_counter() - started, route=_route(), method=request.method, status=response.status_code)
+    profiler = g.pop('profiler', None)
+    if profiler is not None and _profile_directory:
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{request.endpoint or 'unmatched'}.folded"
+        with open(os.path.join(_profile_directory, name), 'w') as f: f.write(profiler.stop().folded())
+        response.headers['X-Profile'] = f'{name}; samples={sum(profiler.samples.values())}'
+    return response
+
+def _fail_request(error):
+    # after_request is skipped when a view raises; count those as 500s.
+    started = g.pop('request_started', None)
+    if error is not None and started is not None:
+        REQUEST_SECONDS.observe(time.perf_counter() - started, route=_route(), method=request.method, status=500)
+    profiler = g.pop('profiler', None)
+    if profiler is not None: profiler.stop()
+
+_profile_directory = None
+
+def init_app(app, directory, profile_directory):
+    """Times every request of `app`, shares this process's values through `directory`
+    and writes requested profiles to `profile_directory`. Call it before other modules
+    add after_request hooks, so their time is counted too."""
+    global _profile_directory
+    registry.share(directory)
+    if PROFILE_TOKEN:
+        os.makedirs(profile_directory, exist_ok=True)
+        _profile_directory = profile_directory
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_fail_request)
@@ -0,0 +1,62 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from metrics import registry
+
+# --- Password Hashing Configuration ---
+# Any Werkzeug method string, e.g. 'scrypt', 'scrypt:32768:8:1' or 'pbkdf2:sha256:600000'.
+# Stored hashes made with other parameters are upgraded the next time their owner logs in.
+HASH_METHOD = os.environ.get('FITNESS_PASSWORD_HASH', 'scrypt')
+HASH_WORKERS = int(os.environ.get('FITNESS_HASH_WORKERS', str(min(4, os.cpu_count() or 1))))
+# Hash jobs allowed to wait for a worker; beyond that requests are turned away.
+HASH_QUEUE = int(os.environ.get('FITNESS_HASH_QUEUE', '32'))
+
+HASH_SECONDS = registry.histogram('fitness_password_hash_seconds',
+                                  'Time to hash or verify a password, including waiting for a free worker.', ('op',))
+HASH_REJECTED = registry.counter('fitness_password_hash_rejected_total', 'Hash jobs turned away because the queue was full.', ('op',))
+
+
+class HasherBusy(Exception):
+    """Raised when the hashing pool already has HASH_QUEUE jobs waiting."""
+
+
+# --- Bounded Hashing Pool ---
+class PasswordHasher:
+    """Runs password hashing and verification on a small fixed pool of threads.
+
+    Hashing is deliberately slow, so a burst of logins run directly on request threads
+    would tie all of them up. Here at most `workers` hashes run at once and at most
+    `queue` more may wait; further calls raise HasherBusy immediately instead of queueing
+    without bound, leaving the request threads free to serve the other endpoints.
+    """
+
+    def __init__(self, method=HASH_METHOD, workers=HASH_WORKERS, queue=HASH_QUEUE):
+        self.method = method
+        # The method string as Werkzeug writes it into hashes (defaults filled in).
+        self.method_prefix = generate_password_hash('', method).split('$', 1)[0]
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        self._slots = threading.BoundedSemaphore(workers + queue)
+
+    def _run(self, op, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            HASH_REJECTED.inc(op=op)
+            raise HasherBusy()
+        try:
+            with HASH_SECONDS.time(op=op): return self._pool.submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run('hash', generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        return self._run('verify', check_password_hash, password_hash or '', password or '')
+
+    def needs_rehash(self, password_hash):
+        return (password_hash or '').split('$', 1)[0] != self.method_prefix
+
+
+hasher = PasswordHasher()
@@ -0,0 +1,250 @@
+import itertools
+import threading
+from collections import defaultdict
+from datetime import datetime
+
+from aggregates import day_window, entry_hour, week_window, workout_equipment
+from catalog import MUSCLE_GROUP_BITS, muscle_groups, muscle_mask
+from store import store
+
+# --- Rewards Configuration ---
+# Hours (UTC) that count towards the time-of-day badges.
+TIME_PERIODS = {'morning': range(0, 8), 'night': range(21, 24)}
+
+# Reset windows per quest type: a quest can be completed once per window.
+QUEST_WINDOWS = {'daily': day_window, 'weekly': week_window}
+
+
+# --- Workout Context ---
+class WorkoutContext:
+    """The counters rule evaluators read, as of the workout being completed.
+
+    `changed` names the counters this completion moved; the engine only evaluates rules
+    that depend on one of them.
+    """
+
+    def __init__(self, user, entry, now, total_workouts, workouts_today, workouts_in_week, week_day_masks,
+                 equipment_workouts, period_workouts):
+        self.user = user
+        self.entry = entry
+        self.now = now
+        self.total_workouts = total_workouts
+        self.workouts_today = workouts_today
+        self.workouts_in_week = workouts_in_week
+        self.week_day_masks = week_day_masks          # date -> muscle mask trained that day
+        self.equipment_workouts = equipment_workouts  # equipment -> workouts using only it
+        self.period_workouts = period_workouts        # 'morning'/'night' -> workouts
+        self.changed = set()
+
+    @classmethod
+    def from_aggregates(cls, user, entry, now, leveled_up=False, streak_changed=False):
+        """Builds the context from the user's aggregates (see aggregates.py), which must
+        already include `entry`."""
+        agg = user['aggregates']
+        period_workouts = {name: sum(agg['workouts_by_hour'][h] for h in hours) for name, hours in TIME_PERIODS.items()}
+        ctx = cls(user, entry, now, agg['total_workouts'], agg['workouts_today'], agg['workouts_this_week'],
+                  agg['week_day_masks'], agg['equipment'], period_workouts)
+        ctx.changed = changed_counters(entry, leveled_up, streak_changed)
+        return ctx
+
+
+def time_period(date):
+    hour = entry_hour({'date': date})
+    return next((name for name, hours in TIME_PERIODS.items() if hour in hours), None)
+
+def changed_counters(entry, leveled_up=False, streak_changed=False):
+    changed = {'workout', 'total_workouts', 'workouts_in_week'}
+    changed.update(f'muscle:{group}' for group in muscle_groups(entry.get('muscle_mask', 0)))
+    equipment, period = workout_equipment(entry), time_period(entry['date'])
+    if equipment: changed.add(f'equipment:{equipment}')
+    if period: changed.add(f'period:{period}')
+    if leveled_up: changed.add('level')
+    if streak_changed: changed.add('streak')
+    return changed
+
+
+# --- Criteria Compilers ---
+# Each compiler validates a criteria value and returns (evaluator, counters it depends on).
+def _as_list(value):
+    return [value] if isinstance(value, str) else list(value)
+
+def _require(condition, message):
+    if not condition: raise ValueError(message)
+
+def _positive_int(value):
+    _require(isinstance(value, int) and value > 0, f"expected a positive integer, got {value!r}")
+    return value
+
+def _muscle_groups(value):
+    groups = _as_list(value)
+    _require(groups and all(g in MUSCLE_GROUP_BITS for g in groups), f"unknown muscle group in {value!r}")
+    return groups
+
+def compile_first_workout_of_day(value):
+    return (lambda ctx: ctx.workouts_today >= 1), {'workout'}
+
+def compile_muscle_group_in_workout(value):
+    mask = muscle_mask(_muscle_groups(value))
+    return (lambda ctx: bool(ctx.entry.get('muscle_mask', 0) & mask)), {f'muscle:{g}' for g in _as_list(value)}
+
+def compile_workouts_in_week(value):
+    n = _positive_int(value)
+    return (lambda ctx: ctx.workouts_in_week >= n), {'workouts_in_week'}
+
+def compile_unique_muscle_groups_in_week(value):
+    """Each listed group trained on a different day this week."""
+    bits = [MUSCLE_GROUP_BITS[g] for g in _muscle_groups(value)]
+    def evaluate(ctx):
+        masks = list(ctx.week_day_masks.values())
+        return any(all(masks[d] & bit for d, bit in zip(days, bits))
+                   for days in itertools.permutations(range(len(masks)), len(bits)))
+    return evaluate, {f'muscle:{g}' for g in _as_list(value)}
+
+def compile_total_workouts(value):
+    n = _positive_int(value)
+    return (lambda ctx: ctx.total_workouts >= n), {'total_workouts'}
+
+def compile_level_reached(value):
+    n = _positive_int(value)
+    return (lambda ctx: ctx.user['level'] >= n), {'level'}
+
+def compile_streak(value):
+    n = _positive_int(value)
+    return (lambda ctx: ctx.user['streak_count'] >= n), {'streak'}
+
+def compile_quests_completed(value):
+    n = _positive_int(value)
+    return (lambda ctx: ctx.user.get('quests_completed_total', 0) >= n), {'quests_completed'}
+
+def compile_equipment_usage_count(value):
+    _require(isinstance(value, dict) and 'equipment' in value, f"expected {{'equipment', 'count'}}, got {value!r}")
+    equipment, n = value['equipment'], _positive_int(value.get('count'))
+    return (lambda ctx: ctx.equipment_workouts.get(equipment, 0) >= n), {f'equipment:{equipment}'}
+
+def compile_time_of_day_workout(value):
+    _require(isinstance(value, dict) and value.get('period') in TIME_PERIODS, f"unknown period in {value!r}")
+    period, n = value['period'], _positive_int(value.get('count'))
+    return (lambda ctx: ctx.period_workouts.get(period, 0) >= n), {f'period:{period}'}
+
+CRITERIA_COMPILERS = {
+    'first_workout_of_day': compile_first_workout_of_day,
+    'muscle_group_in_workout': compile_muscle_group_in_workout,
+    'workouts_in_week': compile_workouts_in_week,
+    'unique_muscle_groups_in_week': compile_unique_muscle_groups_in_week,
+    'total_workouts': compile_total_workouts,
+    'level_reached': compile_level_reached,
+    'streak': compile_streak,
+    'quests_completed': compile_quests_completed,
+    'equipment_usage_count': compile_equipment_usage_count,
+    'time_of_day_workout': compile_time_of_day_workout,
+}
+
+
+# --- Rule Engine ---
+class Rule:
+    def __init__(self, definition, evaluate, depends_on):
+        self.id = definition['id']
+        self.definition = definition
+        self.evaluate = evaluate
+        self.depends_on = depends_on
+
+def compile_rules(definitions, kind):
+    """Validates and compiles quest or badge definitions, returning (rules, index) where
+    `index` maps each counter to the rules that depend on it."""
+    rules, index = [], defaultdict(list)
+    for definition in definitions:
+        criteria = definition.get('criteria') or {}
+        compiler = CRITERIA_COMPILERS.get(criteria.get('type'))
+        if compiler is None:
+            raise ValueError(f"{kind} {definition.get('id')!r}: unknown criteria type {criteria.get('type')!r}")
+        if kind == 'quest' and definition.get('type') not in QUEST_WINDOWS:
+            raise ValueError(f"quest {definition['id']!r}: type must be one of {sorted(QUEST_WINDOWS)}")
+        try:
+            evaluate, depends_on = compiler(criteria.get('value'))
+        except ValueError as e:
+            raise ValueError(f"{kind} {definition['id']!r}: {e}") from None
+        rule = Rule(definition, evaluate, depends_on)
+        rules.append(rule)
+        for counter in depends_on: index[counter].append(rule)
+    return rules, dict(index)
+
+
+class RewardEngine:
+    """Evaluates quests and badges for a workout completion.
+
+    Definitions are loaded from quests.json/badges.json once (and recompiled only if the
+    store hands back new collections). Each completion evaluates only the not-yet-earned
+    rules indexed under a counter the completion changed.
+    """
+
+    def __init__(self, data_store=store):
+        self.store = data_store
+        self._lock = threading.Lock()
+        self._sources = (None, None)
+        self.quests = self.badges = []
+        self._quest_index = self._badge_index = {}
+
+    def _refresh(self):
+        sources = (self.store.get('quests.json'), self.store.get('badges.json'))
+        if sources[0] is not self._sources[0] or sources[1] is not self._sources[1]:
+            with self._lock:
+                self.quests, self._quest_index = compile_rules(sources[0], 'quest')
+                self.badges, self._badge_index = compile_rules(sources[1], 'badge')
+                self._sources = sources
+
+    @staticmethod
+    def _candidates(index, changed, done):
+        seen = set()
+        for counter in changed:
+            for rule in index.get(counter, ()):
+                if rule.id not in done and rule.id not in seen:
+                    seen.add(rule.id)
+                    yield rule
+
+    def completed_quests(self, user, now=None):
+        """Ids of quests the user has completed in the current daily/weekly windows."""
+        self._refresh()
+        now = now or datetime.utcnow()
+        windows = user.get('quest_windows') or {}
+        expired = {q.id for q in self.quests if windows.get(q.definition['type']) != QUEST_WINDOWS[q.definition['type']](now)}
+        return set(user.get('completed_quests', [])) - expired
+
+    def evaluate(self, user, ctx):
+        """Awards newly earned quests and badges. Modifies the user object directly and
+        returns (bonus_xp, newly_completed_quests, newly_earned_badges).
+
+        Quest windows only ever move forward: if a later completion was evaluated first, the
+        quests of any window it has already moved on are left alone rather than re-awarded."""
+        self._refresh()
+        previous = set(user.get('completed_quests', []))
+        completed = self.completed_quests(user, ctx.now)
+        windows, passed = dict(user.get('quest_windows') or {}), set()
+        for kind, window in QUEST_WINDOWS.items():
+            if windows.get(kind, '') > window(ctx.now): passed.update(q.id for q in self.quests if q.definition['type'] == kind)
+            else: windows[kind] = window(ctx.now)
+        completed |= passed & previous
+        user['quest_windows'] = windows
+        unlocked = set(user.get('unlocked_badges', []))
+        user.setdefault('quests_completed_total', len(user.get('completed_quests', [])))
+        order = {rule.id: i for i, rule in enumerate(self.quests + self.badges)}
+
+        # --- 1. Quests ---
+        new_quests, bonus_xp = [], 0
+        for rule in sorted(self._candidates(self._quest_index, ctx.changed, completed | passed), key=lambda r: order[r.id]):
+            if rule.evaluate(ctx):
+                completed.add(rule.id)
+                new_quests.append(rule.definition)
+                bonus_xp += rule.definition['reward_xp']
+        user['xp'] += bonus_xp
+        user['quests_completed_total'] += len(new_quests)
+        user['completed_quests'] = [q.id for q in self.quests if q.id in completed]
+        if new_quests: ctx.changed.add('quests_completed')
+
+        # --- 2. Badges ---
+        new_badges = [rule.definition for rule in sorted(self._candidates(self._badge_index, ctx.changed, unlocked),
+                                                         key=lambda r: order[r.id]) if rule.evaluate(ctx)]
+        user['unlocked_badges'] = user.get('unlocked_badges', []) + [b['id'] for b in new_badges]
+        return bonus_xp, new_quests, new_badges
+
+
+rewards = RewardEngine()
@@ -0,0 +1,131 @@
+import os
+import secrets
+import tempfile
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+from storage import storage
+from store import DATA_DIR, MULTI_WORKER, REVALIDATE_INTERVAL
+
+# --- Session Configuration ---
+SESSION_TTL = int(os.environ.get('FITNESS_SESSION_TTL', str(7 * 24 * 3600)))  # seconds a login stays valid
+SESSION_CACHE_SIZE = int(os.environ.get('FITNESS_SESSION_CACHE_SIZE', '10000'))
+# How long a cached user record is trusted. Other worker processes may change the record
+# (or sign the user out), so in multi-worker mode it is re-read now and then.
+RECORD_TTL = REVALIDATE_INTERVAL if MULTI_WORKER else None
+SECRET_KEY_FILENAME = '.secret_key'
+
+
+def load_secret_key(data_dir=DATA_DIR):
+    """FITNESS_SECRET_KEY if set, else a random key generated once and kept in the data
+    directory, so every worker process (and restart) signs tokens with the same key."""
+    key = os.environ.get('FITNESS_SECRET_KEY')
+    if key: return key
+    path = os.path.join(data_dir, SECRET_KEY_FILENAME)
+    fd, tmp_path = tempfile.mkstemp(prefix=SECRET_KEY_FILENAME + '.', dir=data_dir)
+    try:
+        with os.fdopen(fd, 'w') as f: f.write(secrets.token_urlsafe(32))
+        os.link(tmp_path, path)  # atomic and fails if another process got there first
+    except FileExistsError:
+        pass
+    finally:
+        os.remove(tmp_path)
+    with open(path) as f: return f.read().strip()
+
+
+class Session:
+    __slots__ = ('user_id', 'user', 'expires_at', 'loaded_at')
+
+    def __init__(self, user, expires_at):
+        self.user_id = user['id']
+        self.user = user
+        self.expires_at = expires_at
+        self.loaded_at = time.monotonic()
+
+
+# --- Session Cache ---
+class SessionCache:
+    """Issues signed session tokens and resolves them to user records.
+
+    A token is an HMAC-signed, timestamped {user id, session version, nonce}. Resolved
+    tokens are kept in a bounded LRU map from token to user record, so a request with a
+    known token costs one dict lookup: no signature check and no user lookup. Unknown
+    tokens (evicted, or issued by another worker) are verified and re-resolved.
+
+    Signing a user out bumps `session_version` on their record, which invalidates every
+    token issued before it in O(1) without keeping a list of revoked tokens.
+    """
+
+    def __init__(self, loader, secret_key, ttl=SESSION_TTL, max_size=SESSION_CACHE_SIZE, record_ttl=RECORD_TTL):
+        self._loader = loader
+        self._serializer = URLSafeTimedSerializer(secret_key, salt='fitness-session')
+        self.ttl = ttl
+        self.max_size = max_size
+        self.record_ttl = record_ttl
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()     # token -> Session, least recently used first
+        self._by_user = defaultdict(set)   # user id -> cached tokens
+
+    def _cache(self, token, session):
+        self._sessions[token] = session
+        self._by_user[session.user_id].add(token)
+        while len(self._sessions) > self.max_size:
+            self._forget(next(iter(self._sessions)))
+
+    def _forget(self, token):
+        session = self._sessions.pop(token, None)
+        if session is None: return
+        tokens = self._by_user.get(session.user_id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens: del self._by_user[session.user_id]
+
+    def issue(self, user):
+        """Returns a new session token for `user`."""
+        token = self._serializer.dumps({"uid": user['id'], "ver": user.get('session_version', 0),
+                                        "n": secrets.token_urlsafe(8)})
+        with self._lock: self._cache(token, Session(user, time.time() + self.ttl))
+        return token
+
+    def resolve(self, token):
+        """Returns the user record for a valid token, or None."""
+        now = time.time()
+        with self._lock:
+            session = self._sessions.get(token)
+            if session is not None:
+                if session.expires_at <= now:
+                    self._forget(token)
+                    return None
+                if self.record_ttl is None or time.monotonic() - session.loaded_at < self.record_ttl:
+                    self._sessions.move_to_end(token)
+                    return session.user
+        try:
+            payload, issued_at = self._serializer.loads(token, max_age=self.ttl, return_timestamp=True)
+        except BadSignature:  # includes expired tokens
+            return None
+        user = self._loader(payload['uid'])
+        with self._lock:
+            if user is None or user.get('session_version', 0) != payload['ver']:
+                self._forget(token)
+                return None
+            self._cache(token, Session(user, issued_at.timestamp() + self.ttl))
+        return user
+
+    def update_user(self, user):
+        """Points this user's cached sessions at a freshly saved record."""
+        with self._lock:
+            for token in self._by_user.get(user['id'], ()):
+                self._sessions[token].user = user
+                self._sessions[token].loaded_at = time.monotonic()
+
+    def revoke_user(self, user):
+        """Signs `user` out everywhere. Modifies the user object directly; save it afterwards."""
+        user['session_version'] = user.get('session_version', 0) + 1
+        with self._lock:
+            for token in list(self._by_user.get(user['id'], ())): self._forget(token)
+
+
+sessions = SessionCache(storage.get_user, load_secret_key())
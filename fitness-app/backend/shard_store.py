@@ -0,0 +1,290 @@
+import contextlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+from friends_graph import username_key
+from store import (DATA_DIR, FLUSH_INTERVAL, MULTI_WORKER, REVALIDATE_INTERVAL, FLUSH_SECONDS, LOAD_SECONDS,
+                   READ_BYTES, WRITTEN_BYTES, fingerprint, read_json, write_atomic)
+
+try:
+    import fcntl
+except ImportError:  # Windows: only in-process locking is available
+    fcntl = None
+
+# --- Shard Configuration ---
+SHARD_DIRNAME = 'users'  # under the data directory
+# Shards a new layout is split into (see manage.py shard-users); an existing layout keeps its own count.
+USER_SHARDS = int(os.environ.get('FITNESS_USER_SHARDS', '256'))
+INDEX_FILENAME = 'index.json'
+REVISION_FILENAME = '.revision'   # grows by a byte on every write, so its fingerprint is the layout's version
+REVISION_COMPACT_SIZE = 64 * 1024  # bytes; the revision file is emptied beyond this
+
+
+def shard_filename(number):
+    return f'shard-{number:04d}.json'
+
+def bump_revision(path):
+    """Appends a byte to the revision file in one O_APPEND write, so concurrent writers
+    never lose a bump. Emptying it still changes its fingerprint."""
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, b'.')
+        if os.fstat(fd).st_size > REVISION_COMPACT_SIZE: os.ftruncate(fd, 0)
+    finally:
+        os.close(fd)
+
+
+# --- Shard Contents ---
+class UsernameIndex:
+    """The layout's only global file: the shard count, the next user id and the
+    case-folded username -> id map. Written only when a user is created."""
+
+    def __init__(self, raw):
+        self.shards = raw.get('shards', USER_SHARDS)
+        self.next_id = raw.get('next_id', 1)
+        self.usernames = raw.get('usernames', {})
+
+    def to_json(self):
+        return {"shards": self.shards, "next_id": self.next_id, "usernames": self.usernames}
+
+
+class UserShard:
+    """The users of one shard plus every relationship any of them is part of, indexed by user."""
+
+    def __init__(self, raw):
+        self.users = {u['id']: u for u in raw.get('users', ())}
+        self.relationships = raw.get('relationships', [])
+        self.by_user = defaultdict(list)
+        for rel in self.relationships: self._index(rel)
+
+    def _index(self, rel):
+        for user_id in {rel['requester_id'], rel['receiver_id']}: self.by_user[user_id].append(rel)
+
+    def relationship(self, user_a, user_b):
+        return next((r for r in self.by_user.get(user_a, ()) if {r['requester_id'], r['receiver_id']} == {user_a, user_b}), None)
+
+    def add_relationship(self, rel):
+        self.relationships.append(rel)
+        self._index(rel)
+
+    def remove_relationship(self, user_a, user_b):
+        rel = self.relationship(user_a, user_b)
+        if rel is None: return
+        self.relationships.remove(rel)
+        for user_id in {user_a, user_b}: self.by_user[user_id].remove(rel)
+
+    def to_json(self):
+        return {"users": list(self.users.values()), "relationships": self.relationships}
+
+
+class ShardFile:
+    """One file of the layout: its cached contents and a lock of its own."""
+
+    def __init__(self, directory, filename, view_type, number, metric_label):
+        self.path = os.path.join(directory, filename)
+        self.lock_path = os.path.join(directory, f'.{filename}.lock')
+        self.view_type = view_type
+        self.number = number  # lock order: the index (-1) first, then shards by number
+        self.metric_label = metric_label
+        self.lock = threading.RLock()
+        self.lock_file = None
+        self.view = None
+        self.fingerprint = None
+        self.checked_at = 0
+        self.dirty = False
+
+
+# --- Sharded Data Store ---
+class ShardStore:
+    """The sharded user layout: `users/shard-NNNN.json` files plus `users/index.json`.
+
+    Like DataStore, files are parsed once and served from memory, and changes are written
+    back by a background writer (or, with `multi_worker`, before a transaction's locks are
+    released). Unlike it, every file has its own lock: `transaction(*user_ids)` takes only
+    the locks of the shards holding those users, in shard order, so transactions on users
+    in different shards run in parallel across threads and worker processes, and each
+    rewrites only the shards it changed.
+    """
+
+    def __init__(self, data_dir=DATA_DIR, flush_interval=FLUSH_INTERVAL, multi_worker=MULTI_WORKER):
+        self.directory = os.path.join(data_dir, SHARD_DIRNAME)
+        self.flush_interval = flush_interval
+        self.multi_worker = multi_worker
+        self.revision_path = os.path.join(self.directory, REVISION_FILENAME)
+        self._local = threading.local()
+        self._state_lock = threading.Lock()
+        self._dirty = set()
+        self._revision = 0
+        self._wakeup = threading.Event()
+        self._writer = None
+        self._closed = False
+        os.makedirs(self.directory, exist_ok=True)
+        self.index_file = ShardFile(self.directory, INDEX_FILENAME, UsernameIndex, -1, f'{SHARD_DIRNAME}/{INDEX_FILENAME}')
+        count = self.read(self.index_file).shards
+        self.shards = [ShardFile(self.directory, shard_filename(i), UserShard, i, f'{SHARD_DIRNAME}/shard') for i in range(count)]
+
+    def shard_of(self, user_id):
+        return self.shards[user_id % len(self.shards)]
+
+    def read(self, file):
+        """Returns the live contents of `file`, loading it on first use. In multi-worker mode,
+        files not locked by this thread are re-checked at most every REVALIDATE_INTERVAL seconds."""
+        view = file.view
+        if view is None or (self.multi_worker and file not in self._held()
+                            and time.monotonic() - file.checked_at > REVALIDATE_INTERVAL):
+            with file.lock:
+                view = self._load(file)
+        return view
+
+    def _load(self, file):
+        """Loads `file`, or reloads it if it changed on disk. Caller holds `file.lock`.
+        Contents with unwritten local changes are never replaced."""
+        if file.view is not None and file.dirty: return file.view
+        current = fingerprint(file.path)
+        file.checked_at = time.monotonic()
+        if file.view is None or current != file.fingerprint:
+            with LOAD_SECONDS.time(file=file.metric_label):
+                file.view = file.view_type(read_json(file.path, {}))
+            READ_BYTES.inc(current[2] if current else 0, file=file.metric_label)
+            file.fingerprint = current
+        return file.view
+
+    # --- Transactions ---
+    def _held(self):
+        return getattr(self._local, 'held', None) or ()
+
+    @contextlib.contextmanager
+    def transaction(self, *user_ids):
+        """Guards a read-modify-write cycle on the shards of `user_ids`; with no ids, on every
+        shard and the username index. A nested call joins the outer transaction, which must
+        already hold everything it asks for: locks are only ever taken up front and in the
+        same order, so transactions can wait for each other but never deadlock. Like
+        DataStore.transaction, nothing is rolled back if the body raises."""
+        if user_ids: wanted = sorted({self.shard_of(user_id) for user_id in user_ids}, key=lambda f: f.number)
+        else: wanted = [self.index_file] + self.shards
+        held = getattr(self._local, 'held', None)
+        if held is not None:
+            missing = [f for f in wanted if f not in held]
+            if missing: raise RuntimeError(f"{os.path.basename(missing[0].path)} is not locked by the enclosing transaction")
+            yield self
+            return
+        acquired = []
+        try:
+            for file in wanted:
+                self._acquire(file)
+                acquired.append(file)
+                if self.multi_worker and file.view is not None: self._load(file)  # another worker may have changed it
+            self._local.held = set(acquired)
+            try:
+                yield self
+            finally:
+                self._local.held = None
+                if self.multi_worker: self.flush(acquired)
+        finally:
+            for file in reversed(acquired): self._release(file)
+
+    def _acquire(self, file):
+        file.lock.acquire()
+        if not self.multi_worker or fcntl is None: return
+        try:
+            file.lock_file = open(file.lock_path, 'a')
+            fcntl.flock(file.lock_file.fileno(), fcntl.LOCK_EX)
+        except BaseException:
+            if file.lock_file is not None: file.lock_file.close()
+            file.lock_file = None
+            file.lock.release()
+            raise
+
+    def _release(self, file):
+        if file.lock_file is not None:
+            fcntl.flock(file.lock_file.fileno(), fcntl.LOCK_UN)
+            file.lock_file.close()
+            file.lock_file = None
+        file.lock.release()
+
+    def mark_dirty(self, file):
+        """Schedules `file` for writing. Only call it inside a transaction that holds `file`."""
+        if file not in self._held(): raise RuntimeError(f"{os.path.basename(file.path)} changed outside a transaction that holds it")
+        with self._state_lock:
+            file.dirty = True
+            self._dirty.add(file)
+            self._revision += 1
+        if self.multi_worker: return  # written when the transaction ends
+        self._ensure_writer()
+        if self.flush_interval <= 0: self.flush([file])
+
+    # --- Writing ---
+    def flush(self, files=None):
+        """Writes the given dirty files (all of them by default). Each is serialized and
+        written under its own lock, so only transactions on the same shard wait for it."""
+        with self._state_lock: pending = [f for f in (self._dirty if files is None else files) if f.dirty]
+        failed, written = None, False
+        for file in pending:
+            with file.lock:
+                if not file.dirty: continue
+                started = time.perf_counter()
+                payload = json.dumps(file.view.to_json(), separators=(',', ':'))
+                try:
+                    write_atomic(file.path, payload)
+                except OSError as e:
+                    failed = failed or e  # stays dirty; retried on the next flush
+                    continue
+                FLUSH_SECONDS.observe(time.perf_counter() - started, file=file.metric_label)
+                WRITTEN_BYTES.inc(len(payload), file=file.metric_label)
+                file.fingerprint = fingerprint(file.path)
+                with self._state_lock:
+                    file.dirty = False
+                    self._dirty.discard(file)
+                written = True
+        if written: bump_revision(self.revision_path)
+        if failed: raise failed
+
+    def version(self):
+        """Changes whenever any shard or the index is written, by any process; unwritten
+        local changes add this process's revision counter."""
+        with self._state_lock: local = self._revision if self._dirty else None
+        return fingerprint(self.revision_path), local
+
+    def close(self):
+        self._closed = True
+        self._wakeup.set()
+        self.flush()
+
+    # --- Background Writer ---
+    def _ensure_writer(self):
+        if self._writer is None and self.flush_interval > 0 and not self._closed:
+            self._writer = threading.Thread(target=self._run_writer, name='shard-writer', daemon=True)
+            self._writer.start()
+
+    def _run_writer(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"  [ERROR] Could not flush user shards: {e}")
+
+
+# --- Bulk Layout ---
+def write_layout(data_dir, users, relationships, shard_count=USER_SHARDS):
+    """Replaces the sharded layout in `data_dir` with `users` and `relationships` in one
+    pass. Only for offline migrations: running servers must be stopped first."""
+    directory = os.path.join(data_dir, SHARD_DIRNAME)
+    os.makedirs(directory, exist_ok=True)
+    shards = [{"users": [], "relationships": []} for _ in range(shard_count)]
+    for user in users: shards[user['id'] % shard_count]['users'].append(user)
+    for rel in relationships:
+        for number in {rel['requester_id'] % shard_count, rel['receiver_id'] % shard_count}:
+            shards[number]['relationships'].append(rel)
+    for name in os.listdir(directory):
+        if name.startswith('shard-') and name.endswith('.json'): os.remove(os.path.join(directory, name))
+    for number, shard in enumerate(shards):
+        if shard['users'] or shard['relationships']:
+            write_atomic(os.path.join(directory, shard_filename(number)), json.dumps(shard, separators=(',', ':')))
+    index = {"shards": shard_count, "next_id": max([u['id'] for u in users] + [0]) + 1,
+             "usernames": {username_key(u['username']): u['id'] for u in users}}
+    write_atomic(os.path.join(directory, INDEX_FILENAME), json.dumps(index, separators=(',', ':')))
+    bump_revision(os.path.join(directory, REVISION_FILENAME))
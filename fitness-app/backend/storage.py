@@ -0,0 +1,589 @@
+import atexit
+import contextlib
+import json
+import os
+import sqlite3
+import threading
+from collections import Counter
+
+from catalog import catalog
+from friends_graph import FriendGraph, username_key
+from shard_store import USER_SHARDS, ShardStore, write_layout
+from store import DATA_DIR, store
+from workout_log import REWARD_KIND, is_reward, workout_log
+
+# --- Storage Configuration ---
+# Users, friendships and workout history live in the selected backend: 'json', 'sharded'
+# (users split over many files, see shard_store.py) or 'sqlite'. Static reference data
+# (exercises, badges, quests) is always read from the JSON data store.
+STORAGE_BACKEND = os.environ.get('FITNESS_STORAGE', 'json')
+SQLITE_PATH = os.environ.get('FITNESS_SQLITE_PATH', os.path.join(DATA_DIR, 'fitness.db'))
+
+
+# --- Workout History in the Append-Only Log ---
+class LogHistory:
+    """Workout history methods shared by the file-based backends, which keep it in the
+    append-only log (see workout_log.py) in `self.log`."""
+
+    def append_workout(self, entry):
+        self.log.append(entry)
+
+    def append_workouts(self, entries):
+        self.log.append_many(entries)
+
+    def workout_history(self, user_id, include_rewards=False):
+        """A user's log entries, oldest first. Reward entries (bonus XP, see workout_log.REWARD_KIND)
+        are left out unless `include_rewards` is set."""
+        return [e for e in self.log.history(user_id) if include_rewards or not is_reward(e)]
+
+    def has_reward_for(self, user_id, event_id, date):
+        """Whether the user's log already holds the reward entry of event `event_id` for a
+        workout logged at `date`. Reads back only as far as that workout."""
+        for _, entry in self.log.iter_history(user_id):
+            if is_reward(entry):
+                if entry.get('event_id') == event_id: return True
+            elif entry['date'] < date: return False
+        return False
+
+    def workout_page(self, user_id, before=None, limit=20, since=None, until=None, muscle_mask=0):
+        """Returns (entries newest first, next cursor or None) for one page of a user's history.
+        `since`/`until` bound the ISO date as a half-open range; `muscle_mask` keeps entries
+        that trained any of those groups."""
+        entries, next_before = [], None
+        for position, entry in self.log.iter_history(user_id, before):
+            if is_reward(entry): continue
+            if until and entry['date'] >= until: continue
+            if since and entry['date'] < since: break  # entries are in date order
+            if muscle_mask and not entry.get('muscle_mask', 0) & muscle_mask: continue
+            if len(entries) == limit:
+                next_before = last_position
+                break
+            entries.append(entry)
+            last_position = position
+        return entries, next_before
+
+    def workouts_after(self, cursor):
+        """Returns (entries, cursor) for workouts logged after `cursor` (None = from the start)."""
+        return self.log.entries_after(cursor or 0)
+
+
+# --- JSON Backend (default) ---
+class JsonStorage(LogHistory):
+    """Users and friendships in the in-memory JSON store, workout history in the append-only log.
+
+    Records returned here are the live in-memory objects; mutate them inside `transaction()`
+    and hand them back through the matching save method so they get flushed. A transaction
+    that raises is not rolled back (see DataStore.transaction), so validate before mutating.
+    """
+    name = 'json'
+
+    def __init__(self, data_store=store, log=workout_log):
+        self.store = data_store
+        self.log = log
+        self._friend_graph = None
+
+    def _graph(self):
+        """Returns the friendship/user index, rebuilding it if the collections were replaced."""
+        users, relationships = self.list_users(), self.store.get('friends_data.json')
+        graph = self._friend_graph
+        if graph is None or not graph.is_current(users, relationships):
+            with self.store.lock:
+                graph = self._friend_graph = FriendGraph(users, relationships)
+        return graph
+
+    def transaction(self, *user_ids):
+        """Guards a read-modify-write cycle. `user_ids` names the users it changes, for the
+        sharded backend; here every transaction takes the store's one lock."""
+        return self.store.transaction()
+
+    # --- Users ---
+    def list_users(self):
+        return self.store.get('users.json')
+
+    def get_user(self, user_id):
+        return self._graph().users.get(user_id)
+
+    def find_user_by_username(self, username):
+        return self._graph().by_username.get(username_key(username))
+
+    def create_user(self, user):
+        """Assigns the next free id to `user`, stores it and returns it."""
+        with self.store.transaction():
+            users = self.list_users()
+            user['id'] = max([u['id'] for u in users] + [0]) + 1
+            users.append(user)
+            self._graph().add_user(user)
+            self.store.mark_dirty('users.json')
+        return user
+
+    def save_user(self, user):
+        with self.store.transaction():
+            users = self.list_users()
+            graph = self._graph()
+            if graph.users.get(user['id']) is not user:
+                index = next((i for i, u in enumerate(users) if u['id'] == user['id']), None)
+                if index is None: users.append(user)
+                else: users[index] = user
+                graph.add_user(user)
+            self.store.mark_dirty('users.json')
+
+    # --- Friendships ---
+    def relationships_for(self, user_id):
+        return self._graph().relationships_for(user_id)
+
+    def find_relationship(self, user_a, user_b):
+        """Returns the relationship between two users, in either direction, if there is one."""
+        return self._graph().relationship(user_a, user_b)
+
+    def friend_ids(self, user_id):
+        return self._graph().friend_ids(user_id)
+
+    def friends_of(self, user_id):
+        users = self._graph().users
+        return [{"id": u['id'], "username": u['username'], "level": u['level']}
+                for u in (users.get(fid) for fid in sorted(self.friend_ids(user_id))) if u]
+
+    def pending_requests_for(self, user_id):
+        graph = self._graph()
+        return [{"id": u['id'], "username": u['username']}
+                for u in (graph.users.get(rid) for rid in sorted(graph.incoming.get(user_id, ()))) if u]
+
+    def suggest_friends(self, user_id, limit):
+        return [{"id": u['id'], "username": u['username'], "level": u['level'], "mutual_friends": count}
+                for u, count in self._graph().suggestions(user_id, limit)]
+
+    def add_relationship(self, relationship):
+        with self.store.transaction():
+            self.store.get('friends_data.json').append(relationship)
+            self._graph().add(relationship)
+            self.store.mark_dirty('friends_data.json')
+
+    def save_relationship(self, relationship):
+        with self.store.transaction():
+            self._graph().update(relationship)
+            self.store.mark_dirty('friends_data.json')
+
+    def delete_relationship(self, relationship):
+        with self.store.transaction():
+            self.store.get('friends_data.json').remove(relationship)
+            self._graph().remove(relationship)
+            self.store.mark_dirty('friends_data.json')
+
+    # --- Revision ---
+    def version(self):
+        """Opaque value that changes whenever users, friendships or workout history change."""
+        return repr((self.store.version('users.json', 'friends_data.json'), self.log.version()))
+
+
+# --- Sharded JSON Backend ---
+class ShardedStorage(LogHistory):
+    """Users and friendships in hash-bucketed shard files (see shard_store.py), workout
+    history in the append-only log.
+
+    User N lives in shard `N % shards` together with every relationship they are part of;
+    a friendship between users of two shards is stored in both. Transactions lock only the
+    shards of the users they name, so updates to users in different shards never wait for
+    each other, and a write rewrites one small shard instead of every user. Creating a user
+    also writes the small global username index. Records are live in-memory objects, as
+    with JsonStorage.
+    """
+    name = 'sharded'
+
+    def __init__(self, shard_store=None, log=workout_log):
+        self.shards = shard_store if shard_store is not None else ShardStore()
+        self.log = log
+
+    def transaction(self, *user_ids):
+        """Locks the shards of `user_ids`; with none, everything (e.g. to create a user)."""
+        return self.shards.transaction(*user_ids)
+
+    def _shard(self, user_id):
+        return self.shards.read(self.shards.shard_of(user_id))
+
+    def _files(self, *user_ids):
+        """The distinct shard files holding `user_ids`."""
+        return list(dict.fromkeys(self.shards.shard_of(user_id) for user_id in user_ids))
+
+    # --- Users ---
+    def list_users(self):
+        return sorted((u for file in self.shards.shards for u in self.shards.read(file).users.values()), key=lambda u: u['id'])
+
+    def get_user(self, user_id):
+        return self._shard(user_id).users.get(user_id)
+
+    def find_user_by_username(self, username):
+        user_id = self.shards.read(self.shards.index_file).usernames.get(username_key(username))
+        return self.get_user(user_id) if user_id is not None else None
+
+    def create_user(self, user):
+        """Assigns the next free id to `user`, stores it and returns it."""
+        with self.shards.transaction():
+            user['id'] = self.shards.read(self.shards.index_file).next_id
+            self._store_user(user)
+        return user
+
+    def save_user(self, user):
+        new = user['id'] not in self._shard(user['id']).users  # then it goes into the username index too
+        with self.shards.transaction(*(() if new else (user['id'],))):
+            if new: return self._store_user(user)
+            self._shard(user['id']).users[user['id']] = user
+            self.shards.mark_dirty(self.shards.shard_of(user['id']))
+
+    def _store_user(self, user):
+        index = self.shards.read(self.shards.index_file)
+        index.usernames[username_key(user['username'])] = user['id']
+        index.next_id = max(index.next_id, user['id'] + 1)
+        self._shard(user['id']).users[user['id']] = user
+        self.shards.mark_dirty(self.shards.index_file)
+        self.shards.mark_dirty(self.shards.shard_of(user['id']))
+
+    # --- Friendships ---
+    @staticmethod
+    def _other(rel, user_id):
+        return rel['receiver_id'] if rel['requester_id'] == user_id else rel['requester_id']
+
+    def relationships_for(self, user_id):
+        return list(self._shard(user_id).by_user.get(user_id, ()))
+
+    def find_relationship(self, user_a, user_b):
+        """Returns the relationship between two users, in either direction, if there is one."""
+        return self._shard(user_a).relationship(user_a, user_b)
+
+    def friend_ids(self, user_id):
+        return {self._other(rel, user_id) for rel in self._shard(user_id).by_user.get(user_id, ()) if rel['status'] == 'accepted'}
+
+    def friends_of(self, user_id):
+        return [{"id": u['id'], "username": u['username'], "level": u['level']}
+                for u in (self.get_user(fid) for fid in sorted(self.friend_ids(user_id))) if u]
+
+    def pending_requests_for(self, user_id):
+        requesters = [rel['requester_id'] for rel in self._shard(user_id).by_user.get(user_id, ())
+                      if rel['receiver_id'] == user_id and rel['status'] == 'pending']
+        return [{"id": u['id'], "username": u['username']} for u in (self.get_user(rid) for rid in sorted(requesters)) if u]
+
+    def suggest_friends(self, user_id, limit):
+        """Friends-of-friends ranked by number of mutual friends, as in FriendGraph.suggestions;
+        reads the shards of the user's friends."""
+        friends = self.friend_ids(user_id)
+        excluded = {self._other(rel, user_id) for rel in self.relationships_for(user_id)} | {user_id}
+        mutual = Counter(fof for friend in friends for fof in self.friend_ids(friend) if fof not in excluded)
+        ranked = sorted(mutual.items(), key=lambda item: (-item[1], item[0]))
+        users = ((self.get_user(uid), count) for uid, count in ranked)
+        return [{"id": u['id'], "username": u['username'], "level": u['level'], "mutual_friends": count}
+                for u, count in users if u][:limit]
+
+    def add_relationship(self, relationship):
+        self.save_relationship(relationship)
+
+    def save_relationship(self, relationship):
+        requester, receiver = relationship['requester_id'], relationship['receiver_id']
+        with self.shards.transaction(requester, receiver):
+            for file in self._files(requester, receiver):
+                shard = self.shards.read(file)
+                existing = shard.relationship(requester, receiver)
+                if existing is None: shard.add_relationship(dict(relationship))
+                elif existing is not relationship:  # the other shard's copy
+                    existing.clear()
+                    existing.update(relationship)
+                self.shards.mark_dirty(file)
+
+    def delete_relationship(self, relationship):
+        requester, receiver = relationship['requester_id'], relationship['receiver_id']
+        with self.shards.transaction(requester, receiver):
+            for file in self._files(requester, receiver):
+                self.shards.read(file).remove_relationship(requester, receiver)
+                self.shards.mark_dirty(file)
+
+    # --- Revision ---
+    def version(self):
+        """Opaque value that changes whenever users, friendships or workout history change."""
+        return repr((self.shards.version(), self.log.version()))
+
+    def close(self):
+        self.shards.close()
+
+
+# --- SQLite Backend ---
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY,
+    username TEXT NOT NULL,
+    username_key TEXT NOT NULL,  -- friends_graph.username_key(username): unique regardless of case
+    data TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_users_username_key ON users (username_key);
+
+CREATE TABLE IF NOT EXISTS friendships (
+    requester_id INTEGER NOT NULL,
+    receiver_id INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    since TEXT,
+    PRIMARY KEY (requester_id, receiver_id)
+);
+CREATE INDEX IF NOT EXISTS idx_friendships_receiver ON friendships (receiver_id, requester_id);
+
+CREATE TABLE IF NOT EXISTS progress (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    userId INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_progress_user_date ON progress (userId, date);
+CREATE INDEX IF NOT EXISTS idx_progress_user_id ON progress (userId, id);  -- newest-first history pages
+
+-- Bumped by triggers on every change, by any process (see SqliteStorage.version).
+CREATE TABLE IF NOT EXISTS revision (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO revision (id, value) VALUES (1, 0);
+""" + "".join(f"CREATE TRIGGER IF NOT EXISTS {table}_{op.lower()}_revision AFTER {op} ON {table} "
+              f"BEGIN UPDATE revision SET value = value + 1; END;\n"
+              for table in ('users', 'friendships', 'progress') for op in ('INSERT', 'UPDATE', 'DELETE'))
+
+class SqliteStorage:
+    """Users, friendships and workout history in a SQLite database in WAL mode.
+
+    Each thread gets its own pooled connection. User records are kept as JSON documents
+    alongside indexed `id`/`username_key` columns, so new user fields need no migration.
+    The case-folded username is stored rather than computed by a Python function, so
+    other SQLite clients can read and write the tables too.
+    """
+    name = 'sqlite'
+
+    def __init__(self, path=SQLITE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._migrate()
+        self._connection().executescript(SQLITE_SCHEMA)
+
+    def _migrate(self):
+        """Adds the `username_key` column to databases created before it existed, replacing
+        the old index on a Python function. Runs under a write lock, so it happens once
+        however many workers start together."""
+        with self.transaction():
+            conn = self._connection()
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(users)')]
+            if not columns or 'username_key' in columns: return
+            conn.execute('DROP INDEX IF EXISTS idx_users_username')
+            conn.execute('DROP INDEX IF EXISTS idx_users_username_key')
+            conn.execute("ALTER TABLE users ADD COLUMN username_key TEXT NOT NULL DEFAULT ''")
+            conn.executemany('UPDATE users SET username_key = ? WHERE id = ?',
+                             [(username_key(row[1]), row[0]) for row in conn.execute('SELECT id, username FROM users')])
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn, self._local.depth = conn, 0
+        return conn
+
+    @contextlib.contextmanager
+    def transaction(self, *user_ids):
+        """Serializes writers with BEGIN IMMEDIATE (whichever users they change); nested calls
+        join the outer transaction."""
+        conn = self._connection()
+        if self._local.depth:
+            self._local.depth += 1
+            try: yield
+            finally: self._local.depth -= 1
+            return
+        conn.execute('BEGIN IMMEDIATE')
+        self._local.depth = 1
+        try:
+            yield
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        else:
+            conn.execute('COMMIT')
+        finally:
+            self._local.depth = 0
+
+    def clear(self):
+        conn = self._connection()
+        for table in ('users', 'friendships', 'progress'): conn.execute(f'DELETE FROM {table}')
+
+    # --- Users ---
+    def list_users(self):
+        return [json.loads(row[0]) for row in self._connection().execute('SELECT data FROM users ORDER BY id')]
+
+    def get_user(self, user_id):
+        row = self._connection().execute('SELECT data FROM users WHERE id = ?', (user_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def find_user_by_username(self, username):
+        row = self._connection().execute('SELECT data FROM users WHERE username_key = ?', (username_key(username),)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def create_user(self, user):
+        with self.transaction():
+            conn = self._connection()
+            user['id'] = conn.execute('INSERT INTO users (username, username_key, data) VALUES (?, ?, ?)',
+                                      (user['username'], username_key(user['username']), '{}')).lastrowid
+            conn.execute('UPDATE users SET data = ? WHERE id = ?', (json.dumps(user), user['id']))
+        return user
+
+    def save_user(self, user):
+        self._connection().execute('INSERT OR REPLACE INTO users (id, username, username_key, data) VALUES (?, ?, ?, ?)',
+                                   (user['id'], user['username'], username_key(user['username']), json.dumps(user)))
+
+    # --- Friendships ---
+    @staticmethod
+    def _relationship(row):
+        rel = {"requester_id": row[0], "receiver_id": row[1], "status": row[2]}
+        if row[3]: rel['since'] = row[3]
+        return rel
+
+    def relationships_for(self, user_id):
+        rows = self._connection().execute(
+            'SELECT requester_id, receiver_id, status, since FROM friendships WHERE requester_id = ? '
+            'UNION ALL SELECT requester_id, receiver_id, status, since FROM friendships WHERE receiver_id = ?',
+            (user_id, user_id))
+        return [self._relationship(row) for row in rows]
+
+    def find_relationship(self, user_a, user_b):
+        row = self._connection().execute(
+            'SELECT requester_id, receiver_id, status, since FROM friendships '
+            'WHERE (requester_id = ? AND receiver_id = ?) OR (requester_id = ? AND receiver_id = ?)',
+            (user_a, user_b, user_b, user_a)).fetchone()
+        return self._relationship(row) if row else None
+
+    def friend_ids(self, user_id):
+        rows = self._connection().execute(
+            "SELECT receiver_id FROM friendships WHERE requester_id = ? AND status = 'accepted' "
+            "UNION SELECT requester_id FROM friendships WHERE receiver_id = ? AND status = 'accepted'", (user_id, user_id))
+        return {row[0] for row in rows}
+
+    def friends_of(self, user_id):
+        rows = self._connection().execute(
+            "SELECT u.id, u.username, json_extract(u.data, '$.level') FROM users u JOIN ("
+            "SELECT receiver_id AS id FROM friendships WHERE requester_id = ? AND status = 'accepted' "
+            "UNION SELECT requester_id FROM friendships WHERE receiver_id = ? AND status = 'accepted'"
+            ") f ON f.id = u.id ORDER BY u.id", (user_id, user_id))
+        return [{"id": row[0], "username": row[1], "level": row[2]} for row in rows]
+
+    def pending_requests_for(self, user_id):
+        rows = self._connection().execute(
+            "SELECT u.id, u.username FROM friendships f JOIN users u ON u.id = f.requester_id "
+            "WHERE f.receiver_id = ? AND f.status = 'pending' ORDER BY u.id", (user_id,))
+        return [{"id": row[0], "username": row[1]} for row in rows]
+
+    def suggest_friends(self, user_id, limit):
+        rows = self._connection().execute("""
+            WITH edges AS (
+                SELECT requester_id AS a, receiver_id AS b FROM friendships WHERE status = 'accepted'
+                UNION ALL SELECT receiver_id, requester_id FROM friendships WHERE status = 'accepted'),
+            known AS (
+                SELECT receiver_id AS id FROM friendships WHERE requester_id = :uid
+                UNION SELECT requester_id FROM friendships WHERE receiver_id = :uid)
+            SELECT u.id, u.username, json_extract(u.data, '$.level'), COUNT(*) AS mutual
+            FROM edges mine JOIN edges theirs ON theirs.a = mine.b JOIN users u ON u.id = theirs.b
+            WHERE mine.a = :uid AND theirs.b != :uid AND theirs.b NOT IN (SELECT id FROM known)
+            GROUP BY u.id ORDER BY mutual DESC, u.id LIMIT :limit""", {"uid": user_id, "limit": limit})
+        return [{"id": row[0], "username": row[1], "level": row[2], "mutual_friends": row[3]} for row in rows]
+
+    def add_relationship(self, relationship):
+        self.save_relationship(relationship)
+
+    def save_relationship(self, relationship):
+        self._connection().execute(
+            'INSERT OR REPLACE INTO friendships (requester_id, receiver_id, status, since) VALUES (?, ?, ?, ?)',
+            (relationship['requester_id'], relationship['receiver_id'], relationship['status'], relationship.get('since')))
+
+    def delete_relationship(self, relationship):
+        self._connection().execute('DELETE FROM friendships WHERE requester_id = ? AND receiver_id = ?',
+                                   (relationship['requester_id'], relationship['receiver_id']))
+
+    # --- Workout History ---
+    def append_workout(self, entry):
+        self.append_workouts([entry])
+
+    def append_workouts(self, entries):
+        self._connection().executemany('INSERT INTO progress (userId, date, data) VALUES (?, ?, ?)',
+                                       [(e['userId'], e['date'], json.dumps(e, separators=(',', ':'))) for e in entries])
+
+    def workout_history(self, user_id, include_rewards=False):
+        workouts_only = '' if include_rewards else f" AND json_extract(data, '$.kind') IS NOT '{REWARD_KIND}'"
+        rows = self._connection().execute(f'SELECT data FROM progress WHERE userId = ?{workouts_only} ORDER BY date, id', (user_id,))
+        return [json.loads(row[0]) for row in rows]
+
+    def has_reward_for(self, user_id, event_id, date):
+        row = self._connection().execute("SELECT 1 FROM progress WHERE userId = ? AND date >= ? AND json_extract(data, '$.kind') = ? "
+                                         "AND json_extract(data, '$.event_id') = ? LIMIT 1", (user_id, date, REWARD_KIND, event_id)).fetchone()
+        return row is not None
+
+    def workout_page(self, user_id, before=None, limit=20, since=None, until=None, muscle_mask=0):
+        conditions, params = ['userId = ?', f"json_extract(data, '$.kind') IS NOT '{REWARD_KIND}'"], [user_id]
+        for condition, value in (('id < ?', before), ('date >= ?', since), ('date < ?', until)):
+            if value is not None:
+                conditions.append(condition)
+                params.append(value)
+        if muscle_mask:
+            conditions.append("json_extract(data, '$.muscle_mask') & ? != 0")
+            params.append(muscle_mask)
+        rows = self._connection().execute(f"SELECT id, data FROM progress WHERE {' AND '.join(conditions)} "
+                                          "ORDER BY id DESC LIMIT ?", params + [limit + 1]).fetchall()
+        next_before = rows[limit - 1][0] if len(rows) > limit else None
+        return [json.loads(data) for _, data in rows[:limit]], next_before
+
+    def workouts_after(self, cursor):
+        rows = self._connection().execute('SELECT id, data FROM progress WHERE id > ? ORDER BY id', (cursor or 0,)).fetchall()
+        return [json.loads(data) for _, data in rows], (rows[-1][0] if rows else cursor or 0)
+
+    # --- Revision ---
+    def version(self):
+        """Opaque value that changes whenever users, friendships or workout history change."""
+        return str(self._connection().execute('SELECT value FROM revision WHERE id = 1').fetchone()[0])
+
+
+# --- Import ---
+def import_json_into_sqlite(source, target):
+    """Copies every user, friendship and workout entry from `source` (a JsonStorage) into `target`."""
+    counts = {"users": 0, "friendships": 0, "workouts": 0}
+    with target.transaction():
+        target.clear()
+        for user in source.list_users():
+            target.save_user(user); counts['users'] += 1
+        for rel in source.store.get('friends_data.json'):
+            target.save_relationship(rel); counts['friendships'] += 1
+        for entry in source.log.iter_all():
+            target.append_workout(catalog.shrink_entry(entry)); counts['workouts'] += 1
+    return counts
+
+
+def shard_json_users(source, data_dir=DATA_DIR, shard_count=USER_SHARDS):
+    """Writes every user and friendship of `source` (a JsonStorage) into the sharded layout,
+    replacing what is there. Run it with the servers stopped."""
+    users, relationships = source.list_users(), source.store.get('friends_data.json')
+    write_layout(data_dir, users, relationships, shard_count)
+    return {"users": len(users), "friendships": len(relationships)}
+
+def merge_user_shards(source, target):
+    """Writes every user and friendship of `source` (a ShardedStorage) back into users.json
+    and friends_data.json of `target` (a JsonStorage). Relationships stored in two shards
+    are written once."""
+    relationships = {}
+    for file in source.shards.shards:
+        for rel in source.shards.read(file).relationships: relationships[(rel['requester_id'], rel['receiver_id'])] = rel
+    users = source.list_users()
+    with target.store.transaction():
+        target.store.put('users.json', users)
+        target.store.put('friends_data.json', list(relationships.values()))
+    target.store.flush()
+    return {"users": len(users), "friendships": len(relationships)}
+
+
+def create_storage(backend=STORAGE_BACKEND):
+    if backend == 'sqlite': return SqliteStorage()
+    if backend == 'json': return JsonStorage()
+    if backend == 'sharded':
+        sharded = ShardedStorage()
+        atexit.register(sharded.close)
+        return sharded
+    raise ValueError(f"Unknown storage backend: {backend!r} (expected 'json', 'sharded' or 'sqlite')")
+
+
+storage = create_storage()
@@ -0,0 +1,250 @@
+import atexit
+import contextlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+from metrics import registry
+
+try:
+    import fcntl
+except ImportError:  # Windows: only in-process locking is available
+    fcntl = None
+
+# --- Store Configuration ---
+DATA_DIR = os.environ.get('FITNESS_DATA_DIR', os.path.join(os.path.dirname(__file__), 'data'))
+FLUSH_INTERVAL = float(os.environ.get('FITNESS_FLUSH_INTERVAL', '0.5'))  # seconds between write-behind flushes
+# Set when several worker processes (e.g. gunicorn -w N) share one data directory.
+MULTI_WORKER = os.environ.get('FITNESS_MULTI_WORKER', '0').lower() in ('1', 'true', 'yes')
+REVALIDATE_INTERVAL = float(os.environ.get('FITNESS_REVALIDATE_INTERVAL', '1.0'))  # seconds between on-disk change checks
+LOCK_FILENAME = '.store.lock'
+
+LOAD_SECONDS = registry.histogram('fitness_store_load_seconds', 'Time to read and parse a data file (load_data).', ('file',))
+READ_BYTES = registry.counter('fitness_store_read_bytes_total', 'Bytes of data files read (load_data).', ('file',))
+FLUSH_SECONDS = registry.histogram('fitness_store_flush_seconds', 'Time to serialize and write a data file (save_data).', ('file',))
+WRITTEN_BYTES = registry.counter('fitness_store_written_bytes_total', 'Bytes of data files written (save_data).', ('file',))
+
+
+# --- File Helpers ---
+def read_json(path, default=None):
+    """Parses a JSON file, returning `default` (an empty list) if it is missing or corrupt."""
+    try:
+        with open(path, 'r') as f: return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError): return [] if default is None else default
+
+def fingerprint(path):
+    """Identifies one version of a file. Atomic renames always change the inode."""
+    try:
+        st = os.stat(path)
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+    except FileNotFoundError:
+        return None
+
+def write_atomic(path, payload):
+    """Writes `payload` (str) to a temp file in the same directory and renames it over `path`.
+    Readers only ever see the old file or the complete new one, never a truncated one."""
+    directory = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path): os.remove(tmp_path)
+        raise
+
+
+# --- In-Memory Data Store ---
+class DataStore:
+    """Process-wide cache of the JSON data files.
+
+    Each file is parsed once on first access and then served from memory. Writes only
+    replace the in-memory collection and mark it dirty; a background writer thread
+    flushes dirty collections in batches, every `flush_interval` seconds, using an
+    atomic rename. Callers that mutate a collection in place must do so inside
+    `transaction()` and call `mark_dirty` (or `put`) before it ends.
+
+    With `multi_worker` set, several processes can share the data directory: a
+    transaction also takes an exclusive file lock, reloads any file another process
+    has replaced since it was read, and writes its changes synchronously before the
+    lock is released, so concurrent read-modify-write cycles never lose updates.
+    """
+
+    def __init__(self, data_dir=DATA_DIR, flush_interval=FLUSH_INTERVAL, multi_worker=MULTI_WORKER):
+        self.data_dir = data_dir
+        self.flush_interval = flush_interval
+        self.multi_worker = multi_worker
+        self.lock = threading.RLock()
+        self._tx_depth = 0
+        self._lock_file = None
+        self._collections = {}
+        self._fingerprints = {}
+        self._checked_at = {}
+        self._dirty = set()
+        self._snapshot_seq = 0
+        self._written_seq = {}  # name -> seq of the newest snapshot on disk
+        self._write_lock = threading.Lock()
+        self._revision = 0       # bumped on every local change
+        self._disk_revision = 0  # newest revision known to be fully on disk
+        self._wakeup = threading.Event()
+        self._writer = None
+        self._closed = False
+
+    def path(self, name):
+        return os.path.join(self.data_dir, name)
+
+    def get(self, name):
+        """Returns the live in-memory collection for `name`, loading it from disk on first use.
+        In multi-worker mode, reads outside a transaction re-check the file at most every
+        REVALIDATE_INTERVAL seconds so changes from other workers show up."""
+        collection = self._collections.get(name)
+        if collection is None or (self.multi_worker and not self._tx_depth
+                                  and time.monotonic() - self._checked_at.get(name, 0) > REVALIDATE_INTERVAL):
+            with self.lock:
+                collection = self._load(name)
+        return collection
+
+    def _load(self, name, revalidate=True):
+        """Loads `name` if it is not cached, or reloads it if the file changed on disk.
+        Caller holds `lock`. Collections with unflushed local changes are never replaced."""
+        collection = self._collections.get(name)
+        if collection is not None and (not revalidate or name in self._dirty): return collection
+        path = self.path(name)
+        current = fingerprint(path)
+        self._checked_at[name] = time.monotonic()
+        if collection is None or current != self._fingerprints.get(name):
+            with LOAD_SECONDS.time(file=name):
+                collection = self._collections[name] = read_json(path)
+            READ_BYTES.inc(current[2] if current else 0, file=name)
+            self._fingerprints[name] = current
+        return collection
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Guards a read-modify-write cycle; nested calls join the outer transaction.
+
+        There is no rollback: collections are live objects, so anything changed before an
+        exception stays in memory and is written by the next flush. Check all input before
+        changing anything (see app._apply_completion)."""
+        with self.lock:
+            if self._tx_depth:
+                self._tx_depth += 1
+                try: yield self
+                finally: self._tx_depth -= 1
+                return
+            self._acquire_file_lock()
+            try:
+                if self.multi_worker:
+                    for name in list(self._collections): self._load(name)
+                self._tx_depth = 1
+                try:
+                    yield self
+                finally:
+                    self._tx_depth = 0
+                    if self.multi_worker: self.flush()
+            finally:
+                self._release_file_lock()
+
+    def _acquire_file_lock(self):
+        if not self.multi_worker or fcntl is None: return
+        self._lock_file = open(self.path(LOCK_FILENAME), 'a')
+        fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+
+    def _release_file_lock(self):
+        if self._lock_file is None: return
+        fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+        self._lock_file.close()
+        self._lock_file = None
+
+    def put(self, name, data):
+        """Replaces the collection for `name` and schedules it for the next flush."""
+        with self.lock:
+            self._collections[name] = data
+            self.mark_dirty(name)
+
+    def mark_dirty(self, name):
+        with self.lock:
+            self._dirty.add(name)
+            self._revision += 1
+            if self._tx_depth and self.multi_worker: return  # written when the transaction ends
+            self._ensure_writer()
+        if self.flush_interval <= 0: self.flush()
+
+    def version(self, *names):
+        """Identifies the current contents of the named collections, e.g. for HTTP ETags.
+        Once changes are on disk this is built from the file fingerprints, so every worker
+        process reports the same version for the same data; unflushed local changes add
+        this process's revision counter."""
+        for name in names: self.get(name)  # loads, or picks up other workers' changes
+        with self.lock:
+            files = [self._fingerprints.get(name) for name in names]
+            local = self._revision if self._revision != self._disk_revision else None
+        return files, local
+
+    def reload(self, name=None):
+        """Drops cached collections so the next `get` re-reads them (e.g. after external tooling rewrote a file)."""
+        with self.lock:
+            self.flush()
+            if name is None:
+                self._collections.clear()
+                self._fingerprints.clear()
+            else:
+                self._collections.pop(name, None)
+                self._fingerprints.pop(name, None)
+
+    def flush(self):
+        """Writes every dirty collection to disk. Serialization happens under the lock so a
+        snapshot is consistent; the disk writes happen outside it, and a snapshot never
+        overwrites a newer one written by a concurrent flush."""
+        with self.lock:
+            self._snapshot_seq += 1
+            seq = self._snapshot_seq
+            pending, started = {}, {}
+            for name in self._dirty:
+                started[name] = time.perf_counter()
+                pending[name] = json.dumps(self._collections[name], separators=(',', ':'))
+            self._dirty.clear()
+            revision = self._revision
+        failed = None
+        with self._write_lock:
+            for name, payload in pending.items():
+                if self._written_seq.get(name, 0) > seq: continue
+                try:
+                    write_atomic(self.path(name), payload)
+                    FLUSH_SECONDS.observe(time.perf_counter() - started[name], file=name)
+                    WRITTEN_BYTES.inc(len(payload), file=name)
+                    self._written_seq[name] = seq
+                    self._fingerprints[name] = fingerprint(self.path(name))
+                except OSError as e:
+                    failed = failed or e
+                    self._dirty.add(name)  # retried on the next flush
+            if not failed: self._disk_revision = max(self._disk_revision, revision)
+        if failed: raise failed
+
+    def close(self):
+        self._closed = True
+        self._wakeup.set()
+        self.flush()
+
+    # --- Background Writer ---
+    def _ensure_writer(self):
+        if self._writer is None and self.flush_interval > 0 and not self._closed:
+            self._writer = threading.Thread(target=self._run_writer, name='datastore-writer', daemon=True)
+            self._writer.start()
+
+    def _run_writer(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"  [ERROR] Could not flush data store: {e}")
+
+
+store = DataStore()
+atexit.register(store.close)
@@ -0,0 +1,150 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+
+from store import REVALIDATE_INTERVAL
+
+# --- Stream Configuration ---
+# Changes touching a user within this many seconds go out as one message per event type.
+COALESCE_WINDOW = float(os.environ.get('FITNESS_STREAM_COALESCE', '1.0'))
+HEARTBEAT_INTERVAL = 15.0   # seconds between keep-alive comments on an idle stream
+MAX_STREAMS_PER_USER = 5    # e.g. one per open tab
+MAX_BACKLOG = 20            # undelivered messages kept per stream; older ones are dropped
+RETRY_MS = 3000             # how long browsers wait before reconnecting
+
+
+def format_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+class Subscription:
+    __slots__ = ('user_id', 'messages', 'ready')
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.messages = deque(maxlen=MAX_BACKLOG)
+        self.ready = threading.Event()
+
+    def push(self, message):
+        self.messages.append(message)
+        self.ready.set()
+
+    def take(self, timeout):
+        """Waits up to `timeout` seconds; returns the pending messages, or None on timeout."""
+        if not self.ready.wait(timeout): return None
+        self.ready.clear()
+        taken = []
+        while self.messages: taken.append(self.messages.popleft())
+        return taken
+
+
+# --- Server-Sent Event Hub ---
+class StreamHub:
+    """Pushes per-user state to open server-sent event streams when it changes.
+
+    `snapshot(user_id)` returns {event name: payload} for everything a user's stream shows.
+    Code that changes something calls `touch()` with every user who can see the change
+    (the user and, for fan-out, their friends); a hub thread recomputes those users'
+    snapshots once per coalescing window and sends only the events whose payload changed.
+    Changes made by other worker processes are found by polling `version()`, which
+    marks every connected user.
+
+    An idle stream does no work between changes, but its generator blocks the request
+    worker thread serving it for as long as the client stays connected.
+    """
+
+    def __init__(self, snapshot, version=None, window=COALESCE_WINDOW, poll_interval=REVALIDATE_INTERVAL):
+        self._snapshot = snapshot
+        self._version = version
+        self.window = window
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)  # user id -> open Subscriptions
+        self._sent = {}                       # user id -> {event name: last payload sent}
+        self._dirty = set()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def subscribe(self, user_id):
+        """Opens a stream for `user_id` and queues its current state; returns None if the
+        user already has MAX_STREAMS_PER_USER open."""
+        state = self._snapshot(user_id)
+        subscription = Subscription(user_id)
+        with self._lock:
+            if len(self._subscribers[user_id]) >= MAX_STREAMS_PER_USER: return None
+            self._subscribers[user_id].add(subscription)
+            self._sent.setdefault(user_id, state)
+            self._ensure_thread()
+        for name, payload in state.items(): subscription.push(format_event(name, payload))
+        self.touch([user_id])  # brings the user's other open streams up to date as well
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscribers.get(subscription.user_id)
+            if subscriptions is None: return
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self._subscribers[subscription.user_id]
+                self._sent.pop(subscription.user_id, None)
+
+    def touch(self, user_ids):
+        """Schedules the given users' streams for a refresh; users without one are ignored."""
+        with self._lock:
+            self._dirty.update(uid for uid in user_ids if uid in self._subscribers)
+            if self._dirty: self._wakeup.set()
+
+    def stream(self, subscription, heartbeat=HEARTBEAT_INTERVAL):
+        """The response body for one subscription: queued events as they arrive, and a
+        comment line when idle so proxies keep the connection open and a client that went
+        away is noticed."""
+        try:
+            yield f"retry: {RETRY_MS}\n\n"
+            while True:
+                messages = subscription.take(heartbeat)
+                if messages is None: yield ': keep-alive\n\n'
+                elif messages: yield ''.join(messages)
+        finally:
+            self.unsubscribe(subscription)
+
+    def connected(self):
+        with self._lock: return sum(len(s) for s in self._subscribers.values())
+
+    # --- Hub Thread ---
+    def _ensure_thread(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='stream-hub', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        version = self._version() if self._version else None
+        while True:
+            self._wakeup.wait(self.poll_interval if self._version else None)
+            self._wakeup.clear()
+            time.sleep(self.window)  # let further changes in this window join the same refresh
+            if self._version:
+                current = self._version()
+                if current != version:
+                    version = current
+                    with self._lock: self._dirty.update(self._subscribers)
+            with self._lock:
+                dirty, self._dirty = self._dirty, set()
+            for user_id in dirty:
+                try:
+                    self._refresh(user_id)
+                except Exception as e:
+                    print(f"  [ERROR] Could not refresh event stream for user {user_id}: {e!r}")
+
+    def _refresh(self, user_id):
+        state = self._snapshot(user_id)
+        with self._lock:
+            if user_id not in self._subscribers: return
+            sent = self._sent.setdefault(user_id, {})
+            changed = [(name, payload) for name, payload in state.items() if sent.get(name) != payload]
+            sent.update(changed)
+            subscriptions = list(self._subscribers[user_id])
+        for name, payload in changed:
+            message = format_event(name, payload)
+            for subscription in subscriptions: subscription.push(message)
@@ -0,0 +1,70 @@
+import atexit
+import itertools
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REFERENCE_FILES = ('exercises.json', 'badges.json', 'quests.json')
+
+# The app reads its configuration at import time: point it at a scratch data directory,
+# write synchronously and handle completion events inline, so tests see the final state.
+_data_dir = tempfile.mkdtemp(prefix='fitness-test-')
+for name in REFERENCE_FILES: shutil.copy(os.path.join(BACKEND_DIR, 'data', name), _data_dir)
+atexit.register(shutil.rmtree, _data_dir, ignore_errors=True)  # registered first, so it runs after the app's own exit hooks
+os.environ.update({'FITNESS_DATA_DIR': _data_dir, 'FITNESS_FLUSH_INTERVAL': '0', 'FITNESS_EVENT_WORKERS': '0',
+                   'FITNESS_PASSWORD_HASH': 'pbkdf2:sha256:1000', 'FITNESS_SECRET_KEY': 'test'})
+sys.path.insert(0, BACKEND_DIR)
+
+_usernames = (f'user{n}' for n in itertools.count(1))
+
+
+@pytest.fixture(scope='session')
+def app_module():
+    import app
+    return app
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+@pytest.fixture
+def signup(client):
+    """Registers and logs in a fresh user; returns (user id, auth headers)."""
+    def signup():
+        username = next(_usernames)
+        client.post('/api/register', json={'username': username, 'password': 'secret123'})
+        login = client.post('/api/login', json={'username': username, 'password': 'secret123'}).get_json()
+        return login['id'], {'Authorization': f"Bearer {login['token']}"}
+    return signup
+
+@pytest.fixture
+def befriend(client):
+    """Makes two signed-up users friends: `user` sends the request and `friend` accepts it.
+    Both are (user id, auth headers) pairs from `signup`."""
+    def befriend(user, friend):
+        (user_id, headers), (friend_id, friend_headers) = user, friend
+        friend_name = client.get(f'/api/user/{friend_id}/stats', headers=friend_headers).get_json()['username']
+        client.post(f'/api/user/{user_id}/friends/request', json={"username_to_add": friend_name}, headers=headers)
+        client.post(f'/api/user/{friend_id}/friends/respond', json={"requester_id": user_id, "action": "accept"},
+                    headers=friend_headers)
+    return befriend
+
+@pytest.fixture(params=('json', 'sharded', 'sqlite'))
+def backend_storage(request, tmp_path):
+    """An empty storage of each backend, in its own data directory, writing synchronously."""
+    from shard_store import ShardStore
+    from storage import JsonStorage, ShardedStorage, SqliteStorage
+    from store import DataStore
+    from workout_log import WorkoutLog
+    if request.param == 'sqlite':
+        yield SqliteStorage(str(tmp_path / 'fitness.db'))
+    elif request.param == 'json':
+        yield JsonStorage(DataStore(str(tmp_path), flush_interval=0), WorkoutLog(str(tmp_path)))
+    else:
+        sharded = ShardedStorage(ShardStore(str(tmp_path), flush_interval=0), WorkoutLog(str(tmp_path)))
+        yield sharded
+        sharded.close()
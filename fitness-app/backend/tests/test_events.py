@@ -0,0 +1,85 @@
+import json
+import threading
+
+import pytest
+
+import events as events_module
+from storage import storage
+from workout_log import is_reward
+
+PUSH_UP = {"id": 1, "name": "Push-up"}
+
+
+@pytest.fixture(autouse=True)
+def no_retry_delay(monkeypatch):
+    monkeypatch.setattr(events_module, 'RETRY_DELAY', 0)
+
+def _fail_reward_writes(monkeypatch, times):
+    """Makes the next `times` reward-entry writes raise OSError."""
+    append_workout, failures = storage.append_workout, iter(range(times))
+    def flaky(entry):
+        if is_reward(entry) and next(failures, None) is not None: raise OSError("disk full")
+        return append_workout(entry)
+    monkeypatch.setattr(storage, 'append_workout', flaky)
+
+def _rewarded_state(user_id):
+    user = storage.get_user(user_id)
+    rewards = [n for n in user.get('notifications', []) if n['type'] == 'workout_rewards']
+    reward_entries = [e for e in storage.workout_history(user_id, include_rewards=True) if is_reward(e)]
+    return (user['xp'], user['level'], user['completed_quests'], user['unlocked_badges'], user['aggregates']['total_workouts'],
+            len(rewards), [e['xp_gained'] for e in reward_entries])
+
+def _complete(client, headers):
+    return client.post('/api/workout/complete', json={"workout": [PUSH_UP]}, headers=headers).get_json()['event_id']
+
+
+def test_retried_completion_applies_rewards_once(client, signup, monkeypatch):
+    expected_id, expected_headers = signup()
+    _complete(client, expected_headers)
+    user_id, headers = signup()
+    _fail_reward_writes(monkeypatch, times=1)
+    _complete(client, headers)
+    state = _rewarded_state(user_id)
+    assert state[-1], "the first workout should earn bonus XP"
+    assert state == _rewarded_state(expected_id)
+
+def test_event_that_keeps_failing_is_kept_for_replay(client, signup, app_module, monkeypatch):
+    expected_id, expected_headers = signup()
+    _complete(client, expected_headers)
+    user_id, headers = signup()
+    _fail_reward_writes(monkeypatch, times=events_module.HANDLER_ATTEMPTS)
+    event_id = _complete(client, headers)
+    assert storage.get_user(user_id)['aggregates']['total_workouts'] == 0, "nothing from the failed attempts is saved"
+
+    with open(app_module.events.failed_path) as f:
+        set_aside = [json.loads(line)['event'] for line in f]
+    event = next(e for e in set_aside if e['id'] == event_id)
+    app_module._process_completion(event)
+    app_module._process_completion(event)  # replayed again, e.g. after a crash before the ack
+    assert _rewarded_state(user_id) == _rewarded_state(expected_id)
+
+
+def test_failed_events_are_replayed_by_the_next_process(tmp_path):
+    failing, replayed = events_module.EventBus(data_dir=str(tmp_path), workers=1), []
+    failing.subscribe('ping', lambda event: 1 / 0)
+    event_id = failing.publish('ping', {"n": 1}, key=1)
+    failing.close()
+
+    # Our own pid counts as gone for a new bus (see events._process_alive), like after a restart.
+    restarted = events_module.EventBus(data_dir=str(tmp_path), workers=1)
+    restarted.subscribe('ping', replayed.append)
+    restarted.start()
+    restarted.wait_idle()
+    restarted.close()
+    assert [event['id'] for event in replayed] == [event_id]
+
+def test_wait_for_blocks_until_the_keys_events_are_handled(tmp_path):
+    bus, release, handled = events_module.EventBus(data_dir=str(tmp_path), workers=2), threading.Event(), []
+    bus.subscribe('ping', lambda event: (release.wait(5), handled.append(event['key'])))
+    bus.publish('ping', {}, key='busy')
+    assert bus.wait_for('idle', timeout=0)
+    assert not bus.wait_for('busy', timeout=0.05)
+    release.set()
+    assert bus.wait_for('busy', timeout=5)
+    assert handled == ['busy']
+    bus.close()
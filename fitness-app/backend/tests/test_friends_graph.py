@@ -0,0 +1,82 @@
+import pytest
+
+from friends_graph import FriendGraph
+
+
+@pytest.fixture
+def graph():
+    """ann-bob-cat-dan in a line of accepted friendships, plus eve with no friends."""
+    users = [{"id": i, "username": name} for i, name in enumerate(('ann', 'bob', 'cat', 'dan', 'eve'), 1)]
+    relationships = [{"requester_id": a, "receiver_id": b, "status": "accepted"} for a, b in ((1, 2), (2, 3), (3, 4))]
+    return FriendGraph(users, relationships)
+
+def _state(graph):
+    """What the queries return for every user."""
+    return {uid: (graph.friend_ids(uid), [(u['id'], n) for u, n in graph.suggestions(uid, 10)],
+                  sorted((r['requester_id'], r['receiver_id']) for r in graph.relationships_for(uid)))
+            for uid in graph.users}
+
+def _assert_consistent(graph):
+    """The incrementally updated index answers like one built from scratch."""
+    assert _state(graph) == _state(FriendGraph(list(graph.users.values()), list(graph.edges.values())))
+
+
+def test_request_accept_and_remove(graph):
+    request = {"requester_id": 1, "receiver_id": 3, "status": "pending"}
+    graph.add(request)
+    _assert_consistent(graph)
+    assert graph.friend_ids(1) == {2}
+    assert 3 not in [u['id'] for u, _ in graph.suggestions(1, 10)]  # already asked
+    assert graph.relationship(3, 1) is request
+
+    request['status'] = 'accepted'
+    graph.update(request)
+    _assert_consistent(graph)
+    assert graph.friend_ids(1) == {2, 3}
+    assert graph.friend_ids(3) == {1, 2, 4}
+    assert [(u['id'], n) for u, n in graph.suggestions(1, 10)] == [(4, 1)]
+
+    graph.remove(request)
+    _assert_consistent(graph)
+    assert graph.friend_ids(1) == {2}
+    assert graph.friend_ids(3) == {2, 4}
+    assert [(u['id'], n) for u, n in graph.suggestions(1, 10)] == [(3, 1)]
+    assert graph.relationship(1, 3) is None
+
+def test_suggestions_rank_by_mutual_friends(graph):
+    for a, b in ((5, 2), (5, 3)): graph.add({"requester_id": a, "receiver_id": b, "status": "accepted"})
+    _assert_consistent(graph)
+    assert [(u['id'], n) for u, n in graph.suggestions(1, 10)] == [(3, 1), (5, 1)]
+    assert [(u['id'], n) for u, n in graph.suggestions(4, 10)] == [(2, 1), (5, 1)]
+    assert [(u['id'], n) for u, n in graph.suggestions(2, 10)] == [(4, 1)]
+    assert [(u['id'], n) for u, n in graph.suggestions(1, 1)] == [(3, 1)]
+
+def test_renamed_user_is_found_by_the_new_name_only(graph):
+    graph.add_user({"id": 1, "username": 'Annie'})
+    assert graph.by_username['annie']['id'] == 1
+    assert 'ann' not in graph.by_username
+
+
+def test_friend_endpoints(client, signup, befriend):
+    user, friend = signup(), signup()
+    (user_id, headers), (friend_id, friend_headers) = user, friend
+    befriend(user, friend)
+    friends = client.get(f'/api/user/{user_id}/friends', headers=headers).get_json()
+    assert [f['id'] for f in friends['friends']] == [friend_id]
+    assert client.get(f'/api/user/{friend_id}/friends', headers=friend_headers).get_json()['pending_requests'] == []
+
+    stranger_id, stranger_headers = signup()
+    befriend((stranger_id, stranger_headers), friend)
+    assert [s['id'] for s in client.get(f'/api/user/{user_id}/friends/suggestions', headers=headers).get_json()] == [stranger_id]
+    assert client.post(f'/api/user/{user_id}/friends/respond', json={"requester_id": stranger_id, "action": "accept"},
+                       headers=headers).status_code == 404  # nothing pending between them
+
+def test_declined_request_is_removed(client, signup):
+    (user_id, headers), (other_id, other_headers) = signup(), signup()
+    name = client.get(f'/api/user/{user_id}/stats', headers=headers).get_json()['username']
+    client.post(f'/api/user/{other_id}/friends/request', json={"username_to_add": name}, headers=other_headers)
+    assert [r['id'] for r in client.get(f'/api/user/{user_id}/friends', headers=headers).get_json()['pending_requests']] == [other_id]
+    client.post(f'/api/user/{user_id}/friends/respond', json={"requester_id": other_id, "action": "decline"}, headers=headers)
+    assert client.get(f'/api/user/{user_id}/friends', headers=headers).get_json() == {"friends": [], "pending_requests": []}
+    assert client.post(f'/api/user/{other_id}/friends/request', json={"username_to_add": name},
+                       headers=other_headers).status_code == 200  # can ask again
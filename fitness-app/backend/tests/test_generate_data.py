@@ -0,0 +1,12 @@
+import os
+
+import pytest
+
+import generate_data
+
+
+def test_synthetic_data_never_overwrites_the_app_data(tmp_path):
+    before = sorted(os.listdir(generate_data.SOURCE_DATA_DIR))
+    with pytest.raises(ValueError):
+        generate_data.generate_synthetic(generate_data.SOURCE_DATA_DIR + os.sep, users=1, friendships=0, workouts=0, seed=1)
+    assert sorted(os.listdir(generate_data.SOURCE_DATA_DIR)) == before
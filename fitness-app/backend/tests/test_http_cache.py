@@ -0,0 +1,42 @@
+import copy
+
+from sessions import sessions
+from storage import storage
+
+PUSH_UP = {"id": 1, "name": "Push-up"}
+VERSIONED_PATHS = ('stats', 'quests', 'history', 'history/summary', 'notifications', 'friends', 'leaderboard')
+
+
+def _get(client, path, headers, etag=None):
+    return client.get(path, headers=dict(headers, **({'If-None-Match': etag} if etag else {})))
+
+
+def test_unchanged_data_answers_304(client, signup):
+    user_id, headers = signup()
+    for path in VERSIONED_PATHS:
+        first = _get(client, f'/api/user/{user_id}/{path}', headers)
+        assert first.status_code == 200 and first.headers['ETag'], path
+        again = _get(client, f'/api/user/{user_id}/{path}', headers, first.headers['ETag'])
+        assert again.status_code == 304, path
+        assert again.headers['ETag'] == first.headers['ETag'], path
+
+def test_completion_changes_the_etag(client, signup):
+    user_id, headers = signup()
+    before = _get(client, f'/api/user/{user_id}/stats', headers)
+    client.post('/api/workout/complete', json={"workout": [PUSH_UP]}, headers=headers)
+    after = _get(client, f'/api/user/{user_id}/stats', headers, before.headers['ETag'])
+    assert after.status_code == 200
+    assert after.get_json()['total_workouts'] == 1
+
+def test_stale_session_record_is_not_served_under_a_current_etag(client, signup):
+    user_id, headers = signup()
+    stale = copy.deepcopy(storage.get_user(user_id))
+    with storage.transaction(user_id):  # another worker's change, not yet seen by this worker's session cache
+        user = storage.get_user(user_id)
+        user['xp'] = 42
+        storage.save_user(user)
+    sessions.update_user(stale)
+    response = _get(client, f'/api/user/{user_id}/stats', headers)
+    assert response.get_json()['xp'] == 42
+    cached = _get(client, f'/api/user/{user_id}/stats', headers, response.headers['ETag'])
+    assert cached.status_code == 304
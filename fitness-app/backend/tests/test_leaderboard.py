@@ -0,0 +1,76 @@
+import pytest
+
+import leaderboard as leaderboard_module
+from leaderboard import Leaderboard
+from storage import SqliteStorage
+from workout_log import REWARD_KIND
+
+WEEK_1, WEEK_2 = '2024-01-01', '2024-01-08'
+PUSH_UP = {"id": 1, "name": "Push-up"}
+
+
+@pytest.fixture
+def week(monkeypatch):
+    """The leaderboard's current week; set ['start'] to move time forward."""
+    current = {'start': WEEK_1}
+    monkeypatch.setattr(leaderboard_module, 'current_week_start', lambda now=None: current['start'])
+    return current
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = SqliteStorage(str(tmp_path / 'fitness.db'))
+    for name in ('ann', 'bob', 'cat', 'dan'): storage.create_user({"username": name})
+    return storage
+
+def _log(storage, user_id, xp, day=WEEK_1, **extra):
+    storage.append_workout({"userId": user_id, "date": f'{day}T09:00:00', "xp_gained": xp, **extra})
+
+def _ranking(entries):
+    return [(e['username'], e['weekly_xp']) for e in entries]
+
+
+def test_pages_and_ranks(storage, week):
+    for user_id, xp in ((1, 10), (2, 40), (3, 30), (4, 20)): _log(storage, user_id, xp)
+    board = Leaderboard(storage)
+    assert board.page(0, 2) == (4, [{"rank": 1, "id": 2, "username": 'bob', "weekly_xp": 40},
+                                    {"rank": 2, "id": 3, "username": 'cat', "weekly_xp": 30}])
+    assert _ranking(board.page(2, 2)[1]) == [('dan', 20), ('ann', 10)]
+    assert board.page(4, 2) == (4, [])
+    assert board.rank(1) == {"rank": 4, "weekly_xp": 10}
+    assert board.rank(99) is None
+
+def test_among_ranks_only_the_given_users(storage, week):
+    for user_id, xp in ((1, 10), (2, 40), (3, 30)): _log(storage, user_id, xp)
+    board = Leaderboard(storage)
+    assert [(e['rank'], e['username']) for e in board.among({1, 3, 99})] == [(1, 'cat'), (2, 'ann')]
+
+def test_tails_new_log_entries_including_rewards(storage, week):
+    _log(storage, 1, 10)
+    board = Leaderboard(storage)
+    assert board.rank(1)['weekly_xp'] == 10
+    _log(storage, 2, 30)
+    _log(storage, 1, 25, kind=REWARD_KIND)
+    _log(storage, 1, 50, day='2023-12-31')  # logged late, but for last week
+    assert _ranking(board.page()[1])[:2] == [('ann', 35), ('bob', 30)]
+
+def test_ranking_resets_every_week(storage, week):
+    _log(storage, 1, 10)
+    _log(storage, 2, 20)
+    board = Leaderboard(storage)
+    assert board.rank(2) == {"rank": 1, "weekly_xp": 20}
+    week['start'] = WEEK_2
+    assert _ranking(board.page()[1]) == [('ann', 0), ('bob', 0), ('cat', 0), ('dan', 0)]
+    _log(storage, 1, 5, day=WEEK_2)
+    assert board.rank(1) == {"rank": 1, "weekly_xp": 5}
+
+
+def test_friends_leaderboard_endpoint_lists_only_friends(client, signup, befriend):
+    user, friend = signup(), signup()
+    (user_id, headers), (friend_id, friend_headers) = user, friend
+    stranger_id, stranger_headers = signup()
+    befriend(user, friend)
+    for h in (friend_headers, stranger_headers): client.post('/api/workout/complete', json={"workout": [PUSH_UP]}, headers=h)
+
+    board = client.get(f'/api/user/{user_id}/leaderboard', headers=headers).get_json()
+    assert [e['id'] for e in board['entries']] == [friend_id, user_id]
+    assert board['me']['rank'] > 1
@@ -0,0 +1,57 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from metrics import COMPACTED_FILENAME, Registry
+
+
+@pytest.fixture
+def registry(tmp_path):
+    registry = Registry()
+    registry.directory = str(tmp_path)  # as share() would, without the background writer
+    return registry
+
+@pytest.fixture
+def dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+def _write(registry, name, value):
+    with open(os.path.join(registry.directory, name), 'w') as f:
+        json.dump({"test_total": [[[], value]]}, f)
+
+def _total(registry):
+    line = next(l for l in registry.render().splitlines() if l.startswith('test_total '))
+    return int(line.split()[1])
+
+
+def test_exited_processes_are_compacted_without_losing_counts(registry, dead_pid):
+    counter = registry.counter('test_total', 'A test counter.')
+    counter.inc()
+    registry.flush()
+    _write(registry, f'{dead_pid}-1000.json', 5)
+    _write(registry, f'{dead_pid}.json', 2)  # written before files carried a start time
+    assert _total(registry) == 8
+    assert sorted(os.listdir(registry.directory)) == sorted([COMPACTED_FILENAME, registry.filename, '.compact.lock'])
+    assert _total(registry) == 8
+    _write(registry, f'{dead_pid}-2000.json', 4)
+    assert _total(registry) == 12
+
+def test_a_reused_pid_does_not_overwrite_the_old_process_totals(registry):
+    counter = registry.counter('test_total', 'A test counter.')
+    _write(registry, f'{os.getpid()}-1.json', 3)  # an earlier process that had our pid
+    counter.inc()
+    registry.flush()
+    assert _total(registry) == 4
+
+def test_a_folded_file_left_behind_is_not_counted_twice(registry, dead_pid):
+    registry.counter('test_total', 'A test counter.')
+    _write(registry, f'{dead_pid}-1000.json', 5)
+    with open(os.path.join(registry.directory, COMPACTED_FILENAME), 'w') as f:  # folded, then crashed before deleting
+        json.dump({"folded": [f'{dead_pid}-1000.json'], "values": {"test_total": [[[], 5]]}}, f)
+    assert _total(registry) == 5
+    assert not os.path.exists(os.path.join(registry.directory, f'{dead_pid}-1000.json'))
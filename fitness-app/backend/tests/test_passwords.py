@@ -0,0 +1,50 @@
+import threading
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+from passwords import HasherBusy, PasswordHasher
+from storage import storage
+
+
+@pytest.fixture
+def saturated_hasher():
+    """A hasher with one worker, no queue, and that worker busy until the test ends."""
+    hasher, release, started = PasswordHasher(workers=1, queue=0), threading.Event(), threading.Event()
+    busy = threading.Thread(target=hasher._run, args=('hash', lambda: (started.set(), release.wait(5))))
+    busy.start()
+    started.wait(5)
+    yield hasher
+    release.set()
+    busy.join()
+
+
+def test_legacy_hash_is_upgraded_on_login(client, signup, app_module):
+    user_id, headers = signup()
+    legacy_hash = generate_password_hash('secret123', 'pbkdf2:sha256:500')
+    with storage.transaction(user_id):
+        user = storage.get_user(user_id)
+        user['password_hash'] = legacy_hash
+        storage.save_user(user)
+    assert app_module.hasher.needs_rehash(legacy_hash)
+
+    login = client.post('/api/login', json={"username": user['username'], "password": 'secret123'})
+    assert login.status_code == 200
+    upgraded = storage.get_user(user_id)['password_hash']
+    assert upgraded != legacy_hash and not app_module.hasher.needs_rehash(upgraded)
+    assert client.post('/api/login', json={"username": user['username'], "password": 'secret123'}).status_code == 200
+
+def test_saturated_hasher_turns_calls_away(saturated_hasher):
+    with pytest.raises(HasherBusy): saturated_hasher.hash('secret123')
+    with pytest.raises(HasherBusy): saturated_hasher.verify('', 'secret123')
+
+def test_login_and_register_answer_503_while_hashing_is_saturated(client, signup, app_module, saturated_hasher, monkeypatch):
+    user_id, headers = signup()
+    username = storage.get_user(user_id)['username']
+    monkeypatch.setattr(app_module, 'hasher', saturated_hasher)
+    for path, body in (('/api/login', {"username": username, "password": 'secret123'}),
+                       ('/api/register', {"username": 'newcomer', "password": 'secret123'})):
+        response = client.post(path, json=body)
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '1'
+    assert storage.find_user_by_username('newcomer') is None
@@ -0,0 +1,61 @@
+from datetime import datetime
+
+from rewards import RewardEngine, WorkoutContext, changed_counters
+
+MONDAY, TUESDAY, NEXT_MONDAY = datetime(2024, 1, 1, 9), datetime(2024, 1, 2, 9), datetime(2024, 1, 8, 9)
+
+
+def _user():
+    return {"id": 1, "xp": 0, "level": 1, "streak_count": 1, "completed_quests": [], "unlocked_badges": []}
+
+def _evaluate(engine, user, now, workouts_today=1, workouts_in_week=1):
+    entry = {"userId": user['id'], "date": now.isoformat(), "exercise_ids": [], "muscle_mask": 0, "xp_gained": 10}
+    ctx = WorkoutContext(user, entry, now, total_workouts=workouts_in_week, workouts_today=workouts_today,
+                         workouts_in_week=workouts_in_week, week_day_masks={}, equipment_workouts={}, period_workouts={})
+    ctx.changed = changed_counters(entry)
+    return engine.evaluate(user, ctx)
+
+
+# --- Quest Windows ---
+def test_an_older_completion_evaluated_late_does_not_reopen_the_window():
+    engine, user = RewardEngine(), _user()
+    _evaluate(engine, user, TUESDAY)
+    windows, completed, xp = dict(user['quest_windows']), list(user['completed_quests']), user['xp']
+    assert 'd101' in completed
+
+    bonus_xp, quests, badges = _evaluate(engine, user, MONDAY)
+    assert [q['id'] for q in quests if q['type'] == 'daily'] == []
+    assert user['quest_windows'] == windows
+    assert set(completed) <= set(user['completed_quests'])
+    assert user['xp'] == xp + bonus_xp
+
+def test_daily_quest_is_awarded_once_per_day():
+    engine, user = RewardEngine(), _user()
+    awarded = lambda now, **counts: [q['id'] for q in _evaluate(engine, user, now, **counts)[1] if q['type'] == 'daily']
+    assert awarded(MONDAY) == ['d101']
+    assert awarded(MONDAY.replace(hour=18), workouts_today=2) == []
+    assert awarded(TUESDAY) == ['d101']
+
+def test_weekly_quest_is_awarded_once_per_week():
+    engine, user = RewardEngine(), _user()
+    awarded = lambda now, n: [q['id'] for q in _evaluate(engine, user, now, workouts_in_week=n)[1] if q['type'] == 'weekly']
+    assert awarded(MONDAY, 2) == []
+    assert awarded(MONDAY, 3) == ['w201']
+    assert awarded(TUESDAY, 4) == []
+    assert awarded(NEXT_MONDAY, 3) == ['w201']
+    assert user['quests_completed_total'] == 5  # d101 on each of the three days, w201 in both weeks
+
+
+# --- Rule Index ---
+def test_only_rules_indexed_under_changed_counters_are_evaluated():
+    engine, user = RewardEngine(), _user()
+    engine._refresh()
+    evaluated = []
+    for rule in engine.quests + engine.badges:
+        rule.evaluate = (lambda rule, evaluate: lambda ctx: evaluated.append(rule.id) or evaluate(ctx))(rule, rule.evaluate)
+    _evaluate(engine, user, MONDAY)  # no muscle groups, equipment or time-of-day period; no level-up or streak change
+
+    changed = {'workout', 'total_workouts', 'workouts_in_week', 'quests_completed'}
+    expected = [r.id for r in engine.quests + engine.badges if r.depends_on & changed]
+    assert sorted(evaluated) == sorted(expected)
+    assert {'b004', 'b006', 'b008', 'b010', 'd102'}.isdisjoint(evaluated)
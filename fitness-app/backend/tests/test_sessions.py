@@ -0,0 +1,56 @@
+from sessions import SessionCache
+from storage import storage
+
+
+def _login(client, user_id, password='secret123'):
+    username = storage.get_user(user_id)['username']
+    return client.post('/api/login', json={"username": username, "password": password})
+
+def _status(client, user_id, token):
+    return client.get(f'/api/user/{user_id}/stats', headers={"Authorization": f"Bearer {token}"}).status_code
+
+
+# --- Signing Out ---
+def test_logout_invalidates_every_token_of_the_user(client, signup):
+    user_id, headers = signup()
+    other_device = _login(client, user_id).get_json()['token']
+    version = storage.get_user(user_id).get('session_version', 0)
+    assert _status(client, user_id, other_device) == 200
+
+    assert client.post('/api/logout', headers=headers).status_code == 200
+    assert storage.get_user(user_id)['session_version'] == version + 1
+    assert client.get(f'/api/user/{user_id}/stats', headers=headers).status_code == 401
+    assert _status(client, user_id, other_device) == 401
+    assert _status(client, user_id, _login(client, user_id).get_json()['token']) == 200
+
+def test_password_change_invalidates_old_tokens(client, signup):
+    user_id, headers = signup()
+    version = storage.get_user(user_id).get('session_version', 0)
+    response = client.post('/api/password', json={"current_password": 'secret123', "new_password": 'changed456'}, headers=headers)
+    assert response.status_code == 200
+    assert storage.get_user(user_id)['session_version'] == version + 1
+    assert client.get(f'/api/user/{user_id}/stats', headers=headers).status_code == 401
+    assert _status(client, user_id, response.get_json()['token']) == 200
+    assert _login(client, user_id).status_code == 401
+    assert _login(client, user_id, 'changed456').status_code == 200
+
+
+# --- Token Checks ---
+def test_tampered_token_is_rejected(client, signup):
+    user_id, headers = signup()
+    token = headers['Authorization'][len('Bearer '):]
+    tampered = ('A' if token[0] != 'A' else 'B') + token[1:]  # the last character may only hold padding bits
+    assert _status(client, user_id, tampered) == 401
+    assert _status(client, user_id, token) == 200
+
+def test_expired_token_is_rejected(client, signup, app_module, monkeypatch):
+    user_id, headers = signup()
+    token = headers['Authorization'][len('Bearer '):]
+    user = storage.get_user(user_id)
+    fresh_cache = lambda ttl: SessionCache(storage.get_user, 'test', ttl=ttl)  # nothing cached: the signature is checked
+    assert fresh_cache(ttl=3600).resolve(token)['id'] == user_id
+    assert fresh_cache(ttl=-1).resolve(token) is None
+
+    monkeypatch.setattr(app_module.sessions, 'ttl', -1)
+    expired = app_module.sessions.issue(user)  # cached, but already past its expiry
+    assert _status(client, user_id, expired) == 401
@@ -0,0 +1,31 @@
+import json
+import sqlite3
+
+from friends_graph import username_key
+from storage import SqliteStorage
+
+
+def test_plain_sqlite_clients_can_write_users(tmp_path):
+    path = str(tmp_path / 'fitness.db')
+    storage = SqliteStorage(path)
+    storage.create_user({"username": "Alice"})
+    conn = sqlite3.connect(path)  # no application functions registered
+    with conn:
+        conn.execute("INSERT INTO users (username, username_key, data) VALUES ('Bob', 'bob', ?)",
+                     (json.dumps({"id": 2, "username": "Bob"}),))
+    conn.close()
+    assert storage.find_user_by_username('BOB')['username'] == 'Bob'
+    assert storage.find_user_by_username('alice')['id'] == 1
+
+def test_databases_indexed_on_a_function_are_migrated(tmp_path):
+    path = str(tmp_path / 'fitness.db')
+    conn = sqlite3.connect(path)
+    conn.create_function('username_key', 1, username_key, deterministic=True)
+    with conn:
+        conn.executescript("CREATE TABLE users (id INTEGER PRIMARY KEY, username TEXT NOT NULL, data TEXT NOT NULL);"
+                           "CREATE UNIQUE INDEX idx_users_username_key ON users (username_key(username));")
+        conn.execute("INSERT INTO users (username, data) VALUES ('Alice', ?)", (json.dumps({"id": 1, "username": "Alice"}),))
+    conn.close()
+    storage = SqliteStorage(path)
+    assert storage.find_user_by_username('ALICE')['id'] == 1
+    assert SqliteStorage(path).find_user_by_username('alice')['id'] == 1  # a second start finds nothing to migrate
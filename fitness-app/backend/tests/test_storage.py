@@ -0,0 +1,129 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from shard_store import SHARD_DIRNAME, ShardStore
+from storage import JsonStorage, ShardedStorage
+from store import DataStore
+from workout_log import REWARD_KIND, WorkoutLog
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _create(storage, *names):
+    return [storage.create_user({"username": name, "level": 1})['id'] for name in names]
+
+def _workout(user_id, date, xp=10):
+    return {"userId": user_id, "date": date, "exercise_ids": [1], "muscle_mask": 1, "xp_gained": xp}
+
+
+# --- Every Backend ---
+def test_users(backend_storage):
+    ann, bob = _create(backend_storage, 'Ann', 'Bob')
+    assert (ann, bob) == (1, 2)
+    assert backend_storage.find_user_by_username('ANN')['id'] == ann
+    assert backend_storage.find_user_by_username('nobody') is None
+    with backend_storage.transaction(bob):
+        user = backend_storage.get_user(bob)
+        user['level'] = 3
+        backend_storage.save_user(user)
+    assert backend_storage.get_user(bob)['level'] == 3
+    assert [u['username'] for u in backend_storage.list_users()] == ['Ann', 'Bob']
+
+def test_friendships(backend_storage):
+    ann, bob, cat = _create(backend_storage, 'ann', 'bob', 'cat')
+    for requester, receiver in ((ann, bob), (cat, bob)):
+        with backend_storage.transaction(requester, receiver):
+            backend_storage.add_relationship({"requester_id": requester, "receiver_id": receiver, "status": "pending"})
+    assert [r['id'] for r in backend_storage.pending_requests_for(bob)] == [ann, cat]
+    assert backend_storage.friend_ids(bob) == set()
+
+    for requester in (ann, cat):
+        with backend_storage.transaction(requester, bob):
+            rel = backend_storage.find_relationship(bob, requester)
+            rel['status'] = 'accepted'
+            backend_storage.save_relationship(rel)
+    assert backend_storage.pending_requests_for(bob) == []
+    assert backend_storage.friend_ids(bob) == {ann, cat}
+    assert [f['username'] for f in backend_storage.friends_of(bob)] == ['ann', 'cat']
+    assert [(s['id'], s['mutual_friends']) for s in backend_storage.suggest_friends(ann, 10)] == [(cat, 1)]
+
+    with backend_storage.transaction(ann, bob):
+        backend_storage.delete_relationship(backend_storage.find_relationship(ann, bob))
+    assert backend_storage.find_relationship(bob, ann) is None
+    assert backend_storage.friend_ids(bob) == {cat}
+    assert backend_storage.suggest_friends(ann, 10) == []
+
+def test_workout_history(backend_storage):
+    ann, bob = _create(backend_storage, 'ann', 'bob')
+    version = backend_storage.version()
+    backend_storage.append_workout(_workout(ann, '2024-01-01T08:00:00'))
+    assert backend_storage.version() != version
+    entries, cursor = backend_storage.workouts_after(None)
+    backend_storage.append_workouts([_workout(bob, '2024-01-02T08:00:00'), _workout(ann, '2024-01-03T08:00:00', 20),
+                                     {"userId": ann, "date": '2024-01-03T08:00:00', "kind": REWARD_KIND, "xp_gained": 25,
+                                      "event_id": 'e1'}])
+    assert [e['xp_gained'] for e in backend_storage.workout_history(ann)] == [10, 20]
+    assert [e['xp_gained'] for e in backend_storage.workout_history(ann, include_rewards=True)] == [10, 20, 25]
+    assert [(e['userId'], e['xp_gained']) for e in backend_storage.workouts_after(cursor)[0]] == [(bob, 10), (ann, 20), (ann, 25)]
+
+    page, next_before = backend_storage.workout_page(ann, limit=1)
+    assert [e['date'][:10] for e in page] == ['2024-01-03']
+    assert [e['date'][:10] for e in backend_storage.workout_page(ann, before=next_before)[0]] == ['2024-01-01']
+    assert backend_storage.workout_page(ann, since='2024-01-02')[0] == page
+
+    assert backend_storage.has_reward_for(ann, 'e1', '2024-01-03T08:00:00')
+    assert not backend_storage.has_reward_for(ann, 'e2', '2024-01-01T08:00:00')
+    assert not backend_storage.has_reward_for(bob, 'e1', '2024-01-02T08:00:00')
+
+
+# --- Sharded Transactions ---
+def test_nested_transaction_must_stay_within_the_outer_locks(tmp_path):
+    shards = ShardStore(str(tmp_path), flush_interval=0)
+    first, other = 0, 1  # user ids in different shards
+    assert shards.shard_of(first) is not shards.shard_of(other)
+    with shards.transaction(first):
+        with shards.transaction(first):
+            shards.read(shards.shard_of(first)).users[first] = {"id": first, "username": 'ann'}
+            shards.mark_dirty(shards.shard_of(first))
+        with pytest.raises(RuntimeError, match='not locked by the enclosing transaction'):
+            with shards.transaction(first, other): pass
+        with pytest.raises(RuntimeError, match='outside a transaction'): shards.mark_dirty(shards.shard_of(other))
+    with shards.transaction():
+        with shards.transaction(first, other): pass  # everything is held
+    shards.close()
+
+
+# --- manage.py shard-users / unshard-users ---
+def _manage(data_dir, *args):
+    env = dict(os.environ, FITNESS_DATA_DIR=str(data_dir))
+    subprocess.run([sys.executable, 'manage.py', *args], cwd=BACKEND_DIR, env=env, check=True, capture_output=True)
+
+def test_shard_users_and_back(tmp_path):
+    users = [{"id": i, "username": name, "level": 1} for i, name in enumerate(('Ann', 'bob', 'cat', 'dan'), 1)]
+    relationships = [{"requester_id": 1, "receiver_id": 2, "status": "accepted"},
+                     {"requester_id": 3, "receiver_id": 1, "status": "pending"}]
+    (tmp_path / 'users.json').write_text(json.dumps(users))
+    (tmp_path / 'friends_data.json').write_text(json.dumps(relationships))
+
+    _manage(tmp_path, 'shard-users', '--shards', '3')
+    assert sorted(os.listdir(tmp_path / SHARD_DIRNAME)) == ['.revision', 'index.json'] + [f'shard-000{i}.json' for i in range(3)]
+    sharded = ShardedStorage(ShardStore(str(tmp_path), flush_interval=0), WorkoutLog(str(tmp_path)))
+    assert sorted(u['id'] for u in sharded.list_users()) == [1, 2, 3, 4]
+    assert sharded.find_user_by_username('ANN')['id'] == 1
+    assert sharded.friend_ids(1) == {2}
+    assert [r['id'] for r in sharded.pending_requests_for(1)] == [3]
+    with sharded.transaction(4, 2):  # a change made while sharded has to survive the way back
+        sharded.add_relationship({"requester_id": 4, "receiver_id": 2, "status": "accepted"})
+    sharded.close()
+
+    (tmp_path / 'users.json').unlink()
+    (tmp_path / 'friends_data.json').unlink()
+    _manage(tmp_path, 'unshard-users')
+    merged = JsonStorage(DataStore(str(tmp_path), flush_interval=0), WorkoutLog(str(tmp_path)))
+    assert merged.list_users() == users
+    assert merged.friend_ids(2) == {1, 4}
+    assert sorted((r['requester_id'], r['receiver_id']) for r in merged.store.get('friends_data.json')) == [(1, 2), (3, 1), (4, 2)]
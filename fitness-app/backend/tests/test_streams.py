@@ -0,0 +1,31 @@
+import json
+
+PUSH_UP = {"id": 1, "name": "Push-up"}
+
+
+def _events(chunk):
+    """(event name, data) for each message in a chunk of the stream."""
+    messages = [m for m in chunk.decode().split('\n\n') if m.startswith('event: ')]
+    return [(m.split('\n')[0][len('event: '):], json.loads(m.split('\n')[1][len('data: '):])) for m in messages]
+
+
+def test_friend_completions_are_pushed_as_one_coalesced_update(client, signup, befriend, app_module, monkeypatch):
+    monkeypatch.setattr(app_module.streams, 'window', 0.3)
+    user, friend = signup(), signup()
+    (user_id, headers), (friend_id, friend_headers) = user, friend
+    befriend(user, friend)
+    token = headers['Authorization'].split()[1]
+    response = client.get(f'/api/user/{user_id}/stream?token={token}', buffered=False)
+    chunks = iter(response.response)
+    try:
+        assert next(chunks).startswith(b'retry:')
+        assert {name for name, _ in _events(next(chunks))} == {'friends', 'leaderboard'}
+
+        for _ in range(2): client.post('/api/workout/complete', json={"workout": [PUSH_UP]}, headers=friend_headers)
+        pushed = _events(next(chunks))
+        assert sorted(name for name, _ in pushed) == ['friends', 'leaderboard']  # one message each for both workouts
+        friend_xp = client.get(f'/api/leaderboard?user_id={friend_id}').get_json()['me']['weekly_xp']
+        assert {e['id']: e['weekly_xp'] for e in dict(pushed)['leaderboard']['entries']}[friend_id] == friend_xp > 0
+    finally:
+        response.close()
+    assert app_module.streams.connected() == 0
@@ -0,0 +1,120 @@
+import random
+
+import pytest
+
+from storage import storage
+from workout_generator import _pick
+
+PUSH_UP, SQUAT = {"id": 1, "name": "Push-up"}, {"id": 2, "name": "Squat"}
+
+
+def _state(user_id):
+    user = storage.get_user(user_id)
+    return user['xp'], user['level'], user['streak_count'], storage.workout_history(user_id, include_rewards=True)
+
+
+# --- Single Completions ---
+@pytest.mark.parametrize('workout', [[{"name": "no id"}], [{"id": [1]}], [PUSH_UP, {"id": None}], "Push-up", 5])
+def test_malformed_workout_is_rejected_before_any_change(client, signup, workout):
+    user_id, headers = signup()
+    before = _state(user_id)
+    response = client.post('/api/workout/complete', json={"workout": workout}, headers=headers)
+    assert response.status_code == 400
+    assert _state(user_id) == before
+
+def test_non_object_body_is_rejected(client, signup):
+    user_id, headers = signup()
+    assert client.post('/api/workout/complete', json=[PUSH_UP], headers=headers).status_code == 400
+
+def test_completion_logs_entry_and_xp(client, signup):
+    user_id, headers = signup()
+    response = client.post('/api/workout/complete', json={"workout": [PUSH_UP, SQUAT]}, headers=headers)
+    assert response.status_code == 200
+    assert response.get_json()['xp_gained'] == 60
+    xp, level, streak, history = _state(user_id)
+    assert streak == 1
+    assert [e['exercise_ids'] for e in history if e.get('kind') is None] == [[1, 2]]
+
+
+# --- Workout Generation ---
+@pytest.mark.parametrize('count', ["abc", [3], {"n": 3}, 2.5, True])
+def test_bad_workout_count_is_rejected(client, signup, count):
+    user_id, headers = signup()
+    response = client.post('/api/workout', json={"available_equipment": ["None"], "count": count}, headers=headers)
+    assert response.status_code == 400
+    assert 'count' in response.get_json()['message']
+
+@pytest.mark.parametrize('count, expected', [(3, 3), ("2", 2), (None, None)])
+def test_workout_count(client, signup, app_module, count, expected):
+    user_id, headers = signup()
+    response = client.post('/api/workout', json={"available_equipment": ["None"], "count": count}, headers=headers)
+    assert response.status_code == 200
+    assert len(response.get_json()) == (expected or app_module.DEFAULT_WORKOUT_SIZE)
+
+
+def test_pick_finds_the_last_unused_exercise_in_a_large_bucket():
+    bucket = [{"id": i} for i in range(50)]
+    for seed in range(20):
+        assert _pick(bucket, taken=set(range(1, 50)), avoid=set(), rng=random.Random(seed)) == {"id": 0}
+    assert _pick(bucket, taken=set(range(1, 50)), avoid={0}, rng=random.Random(0)) is None
+
+
+# --- Batch Completions ---
+@pytest.mark.parametrize('body', [[{"date": "2024-01-01T00:00:00"}], "completions", {"completions": "x"}, {"completions": []}])
+def test_batch_needs_a_completions_list(client, signup, body):
+    user_id, headers = signup()
+    assert client.post('/api/workout/complete/batch', json=body, headers=headers).status_code == 400
+
+def test_batch_rejects_malformed_items_without_applying_them(client, signup):
+    user_id, headers = signup()
+    before = _state(user_id)
+    response = client.post('/api/workout/complete/batch', headers=headers, json={"completions": [
+        {"date": "2024-01-01T08:00:00", "workout": [{"name": "no id"}]},
+        {"date": "not a date", "workout": [PUSH_UP]},
+        {"date": "2024-01-01T09:00:00", "workout": [{"id": {"nested": 1}}]},
+        "not an object",
+    ]})
+    assert response.status_code == 200
+    assert [r['status'] for r in response.get_json()['results']] == [400, 400, 400, 400]
+    assert _state(user_id) == before
+
+def test_batch_applies_valid_items_next_to_malformed_ones(client, signup):
+    user_id, headers = signup()
+    response = client.post('/api/workout/complete/batch', headers=headers, json={"completions": [
+        {"date": "2024-01-01T08:00:00", "workout": [PUSH_UP]},
+        {"date": "2024-01-02T08:00:00", "workout": [{"name": "no id"}]},
+        {"date": "2024-01-02T09:00:00", "workout": [SQUAT]},
+    ]})
+    assert [r['status'] for r in response.get_json()['results']] == [200, 400, 200]
+    xp, level, streak, history = _state(user_id)
+    assert [e['exercise_ids'] for e in history if e.get('kind') is None] == [[1], [2]]
+    assert streak == 2
+
+def test_batch_matches_sequential_completions(client, signup):
+    """A batch replaying the same workouts at the same times logs the same entries, earns
+    the same rewards and answers each item like the single endpoint plus its notification."""
+    workouts = [[PUSH_UP], [PUSH_UP, SQUAT], [SQUAT, PUSH_UP, {"id": 3}]]
+    live_id, live_headers = signup()
+    responses = [client.post('/api/workout/complete', json={"workout": w}, headers=live_headers).get_json()
+                 for w in workouts]
+    notifications = client.get(f'/api/user/{live_id}/notifications', headers=live_headers).get_json()['notifications']
+    live_history = storage.workout_history(live_id, include_rewards=True)
+    dates = [e['date'] for e in live_history if e.get('kind') is None]
+
+    batch_id, batch_headers = signup()
+    results = client.post('/api/workout/complete/batch', headers=batch_headers, json={
+        "completions": [{"date": d, "workout": w} for d, w in zip(dates, workouts)]}).get_json()['results']
+
+    for response, notification, result in zip(responses, notifications, results):
+        expected = {k: v for k, v in response.items() if k != 'event_id'}
+        expected['rewards'] = {k: v for k, v in notification.items() if k not in ('type', 'event_id', 'seq')}
+        assert {k: v for k, v in result.items() if k != 'status'} == expected
+    strip = lambda history: [{k: v for k, v in e.items() if k not in ('userId', 'event_id')} for e in history]
+    assert strip(storage.workout_history(batch_id, include_rewards=True)) == strip(live_history)
+    assert any(e.get('kind') == 'reward' for e in live_history)
+    live, batch = storage.get_user(live_id), storage.get_user(batch_id)
+    for field in ('xp', 'level', 'streak_count', 'unlocked_badges', 'completed_quests'):
+        assert batch[field] == live[field], field
+    live_stats = client.get(f'/api/user/{live_id}/stats', headers=live_headers).get_json()
+    batch_stats = client.get(f'/api/user/{batch_id}/stats', headers=batch_headers).get_json()
+    assert {**batch_stats, "username": None} == {**live_stats, "username": None}
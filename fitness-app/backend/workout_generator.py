@@ -0,0 +1,63 @@
+import random
+
+from catalog import catalog
+
+# --- Generator Configuration ---
+DEFAULT_WORKOUT_SIZE = 5
+MAX_WORKOUT_SIZE = 20
+# (minimum level, hardest difficulty offered from that level on)
+LEVEL_DIFFICULTY = [(1, 'Beginner'), (4, 'Intermediate'), (7, 'Advanced')]
+PICK_ATTEMPTS = 8
+
+
+def max_difficulty(level):
+    return next(difficulty for min_level, difficulty in reversed(LEVEL_DIFFICULTY) if level >= min_level)
+
+
+def random_workout(equipment, count=DEFAULT_WORKOUT_SIZE, rng=random):
+    """Any `count` exercises the equipment allows (the original generator)."""
+    pool = catalog.candidates(equipment).exercises
+    return rng.sample(pool, min(len(pool), count))
+
+
+def _pick(candidates, taken, avoid, rng):
+    """One exercise from `candidates` not in `taken` or `avoid`, or None if there is none.
+    Small buckets are scanned; large ones are sampled up to PICK_ATTEMPTS times, and only
+    if every sample was already used is the bucket filtered for what is left."""
+    usable = lambda ex: ex['id'] not in taken and ex['id'] not in avoid
+    if len(candidates) <= PICK_ATTEMPTS:
+        return next(filter(usable, rng.sample(candidates, len(candidates))), None)
+    picked = next(filter(usable, (rng.choice(candidates) for _ in range(PICK_ATTEMPTS))), None)
+    if picked is None:
+        remaining = [ex for ex in candidates if usable(ex)]
+        if remaining: picked = rng.sample(remaining, 1)[0]
+    return picked
+
+
+def balanced_workout(equipment, level=1, recent_ids=(), count=DEFAULT_WORKOUT_SIZE, rng=random):
+    """Picks `count` exercises spread round-robin across muscle groups, capped at the
+    difficulty the user's level allows and avoiding `recent_ids` where possible.
+
+    Works off the cached per-equipment pools in the catalog, so the cost is O(count)
+    regardless of catalog size. Falls back to harder exercises only if nothing at the
+    user's difficulty fits their equipment, and to recent exercises only if there is
+    nothing else left.
+    """
+    pool = catalog.candidates(equipment, max_difficulty(level))
+    if not pool.exercises: pool = catalog.candidates(equipment)
+    groups = [group for group, bucket in pool.by_muscle_group.items() if bucket]
+    rng.shuffle(groups)
+    workout, taken, recent = [], set(), set(recent_ids)
+
+    for avoid in (recent, set()):
+        active = list(groups)
+        while active and len(workout) < count:
+            for group in list(active):
+                if len(workout) >= count: break
+                exercise = _pick(pool.by_muscle_group[group], taken, avoid, rng)
+                if exercise is None:
+                    active.remove(group)
+                    continue
+                workout.append(exercise)
+                taken.add(exercise['id'])
+    return workout
@@ -0,0 +1,210 @@
+import atexit
+import json
+import os
+import threading
+
+from catalog import catalog
+from store import DATA_DIR, fingerprint, read_json, write_atomic
+
+# --- Log Configuration ---
+LOG_FILENAME = 'user_progress.jsonl'
+INDEX_FILENAME = 'user_progress.idx.json'
+LEGACY_FILENAME = 'user_progress.json'
+# Entries of this kind carry bonus XP from quests awarded after the workout they follow
+# (see app._process_completion), tagged with the 'event_id' of that completion when it was
+# handled as an event. They count towards weekly XP but are not workouts.
+REWARD_KIND = 'reward'
+
+
+def is_reward(entry):
+    return entry.get('kind') == REWARD_KIND
+
+
+# --- Append-Only Workout Log ---
+class WorkoutLog:
+    """Append-only workout log stored as JSON Lines, with a per-user byte-offset index.
+
+    Completing a workout is a single appended line; reading a user's history seeks
+    straight to that user's records instead of parsing everyone's. The index is rebuilt
+    lazily by scanning only the bytes appended since it was last brought up to date, so
+    lines written by other processes are picked up on the next read. It is persisted
+    next to the log on shutdown so a restart does not rescan the whole file.
+    """
+
+    def __init__(self, data_dir=DATA_DIR):
+        self.path = os.path.join(data_dir, LOG_FILENAME)
+        self.index_path = os.path.join(data_dir, INDEX_FILENAME)
+        self.legacy_path = os.path.join(data_dir, LEGACY_FILENAME)
+        self._lock = threading.RLock()
+        self._offsets = None  # user id -> list of byte offsets, oldest first
+        self._indexed_to = 0
+
+    # --- Public API ---
+    def append(self, entry):
+        """Appends one workout entry. The line goes out in a single O_APPEND write, so
+        concurrent writers (threads or processes) never interleave partial records."""
+        self.append_many([entry])
+
+    def append_many(self, entries):
+        """Appends several entries, in order, with one write."""
+        payload = b''.join((json.dumps(e, separators=(',', ':')) + '\n').encode('utf-8') for e in entries)
+        with self._lock:
+            self._ensure_open()
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                written = os.write(fd, payload)
+                while written < len(payload): written += os.write(fd, payload[written:])
+            finally: os.close(fd)
+            self._catch_up()
+
+    def history(self, user_id):
+        """Returns every entry for `user_id`, oldest first, reading only that user's lines."""
+        with self._lock:
+            self._ensure_open()
+            self._catch_up()
+            offsets = list(self._offsets.get(user_id, ()))
+        if not offsets: return []
+        entries = []
+        with open(self.path, 'rb') as f:
+            for offset in offsets:
+                f.seek(offset)
+                entries.append(json.loads(f.readline()))
+        return entries
+
+    def iter_history(self, user_id, before=None):
+        """Yields (position, entry) for `user_id`, newest first, reading one line at a time.
+        `position` counts the user's entries from the oldest (0) and works as a pagination
+        cursor: pass it back as `before` to continue after that entry."""
+        with self._lock:
+            self._ensure_open()
+            self._catch_up()
+            offsets = self._offsets.get(user_id, [])  # only ever appended to; a rewrite swaps the whole map
+            end = len(offsets) if before is None else min(before, len(offsets))
+        if end <= 0: return
+        with open(self.path, 'rb') as f:
+            for position in range(end - 1, -1, -1):
+                f.seek(offsets[position])
+                yield position, json.loads(f.readline())
+
+    def count(self, user_id):
+        with self._lock:
+            self._ensure_open()
+            self._catch_up()
+            return len(self._offsets.get(user_id, ()))
+
+    def entries_after(self, offset):
+        """Returns (entries, next_offset) for the complete lines written at or after byte
+        `offset`; lets other components tail the log the same way the index does."""
+        self._ensure_open()
+        entries = []
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(offset)
+                for line in f:
+                    if not line.endswith(b'\n'): break
+                    entries.append(json.loads(line))
+                    offset += len(line)
+        except FileNotFoundError:
+            pass
+        return entries, offset
+
+    def version(self):
+        """Changes whenever the log is appended to or rewritten, by any process."""
+        self._ensure_open()
+        return fingerprint(self.path)
+
+    def iter_all(self):
+        """Yields every entry in file order (used by maintenance commands)."""
+        self._ensure_open()
+        return self._iter_file()
+
+    def _iter_file(self):
+        try:
+            with open(self.path, 'rb') as f:
+                for line in f:
+                    if line.endswith(b'\n'): yield json.loads(line)
+        except FileNotFoundError:
+            return
+
+    def save_index(self):
+        with self._lock:
+            if self._offsets is None: return
+            payload = {"inode": self._inode(), "indexed_to": self._indexed_to,
+                       "offsets": {str(k): v for k, v in self._offsets.items()}}
+            write_atomic(self.index_path, json.dumps(payload, separators=(',', ':')))
+
+    def rewrite(self, entries):
+        """Atomically replaces the whole log with `entries` and rebuilds the index.
+        Used by compaction; normal request handling only ever appends."""
+        with self._lock:
+            write_atomic(self.path, ''.join(json.dumps(e, separators=(',', ':')) + '\n' for e in entries))
+            self._offsets, self._indexed_to = {}, 0
+            self._catch_up()
+            self.save_index()
+
+    # --- Index Maintenance ---
+    def _ensure_open(self):
+        if self._offsets is not None: return
+        with self._lock:
+            if self._offsets is not None: return
+            if not os.path.exists(self.path) and os.path.exists(self.legacy_path):
+                migrate_legacy(self, transform=catalog.shrink_entry)
+                return
+            # A saved index is only trusted for the same file (a rewrite changes the inode).
+            saved = read_json(self.index_path, default={})
+            size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+            if saved and saved.get('inode') == self._inode() and saved.get('indexed_to', 0) <= size:
+                self._offsets = {int(k): v for k, v in saved['offsets'].items()}
+                self._indexed_to = saved['indexed_to']
+            else:
+                self._offsets, self._indexed_to = {}, 0
+
+    def _inode(self):
+        try: return os.stat(self.path).st_ino
+        except FileNotFoundError: return None
+
+    def _catch_up(self):
+        """Indexes complete lines appended since the last scan. A trailing partial line
+        (another process mid-write) is left for the next call."""
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            f.seek(self._indexed_to)
+            offset = self._indexed_to
+            for line in f:
+                if not line.endswith(b'\n'): break
+                user_id = json.loads(line)['userId']
+                self._offsets.setdefault(user_id, []).append(offset)
+                offset += len(line)
+            self._indexed_to = offset
+
+
+# --- Migration ---
+def migrate_legacy(log, transform=None):
+    """Converts the legacy `user_progress.json` array into the append-only log, ordered by
+    user so each user's records sit together on disk, and renames the old file aside."""
+    entries = read_json(log.legacy_path) + list(log._iter_file())
+    if transform: entries = [transform(e) for e in entries]
+    entries.sort(key=lambda e: (e['userId'], e['date']))
+    log.rewrite(entries)
+    try:
+        os.replace(log.legacy_path, log.legacy_path + '.migrated')
+    except FileNotFoundError:
+        pass  # another worker migrated it at the same time
+    return len(entries)
+
+def compact(log, transform=None):
+    """Rewrites the log grouped by user (oldest first), importing the legacy file if present.
+    `transform`, if given, is applied to every entry (e.g. to shrink old-format records)."""
+    with log._lock:
+        if os.path.exists(log.legacy_path):
+            return migrate_legacy(log, transform)
+        entries = sorted((transform(e) if transform else e for e in log._iter_file()), key=lambda e: (e['userId'], e['date']))
+        log.rewrite(entries)
+        return len(entries)
+
+
+workout_log = WorkoutLog()
+atexit.register(workout_log.save_index)
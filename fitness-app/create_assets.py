@@ -1,8 +1,21 @@
+import argparse
+import hashlib
+import io
+import json
+import math
 import os
+import posixpath
+from concurrent.futures import ProcessPoolExecutor
 from PIL import Image, ImageDraw, ImageFont
 
 # --- SCRIPT CONFIGURATION ---
 # This script is designed to be run from the root of your 'fitness-app' directory.
+# Bump RENDER_VERSION whenever the drawing or encoding code changes, so every image is re-rendered.
+RENDER_VERSION = 2
+MANIFEST_NAME = "manifest.json"  # under base_path; read by the backend (backend/assets.py)
+HASH_LENGTH = 10                 # hex digits of the content hash put into output filenames
+BADGE_SIZE = (150, 150)
+WEBP_QUALITY = 80                # lossy WebP is only kept when it beats the lossless encoding
 
 # --- Asset Definitions ---
 # This section lists all the assets we need to create.
@@ -17,6 +30,7 @@ ASSET_CONFIG = {
         ],
         "badges": {
             "path": "badges",
+            "sprite": "badges.png",  # every badge in one sheet, so a profile page loads a single image
             "files": [
                 {"name": "first_step.png", "text": "First Step"}, {"name": "warrior.png", "text": "Warrior"},
                 {"name": "veteran.png", "text": "Veteran"}, {"name": "level_5.png", "text": "LVL 5"},
@@ -36,30 +50,127 @@ ASSET_CONFIG = {
     }
 }
 
+# --- Content Hashing ---
+def source_hash(spec):
+    """Identifies everything an output is rendered from. An unchanged hash means the
+    previous render can be reused."""
+    payload = json.dumps({"spec": spec, "render": RENDER_VERSION}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def hashed_name(rel_path, data, ext):
+    """`images/badges/quest.png` + bytes -> `images/badges/quest.<hash>.<ext>`. Names with
+    a content hash are served as immutable (see backend/http_cache.py)."""
+    digest = hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+    return f"{os.path.splitext(rel_path)[0]}.{digest}.{ext}"
+
+def write_file(base_dir, rel_path, data):
+    path = os.path.join(base_dir, rel_path)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+# --- Image Encoding ---
+def encode_png(img):
+    """Palette PNG: the placeholders are a few flat colours plus anti-aliased text."""
+    out = io.BytesIO()
+    img.quantize(colors=256).save(out, 'PNG', optimize=True)
+    return out.getvalue()
+
+def encode_webp(img):
+    encodings = []
+    for options in ({"lossless": True}, {"quality": WEBP_QUALITY}):
+        out = io.BytesIO()
+        img.save(out, 'WEBP', method=6, **options)
+        encodings.append(out.getvalue())
+    return min(encodings, key=len)
+
+def write_outputs(base_dir, rel_path, img, source, plain=True):
+    """Writes `img` as hashed PNG and WebP copies and, with `plain`, under its plain name
+    too (for pages that link it directly). Returns the manifest entry."""
+    png, webp = encode_png(img), encode_webp(img)
+    entry = {"source": source, "png": hashed_name(rel_path, png, 'png'), "webp": hashed_name(rel_path, webp, 'webp')}
+    if plain: write_file(base_dir, rel_path, png)
+    write_file(base_dir, entry['png'], png)
+    write_file(base_dir, entry['webp'], webp)
+    return entry
+
 # --- Image Generation Function ---
-def create_placeholder_image(path, text, size=(300, 300), bg_color="#ff00ff", font_color="#FFFFFF"):
-    """Creates a colored placeholder image with centered text."""
+def draw_placeholder(text, size=(300, 300), bg_color="#ff00ff", font_color="#FFFFFF"):
+    """Returns a colored placeholder image with centered text."""
+    img = Image.new('RGB', tuple(size), color=bg_color)
+    draw = ImageDraw.Draw(img)
+
+    # Use a basic font, with a fallback for systems that don't have Arial
     try:
-        img = Image.new('RGB', size, color=bg_color)
-        draw = ImageDraw.Draw(img)
-        
-        # Use a basic font, with a fallback for systems that don't have Arial
-        try:
-            font_size = int(size[1] / 5) # Dynamic font size
-            font = ImageFont.truetype("arial.ttf", font_size)
-        except IOError:
-            font = ImageFont.load_default()
-            
-        # Calculate text position to center it
-        text_bbox = draw.textbbox((0, 0), text, font=font)
-        text_width, text_height = text_bbox[2] - text_bbox[0], text_bbox[3] - text_bbox[1]
-        position = ((size[0] - text_width) / 2, (size[1] - text_height) / 2)
-        
-        draw.text(position, text, font=font, fill=font_color)
-        img.save(path)
-        print(f"  [SUCCESS] Created placeholder image: {path}")
+        font_size = int(size[1] / 5) # Dynamic font size
+        font = ImageFont.truetype("arial.ttf", font_size)
+    except IOError:
+        font = ImageFont.load_default()
+
+    # Calculate text position to center it
+    text_bbox = draw.textbbox((0, 0), text, font=font)
+    text_width, text_height = text_bbox[2] - text_bbox[0], text_bbox[3] - text_bbox[1]
+    position = ((size[0] - text_width) / 2, (size[1] - text_height) / 2)
+
+    draw.text(position, text, font=font, fill=font_color)
+    return img
+
+def render_placeholder(base_dir, rel_path, spec, source):
+    """Pool task: renders one image and writes its outputs. Returns (rel_path, entry or None)."""
+    try:
+        img = draw_placeholder(spec["text"], size=spec["size"], bg_color=spec["color"])
+        entry = write_outputs(base_dir, rel_path, img, source)
+        print(f"  [SUCCESS] Created placeholder image: {os.path.join(base_dir, rel_path)}")
+        return rel_path, entry
     except Exception as e:
-        print(f"  [ERROR] Could not create image {path}: {e}")
+        print(f"  [ERROR] Could not create image {os.path.join(base_dir, rel_path)}: {e}")
+        return rel_path, None
+
+# --- Sprite Sheet ---
+def build_sprite(base_dir, rel_path, badge_paths, files, previous):
+    """Packs the badges into a grid, in `badge_paths` order, written under hashed names only.
+    The sheet is keyed by its badges' own source hashes, so it is rebuilt only when one of
+    them changes."""
+    source = source_hash({"sprite": [files[p]['source'] for p in badge_paths], "cell": BADGE_SIZE})
+    if _reusable(base_dir, previous, source): return previous
+    columns = math.ceil(math.sqrt(len(badge_paths)))
+    rows = math.ceil(len(badge_paths) / columns)
+    sheet = Image.new('RGB', (columns * BADGE_SIZE[0], rows * BADGE_SIZE[1]), color="#000000")
+    for index, badge_path in enumerate(badge_paths):
+        with Image.open(os.path.join(base_dir, badge_path)) as badge:
+            position = ((index % columns) * BADGE_SIZE[0], (index // columns) * BADGE_SIZE[1])
+            sheet.paste(badge.convert('RGB').resize(BADGE_SIZE), position)
+    entry = write_outputs(base_dir, rel_path, sheet, source, plain=False)
+    entry.update({"columns": columns, "rows": rows, "cell": list(BADGE_SIZE),
+                  "items": {badge_path: index for index, badge_path in enumerate(badge_paths)}})
+    print(f"  [SUCCESS] Created badge sprite sheet ({len(badge_paths)} badges): {os.path.join(base_dir, rel_path)}")
+    return entry
+
+# --- Manifest ---
+def load_manifest(path):
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"files": {}, "sprites": {}}
+    return {"files": manifest.get("files", {}), "sprites": manifest.get("sprites", {})}
+
+def _reusable(base_dir, entry, source):
+    return (entry is not None and entry.get("source") == source
+            and all(os.path.exists(os.path.join(base_dir, entry[k])) for k in ("png", "webp")))
+
+def remove_stale(base_dir, old, new):
+    """Deletes hashed outputs the new manifest no longer points at."""
+    def outputs(manifest):
+        entries = list(manifest["files"].values()) + list(manifest["sprites"].values())
+        return {entry[k] for entry in entries for k in ("png", "webp")}
+    for rel_path in outputs(old) - outputs(new):
+        try:
+            os.remove(os.path.join(base_dir, rel_path))
+            print(f"  [SUCCESS] Removed stale file: {os.path.join(base_dir, rel_path)}")
+        except FileNotFoundError:
+            pass
 
 # --- Empty File Creation Function ---
 def create_empty_file(path):
@@ -73,39 +184,71 @@ def create_empty_file(path):
 
 # --- Main Execution Block ---
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Renders the app's placeholder images and video files. Only images "
+                                                 "whose definition changed since the last run are re-rendered.")
+    parser.add_argument('--force', action='store_true', help="Re-render every image.")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Rendering processes (default: CPUs).")
+    args = parser.parse_args()
+
     print("--- Starting Fitness App Asset Generator ---\n")
 
-    # Define base paths
+    # Define base paths (images are tracked by their '/'-separated path under base_dir, as in the manifest)
     base_dir = ASSET_CONFIG['base_path']
-    images_dir = os.path.join(base_dir, ASSET_CONFIG['images']['path'])
-    badges_dir = os.path.join(images_dir, ASSET_CONFIG['images']['badges']['path'])
+    images_path = ASSET_CONFIG['images']['path']
+    badges_path = posixpath.join(images_path, ASSET_CONFIG['images']['badges']['path'])
     videos_dir = os.path.join(base_dir, ASSET_CONFIG['videos']['path'])
+    manifest_path = os.path.join(base_dir, MANIFEST_NAME)
 
     # 1. Create directory structure
     print("Step 1: Creating directory structure...")
-    os.makedirs(badges_dir, exist_ok=True)
+    os.makedirs(os.path.join(base_dir, badges_path), exist_ok=True)
     os.makedirs(videos_dir, exist_ok=True)
     print("  [SUCCESS] All directories are ready.\n")
 
-    # 2. Generate Mascot Images
-    print("Step 2: Generating Mascot images...")
-    for asset in ASSET_CONFIG['images']['mascots']:
-        file_path = os.path.join(images_dir, asset["name"])
-        create_placeholder_image(file_path, asset["text"], size=asset["size"], bg_color=asset["color"])
-    print("  -> Mascot generation complete.\n")
-    
-    # 3. Generate Badge Icons
-    print("Step 3: Generating Badge icons...")
-    for asset in ASSET_CONFIG['images']['badges']['files']:
-        file_path = os.path.join(badges_dir, asset["name"])
-        create_placeholder_image(file_path, asset["text"], size=(150, 150), bg_color="#ff00ff")
-    print("  -> Badge generation complete.\n")
-
-    # 4. Generate empty video files (to fix 404s)
-    print("Step 4: Generating empty video file placeholders...")
+    # 2. Render changed Mascot and Badge images in parallel
+    print("Step 2: Rendering Mascot and Badge images...")
+    jobs = {posixpath.join(images_path, a["name"]): {"text": a["text"], "size": list(a["size"]), "color": a["color"]}
+            for a in ASSET_CONFIG['images']['mascots']}
+    badge_paths = [posixpath.join(badges_path, a["name"]) for a in ASSET_CONFIG['images']['badges']['files']]
+    for badge_path, asset in zip(badge_paths, ASSET_CONFIG['images']['badges']['files']):
+        jobs[badge_path] = {"text": asset["text"], "size": list(BADGE_SIZE), "color": "#ff00ff"}
+
+    old_manifest = load_manifest(manifest_path)
+    previous = {"files": {}, "sprites": {}} if args.force else old_manifest
+    files, pending = {}, []
+    for rel_path, spec in jobs.items():
+        source = source_hash(spec)
+        if _reusable(base_dir, previous["files"].get(rel_path), source) and os.path.exists(os.path.join(base_dir, rel_path)):
+            files[rel_path] = previous["files"][rel_path]
+        else:
+            pending.append((base_dir, rel_path, spec, source))
+    if pending:
+        with ProcessPoolExecutor(max_workers=max(1, min(args.workers, len(pending)))) as pool:
+            for rel_path, entry in pool.map(render_placeholder, *zip(*pending)):
+                if entry is not None: files[rel_path] = entry
+    print(f"  -> {len(pending)} rendered, {len(jobs) - len(pending)} unchanged.\n")
+
+    # 3. Pack the Badge icons into one sprite sheet
+    print("Step 3: Building the Badge sprite sheet...")
+    sprite_path = posixpath.join(images_path, ASSET_CONFIG['images']['badges']['sprite'])
+    sprites = {}
+    rendered_badges = [p for p in badge_paths if p in files]
+    if rendered_badges:
+        sprites["badges"] = build_sprite(base_dir, sprite_path, rendered_badges, files, previous["sprites"].get("badges"))
+    print("  -> Sprite sheet is up to date.\n")
+
+    # 4. Write the manifest and drop outputs it no longer references
+    print("Step 4: Writing the asset manifest...")
+    manifest = {"files": files, "sprites": sprites}
+    write_file(base_dir, MANIFEST_NAME, json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    remove_stale(base_dir, old_manifest, manifest)
+    print(f"  [SUCCESS] Wrote {manifest_path}\n")
+
+    # 5. Generate empty video files (to fix 404s); real videos already in place are kept
+    print("Step 5: Generating empty video file placeholders...")
     for filename in ASSET_CONFIG['videos']['files']:
         file_path = os.path.join(videos_dir, filename)
-        create_empty_file(file_path)
+        if not os.path.exists(file_path): create_empty_file(file_path)
     print("  -> Video placeholder generation complete.\n")
 
     print("--- ✅ All assets have been generated successfully! ---")
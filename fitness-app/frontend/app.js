@@ -3,10 +3,12 @@ document.addEventListener('DOMContentLoaded', () => {
 
     // --- User Authentication ---
     const currentUser = JSON.parse(localStorage.getItem('currentUser'));
-    if (!currentUser) {
+    if (!currentUser || !currentUser.token) {
         window.location.href = 'login.html';
         return;
     }
+    // Every API call sends the session token issued at login.
+    const AUTH_HEADERS = { 'Authorization': `Bearer ${currentUser.token}` };
 
     // --- Element Selectors for the HUD ---
     const usernameDisplay = document.getElementById('username-display');
@@ -26,6 +28,10 @@ document.addEventListener('DOMContentLoaded', () => {
     const USER_STATS_API_PATH = `/api/user/${currentUser.id}/stats`;
     const WORKOUT_API_PATH = '/api/workout';
     const COMPLETE_WORKOUT_API_PATH = '/api/workout/complete';
+    // Quests and badges are checked in the background; their outcome shows up here.
+    const NOTIFICATIONS_API_PATH = `/api/user/${currentUser.id}/notifications`;
+    const REWARD_POLL_INTERVAL = 1000; // ms between checks
+    const REWARD_POLL_ATTEMPTS = 10;
 
 
     // --- Core Gamification & UI Functions ---
@@ -105,7 +111,10 @@ document.addEventListener('DOMContentLoaded', () => {
         completeWorkoutBtn.style.display = 'block';
     };
     
-    const logout = () => {
+    const logout = async () => {
+        try {
+            await fetch('/api/logout', { method: 'POST', headers: AUTH_HEADERS });
+        } catch (error) { console.error('Error logging out:', error); }
         localStorage.removeItem('currentUser');
         window.location.href = 'login.html';
     };
@@ -115,7 +124,8 @@ document.addEventListener('DOMContentLoaded', () => {
 
     const loadUserStats = async () => {
         try {
-            const response = await fetch(USER_STATS_API_PATH);
+            const response = await fetch(USER_STATS_API_PATH, { headers: AUTH_HEADERS });
+            if (response.status === 401) return logout(); // session expired or signed out elsewhere
             if (!response.ok) throw new Error('Failed to load user stats.');
             updateHud(await response.json());
         } catch (error) { console.error('Error loading user stats:', error); }
@@ -126,8 +136,8 @@ document.addEventListener('DOMContentLoaded', () => {
         updateMascot('working');
         try {
             const response = await fetch(WORKOUT_API_PATH, {
-                method: 'POST', headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify(currentUser),
+                method: 'POST', headers: { 'Content-Type': 'application/json', ...AUTH_HEADERS },
+                body: JSON.stringify({ ...currentUser, mode: 'balanced' }),
             });
             if (!response.ok) throw new Error('Server could not generate a workout.');
             displayWorkout(await response.json());
@@ -139,7 +149,25 @@ document.addEventListener('DOMContentLoaded', () => {
     };
 
     /**
-     * UPDATED: Sends completed workout and handles the detailed rewards response.
+     * Polls the notification feed until the rewards for a completed workout arrive.
+     * @param {string} eventId - The event_id returned by the complete endpoint.
+     * @returns {object|null} The reward notification, or null if it did not arrive in time.
+     */
+    const waitForRewards = async (eventId) => {
+        for (let attempt = 0; attempt < REWARD_POLL_ATTEMPTS; attempt++) {
+            const response = await fetch(NOTIFICATIONS_API_PATH, { headers: AUTH_HEADERS });
+            if (response.ok) {
+                const { notifications } = await response.json();
+                const rewards = notifications.find(n => n.event_id === eventId);
+                if (rewards) return rewards;
+            }
+            await new Promise(resolve => setTimeout(resolve, REWARD_POLL_INTERVAL));
+        }
+        return null;
+    };
+
+    /**
+     * UPDATED: Sends completed workout, then shows the quests and badges it earned once they have been checked.
      */
     const completeWorkout = async () => {
         if (currentWorkout.length === 0) return;
@@ -147,8 +175,8 @@ document.addEventListener('DOMContentLoaded', () => {
         
         try {
             const response = await fetch(COMPLETE_WORKOUT_API_PATH, {
-                method: 'POST', headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ userId: currentUser.id, workout: currentWorkout }),
+                method: 'POST', headers: { 'Content-Type': 'application/json', ...AUTH_HEADERS },
+                body: JSON.stringify({ workout: currentWorkout }),
             });
             if (!response.ok) throw new Error('Failed to save workout progress.');
             const result = await response.json();
@@ -158,16 +186,19 @@ document.addEventListener('DOMContentLoaded', () => {
 
             loadUserStats(); // Fetch latest stats to update the HUD
 
+            const rewards = await waitForRewards(result.event_id);
+            if (rewards && rewards.bonus_xp > 0) loadUserStats(); // quest XP was added after the first update
+
             // --- NEW: Display notifications for quests and badges ---
             let notificationDelay = 500; // Start with a small delay
-            if (result.newly_completed_quests && result.newly_completed_quests.length > 0) {
-                result.newly_completed_quests.forEach(quest => {
+            if (rewards && rewards.newly_completed_quests.length > 0) {
+                rewards.newly_completed_quests.forEach(quest => {
                     setTimeout(() => showRewardNotification(`Quest Complete: ${quest.title}`, 'quest'), notificationDelay);
                     notificationDelay += 1000; // Stagger notifications
                 });
             }
-            if (result.newly_earned_badges && result.newly_earned_badges.length > 0) {
-                result.newly_earned_badges.forEach(badge => {
+            if (rewards && rewards.newly_earned_badges.length > 0) {
+                rewards.newly_earned_badges.forEach(badge => {
                     setTimeout(() => showRewardNotification(`Badge Unlocked: ${badge.name}`, 'badge'), notificationDelay);
                     notificationDelay += 1000;
                 });
@@ -3,10 +3,12 @@ document.addEventListener('DOMContentLoaded', () => {
 
     // --- User Authentication ---
     const currentUser = JSON.parse(localStorage.getItem('currentUser'));
-    if (!currentUser) {
+    if (!currentUser || !currentUser.token) {
         window.location.href = 'login.html';
         return;
     }
+    // Every API call sends the session token issued at login.
+    const AUTH_HEADERS = { 'Authorization': `Bearer ${currentUser.token}` };
 
     // --- Element Selectors ---
     const addFriendForm = document.getElementById('add-friend-form');
@@ -18,7 +20,9 @@ document.addEventListener('DOMContentLoaded', () => {
 
     // --- API Path Configuration ---
     const FRIENDS_API_BASE = `/api/user/${currentUser.id}/friends`;
-    const LEADERBOARD_API_PATH = `/api/leaderboard`; // A friend-only version would be more complex
+    const LEADERBOARD_API_PATH = `/api/user/${currentUser.id}/leaderboard`; // You and your friends, ranked by weekly XP
+    // Server-sent events with the same data, pushed whenever it changes. EventSource cannot send headers, so the token goes in the URL.
+    const STREAM_API_PATH = `/api/user/${currentUser.id}/stream?token=${encodeURIComponent(currentUser.token)}`;
 
 
     // --- UI Rendering Functions ---
@@ -74,12 +78,11 @@ document.addEventListener('DOMContentLoaded', () => {
             leaderboardList.innerHTML = '<p>Leaderboard data is currently unavailable.</p>';
             return;
         }
-        // For now, this is a global leaderboard. A friend-only one would be filtered here.
-        leaderboard.forEach((entry, index) => {
+        leaderboard.forEach(entry => {
             const item = document.createElement('li');
             item.className = `leaderboard-item ${entry.id === currentUser.id ? 'current-user' : ''}`;
             item.innerHTML = `
-                <span class="rank">${index + 1}</span>
+                <span class="rank">${entry.rank}</span>
                 <span class="name">${entry.username}</span>
                 <span class="xp">${entry.weekly_xp} XP</span>
             `;
@@ -96,8 +99,8 @@ document.addEventListener('DOMContentLoaded', () => {
     const loadPageData = async () => {
         try {
             const [friendsResponse, leaderboardResponse] = await Promise.all([
-                fetch(FRIENDS_API_BASE),
-                fetch(LEADERBOARD_API_PATH)
+                fetch(FRIENDS_API_BASE, { headers: AUTH_HEADERS }),
+                fetch(LEADERBOARD_API_PATH, { headers: AUTH_HEADERS })
             ]);
 
             if (!friendsResponse.ok) throw new Error('Failed to load friends data.');
@@ -108,13 +111,31 @@ document.addEventListener('DOMContentLoaded', () => {
 
             renderPendingRequests(friendsData.pending_requests);
             renderFriendsList(friendsData.friends);
-            renderLeaderboard(leaderboardData);
+            renderLeaderboard(leaderboardData.entries);
         } catch (error) {
             console.error('Error:', error);
             friendsListContainer.innerHTML = '<p class="error-message">Could not load friend data.</p>';
         }
     };
 
+    /**
+     * Subscribes to live friend activity: the friends list, pending requests and the leaderboard
+     * arrive on connect and again whenever they change, so the page never needs reloading.
+     */
+    const connectStream = () => {
+        const source = new EventSource(STREAM_API_PATH);
+        source.addEventListener('friends', (event) => {
+            const friendsData = JSON.parse(event.data);
+            renderPendingRequests(friendsData.pending_requests);
+            renderFriendsList(friendsData.friends);
+        });
+        source.addEventListener('leaderboard', (event) => renderLeaderboard(JSON.parse(event.data).entries));
+        source.onerror = () => {
+            // The browser reconnects by itself; a closed stream means the server turned us away (e.g. expired session).
+            if (source.readyState === EventSource.CLOSED) loadPageData();
+        };
+    };
+
     /**
      * Sends a new friend request to the server.
      */
@@ -122,7 +143,7 @@ document.addEventListener('DOMContentLoaded', () => {
         try {
             const response = await fetch(`${FRIENDS_API_BASE}/request`, {
                 method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
+                headers: { 'Content-Type': 'application/json', ...AUTH_HEADERS },
                 body: JSON.stringify({ username_to_add: username })
             });
             const data = await response.json();
@@ -146,12 +167,12 @@ document.addEventListener('DOMContentLoaded', () => {
         try {
             const response = await fetch(`${FRIENDS_API_BASE}/respond`, {
                 method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
+                headers: { 'Content-Type': 'application/json', ...AUTH_HEADERS },
                 body: JSON.stringify({ requester_id: parseInt(requesterId), action: action })
             });
 
             if (response.ok) {
-                loadPageData(); // Refresh the entire friends list and pending requests
+                if (!window.EventSource) loadPageData(); // Otherwise the stream delivers the updated lists
             } else {
                 const data = await response.json();
                 alert(`Error: ${data.message}`);
@@ -186,5 +207,6 @@ document.addEventListener('DOMContentLoaded', () => {
 
 
     // --- Initial Page Load ---
-    loadPageData();
+    if (window.EventSource) connectStream();
+    else loadPageData();
 });
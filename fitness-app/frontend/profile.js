@@ -3,10 +3,12 @@ document.addEventListener('DOMContentLoaded', () => {
 
     // --- User Authentication ---
     const currentUser = JSON.parse(localStorage.getItem('currentUser'));
-    if (!currentUser) {
+    if (!currentUser || !currentUser.token) {
         window.location.href = 'login.html';
         return; // Stop script execution if no user is logged in
     }
+    // Every API call sends the session token issued at login.
+    const AUTH_HEADERS = { 'Authorization': `Bearer ${currentUser.token}` };
 
     // --- Element Selectors ---
     const usernameDisplay = document.getElementById('username-display');
@@ -16,12 +18,19 @@ document.addEventListener('DOMContentLoaded', () => {
     const xpText = document.getElementById('xp-text');
     const badgesGrid = document.getElementById('badges-grid');
     const workoutHistoryList = document.getElementById('workout-history-list');
+    const loadMoreHistoryBtn = document.getElementById('load-more-history-btn');
+    const weeklyXpList = document.getElementById('weekly-xp-list');
+    const muscleTotalsList = document.getElementById('muscle-totals-list');
 
     // --- API Path Configuration (for new endpoints we will create in app.py) ---
     // This single endpoint will fetch all extended stats for the logged-in user.
     const USER_STATS_API_PATH = `/api/user/${currentUser.id}/stats`; 
-    // This endpoint will fetch the user's workout log.
+    // This endpoint returns the user's workout log one page at a time, newest first.
     const WORKOUT_HISTORY_API_PATH = `/api/user/${currentUser.id}/history`;
+    // Weekly XP and muscle-group totals, so the page never needs the raw log.
+    const HISTORY_SUMMARY_API_PATH = `/api/user/${currentUser.id}/history/summary`;
+    const HISTORY_PAGE_SIZE = 10;
+    let nextHistoryCursor = null;
 
 
     // --- UI Rendering Functions ---
@@ -43,6 +52,22 @@ document.addEventListener('DOMContentLoaded', () => {
         xpText.textContent = `${stats.xp} / ${xpForNextLevel} XP`;
     };
 
+    /**
+     * Shows one cell of the badge sprite sheet, so every badge on the page comes from a single image.
+     * @param {HTMLElement} element - The element to paint the badge into.
+     * @param {object} sprite - The badge's `sprite` from the API: sheet URLs, grid size and cell index.
+     */
+    const applySprite = (element, sprite) => {
+        const column = sprite.index % sprite.columns;
+        const row = Math.floor(sprite.index / sprite.columns);
+        const percent = (cell, cells) => (cells > 1 ? (cell / (cells - 1)) * 100 : 0);
+        element.style.backgroundImage = `url("${sprite.png}")`;
+        // Browsers that understand image-set() pick the smaller WebP sheet; the rest keep the PNG.
+        element.style.backgroundImage = `image-set(url("${sprite.webp}") type("image/webp"), url("${sprite.png}") type("image/png"))`;
+        element.style.backgroundSize = `${sprite.columns * 100}% ${sprite.rows * 100}%`;
+        element.style.backgroundPosition = `${percent(column, sprite.columns)}% ${percent(row, sprite.rows)}%`;
+    };
+
     /**
      * Renders the grid of unlocked badges.
      * @param {Array} badges - An array of badge objects the user has unlocked.
@@ -61,26 +86,27 @@ document.addEventListener('DOMContentLoaded', () => {
             badgeElement.title = badge.description; 
             
             badgeElement.innerHTML = `
-                <img src="${badge.image_url}" alt="${badge.name}">
+                ${badge.sprite ? `<span class="badge-icon" role="img" aria-label="${badge.name}"></span>` : `<img src="${badge.image_url}" alt="${badge.name}">`}
                 <p class="badge-name">${badge.name}</p>
             `;
+            if (badge.sprite) applySprite(badgeElement.querySelector('.badge-icon'), badge.sprite);
             badgesGrid.appendChild(badgeElement);
         });
     };
 
     /**
-     * Renders the list of recently completed workouts.
-     * @param {Array} history - An array of workout log objects.
+     * Appends one page of completed workouts (newest first) to the activity list.
+     * @param {Array} entries - Workout log objects from the history API.
+     * @param {boolean} firstPage - Whether to replace the placeholder text.
      */
-    const renderHistory = (history) => {
-        workoutHistoryList.innerHTML = ''; // Clear placeholder
-        if (!history || history.length === 0) {
+    const renderHistory = (entries, firstPage) => {
+        if (firstPage) workoutHistoryList.innerHTML = ''; // Clear placeholder
+        if (firstPage && entries.length === 0) {
             workoutHistoryList.innerHTML = '<li>No workouts completed yet. Let\'s get started!</li>';
             return;
         }
 
-        // Show the most recent workouts first
-        history.reverse().slice(0, 10).forEach(log => { // Show max 10 recent
+        entries.forEach(log => {
             const listItem = document.createElement('li');
             // Format the date to be more readable
             const workoutDate = new Date(log.date).toLocaleDateString('en-US', {
@@ -93,6 +119,46 @@ document.addEventListener('DOMContentLoaded', () => {
         });
     };
 
+    /**
+     * Renders per-week XP and per-muscle-group workout counts.
+     * @param {object} summary - The history summary object from the API.
+     */
+    const renderSummary = (summary) => {
+        weeklyXpList.innerHTML = '';
+        summary.weekly_xp.forEach(week => {
+            const listItem = document.createElement('li');
+            const weekDate = new Date(`${week.week_start}T00:00:00Z`).toLocaleDateString('en-US', { month: 'short', day: 'numeric' });
+            listItem.innerHTML = `Week of ${weekDate} <span>${week.xp} XP</span>`;
+            weeklyXpList.appendChild(listItem);
+        });
+
+        muscleTotalsList.innerHTML = '';
+        const groups = Object.entries(summary.muscle_groups).sort((a, b) => b[1] - a[1]);
+        if (groups.length === 0) {
+            muscleTotalsList.innerHTML = '<li>No workouts completed yet.</li>';
+            return;
+        }
+        groups.forEach(([group, count]) => {
+            const listItem = document.createElement('li');
+            listItem.innerHTML = `${group} <span>${count} workouts</span>`;
+            muscleTotalsList.appendChild(listItem);
+        });
+    };
+
+    /**
+     * Fetches the next page of workout history and shows the "Load More" button while more remain.
+     */
+    const loadHistoryPage = async () => {
+        const firstPage = nextHistoryCursor === null;
+        const cursor = firstPage ? '' : `&before=${nextHistoryCursor}`;
+        const response = await fetch(`${WORKOUT_HISTORY_API_PATH}?limit=${HISTORY_PAGE_SIZE}${cursor}`, { headers: AUTH_HEADERS });
+        if (!response.ok) throw new Error('Failed to load workout history.');
+        const page = await response.json();
+        renderHistory(page.entries, firstPage);
+        nextHistoryCursor = page.next_before;
+        loadMoreHistoryBtn.style.display = nextHistoryCursor === null ? 'none' : 'block';
+    };
+
 
     // --- Main Data Fetching Function ---
 
@@ -101,25 +167,25 @@ document.addEventListener('DOMContentLoaded', () => {
      */
     const loadProfileData = async () => {
         try {
-            // Fetch stats and history concurrently for faster loading
-            const [statsResponse, historyResponse] = await Promise.all([
-                fetch(USER_STATS_API_PATH),
-                fetch(WORKOUT_HISTORY_API_PATH)
+            // Fetch stats, the summary and the first history page concurrently for faster loading
+            const [statsResponse, summaryResponse] = await Promise.all([
+                fetch(USER_STATS_API_PATH, { headers: AUTH_HEADERS }),
+                fetch(HISTORY_SUMMARY_API_PATH, { headers: AUTH_HEADERS }),
+                loadHistoryPage()
             ]);
 
             if (!statsResponse.ok) throw new Error('Failed to load user stats.');
-            if (!historyResponse.ok) throw new Error('Failed to load workout history.');
+            if (!summaryResponse.ok) throw new Error('Failed to load training summary.');
 
             const stats = await statsResponse.json();
-            const history = await historyResponse.json();
             
             // Call the rendering functions with the fetched data
             renderStats(stats);
 
             // The 'unlocked_badges' will be part of the main stats object
             renderBadges(stats.unlocked_badges); 
-            
-            renderHistory(history);
+
+            renderSummary(await summaryResponse.json());
 
         } catch (error) {
             console.error('Error loading profile data:', error);
@@ -131,6 +197,9 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     };
 
-    // --- Initial Page Load ---
+    // --- Event Listeners & Initial Page Load ---
+    loadMoreHistoryBtn.addEventListener('click', () => {
+        loadHistoryPage().catch(error => console.error('Error loading workout history:', error));
+    });
     loadProfileData();
 });
@@ -3,10 +3,12 @@ document.addEventListener('DOMContentLoaded', () => {
 
     // --- User Authentication ---
     const currentUser = JSON.parse(localStorage.getItem('currentUser'));
-    if (!currentUser) {
+    if (!currentUser || !currentUser.token) {
         window.location.href = 'login.html';
         return; // Stop script execution if no user is logged in
     }
+    // Every API call sends the session token issued at login.
+    const AUTH_HEADERS = { 'Authorization': `Bearer ${currentUser.token}` };
 
     // --- Element Selectors ---
     const dailyQuestsContainer = document.getElementById('daily-quests-container');
@@ -63,7 +65,7 @@ document.addEventListener('DOMContentLoaded', () => {
      */
     const loadQuests = async () => {
         try {
-            const response = await fetch(QUESTS_API_PATH);
+            const response = await fetch(QUESTS_API_PATH, { headers: AUTH_HEADERS });
 
             if (!response.ok) {
                 throw new Error('Failed to load quest data.');